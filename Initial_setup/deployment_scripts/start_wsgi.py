@@ -19,6 +19,7 @@ WSGI服务器启动脚本，使用Waitress作为WSGI服务器
 
 import os
 import sys
+import signal
 import logging
 from pathlib import Path
 from waitress import serve
@@ -45,6 +46,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def install_shutdown_handlers():
+    """服务管理器以 SIGTERM（Windows 下为 Ctrl-Break）停止服务时默认处理不会执行 atexit，
+    这里先排空日志缓冲再退出，缓冲中的操作日志不会丢失"""
+    from clamps.log_buffer import drain_log_buffer
+
+    def shutdown(signum, frame):
+        logger.info(f"收到终止信号 {signum}，正在写入缓冲的操作日志...")
+        try:
+            drain_log_buffer()
+        except Exception as e:
+            logger.error(f"写入缓冲的操作日志失败: {e}")
+        sys.exit(0)
+
+    for name in ('SIGTERM', 'SIGBREAK'):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, shutdown)
+
 def main():
     """启动WSGI服务器"""
     try:
@@ -53,6 +72,18 @@ def main():
         application = get_wsgi_application()
         
         logger.info("WSGI应用初始化成功")
+
+        # 启动压缩任务调度器，恢复上次中断的压缩任务
+        from clamps.compression_scheduler import get_scheduler
+        get_scheduler().start()
+        logger.info("压缩任务调度器已启动")
+        
+        # 启动压缩文件定时清理
+        from clamps import archive_retention
+        archive_retention.start()
+        
+        # 收到终止信号时先写入缓冲的操作日志
+        install_shutdown_handlers()
         logger.info("正在启动Waitress服务器...")
         
         # 启动Waitress服务器
@@ -41,3 +41,9 @@ class ClampsConfig(AppConfig):
             from .backup import start_scheduler
             scheduler_thread = threading.Thread(target=start_scheduler, daemon=True)
             scheduler_thread.start()
+            # 启动压缩任务调度器，恢复上次中断的压缩任务
+            from .compression_scheduler import get_scheduler
+            threading.Thread(target=get_scheduler().start, daemon=True).start()
+            # 启动压缩文件定时清理
+            from . import archive_retention
+            archive_retention.start()
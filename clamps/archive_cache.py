@@ -0,0 +1,159 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+压缩包缓存
+异步压缩生成的压缩包按内容寻址缓存：键由排序后的产品ID、文件类型、各源文件的元数据
+（大小、修改时间、内容哈希，取自媒体文件索引，请求线程中不访问文件系统）和水印身份组成。
+后台压缩任务计算键之前先按文件系统实时状态校正这些文件的索引条目，增量同步漏掉的原地覆盖
+在下一次压缩含有该文件的任务时得到更正；在此之前命中的仍是旧的压缩包，可以用全量同步立即更正。PDF 带有下载用户的水印，水印身份为用户名；
+STEP、BMP 压缩包没有水印，所有用户共用同一份缓存。
+相同请求再次提交时直接使用缓存的压缩包，不再重新压缩。
+缓存文件以硬链接方式提供给任务，任务文件被清理不影响缓存；缓存总大小超过上限时按最近使用时间淘汰。
+水印中的时间为压缩包生成时间。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+
+from .media_index import get_file_stats, product_file_paths
+
+logger = logging.getLogger(__name__)
+
+# 缓存键格式版本，压缩包内容的生成方式变化时递增
+CACHE_VERSION = 3
+
+# 带水印的文件类型
+WATERMARKED_TYPES = ('pdf', 'both')
+
+_evict_lock = threading.Lock()
+
+
+def get_config():
+    """获取压缩包缓存配置"""
+    config = {
+        'enabled': True,
+        'max_bytes': 2 * 1024 ** 3,
+        'directory': os.path.join(settings.BASE_DIR, 'temp', 'archive_cache'),
+    }
+    config.update(getattr(settings, 'ARCHIVE_CACHE', {}))
+    return config
+
+
+def archive_key(products, file_type, username):
+    """计算压缩包缓存键"""
+    products = sorted(products, key=lambda product: product.id)
+    paths = product_file_paths(products, file_type)
+    stats = get_file_stats(paths)
+    watermark = ''
+    if file_type in WATERMARKED_TYPES:
+        mode = getattr(settings, 'PDF_WATERMARK_MODE', '')
+        watermark = f'{username}|{mode}'
+    payload = json.dumps([
+        CACHE_VERSION,
+        [product.id for product in products],
+        file_type,
+        [[str(path), list(stats[path]) if stats.get(path) else None] for path in paths],
+        watermark,
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _entry_path(key, directory=None):
+    return os.path.join(directory or get_config()['directory'], f'{key}.zip')
+
+
+def _link_or_copy(source, dest):
+    """硬链接文件，文件系统不支持时复制"""
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+def fetch(key, dest_path):
+    """缓存命中时把压缩包放到 dest_path 并返回 True"""
+    config = get_config()
+    if not config['enabled']:
+        return False
+    entry = _entry_path(key, config['directory'])
+    try:
+        _link_or_copy(entry, dest_path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f'读取压缩包缓存失败: {e}')
+        return False
+    try:
+        # 记录最近使用时间，按修改时间淘汰
+        os.utime(entry)
+    except OSError:
+        pass
+    return True
+
+
+def store(key, source_path):
+    """把生成的压缩包加入缓存，并按大小上限淘汰最久未使用的缓存"""
+    config = get_config()
+    if not config['enabled']:
+        return
+    directory = config['directory']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # 先链接到临时文件名再改名，读取方不会看到不完整的文件
+        tmp_path = os.path.join(directory, f'.{key}.{uuid.uuid4().hex}.tmp')
+        _link_or_copy(source_path, tmp_path)
+        os.replace(tmp_path, _entry_path(key, directory))
+    except OSError as e:
+        logger.warning(f'写入压缩包缓存失败: {e}')
+        return
+    evict(config['max_bytes'], directory)
+
+
+def evict(max_bytes=None, directory=None):
+    """缓存总大小超过上限时删除最久未使用的压缩包，返回删除的文件数"""
+    config = get_config()
+    max_bytes = config['max_bytes'] if max_bytes is None else max_bytes
+    directory = directory or config['directory']
+    with _evict_lock:
+        entries = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith('.zip'):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                logger.warning(f'删除压缩包缓存失败: {path} - {e}')
+        if removed:
+            logger.info(f'压缩包缓存淘汰 {removed} 个文件，剩余 {total / 1024 / 1024:.2f} MB')
+        return removed
@@ -0,0 +1,205 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+压缩文件保留管理
+异步压缩生成的文件（temp/compressed_files）按磁盘预算保留：文件的修改时间记录最近访问时间
+（生成和每次下载时更新），超过最长保留时间的文件删除；总大小超过预算时按最近访问时间从旧到新删除，
+最近访问不足最短保留时间的文件不删除，刚生成、尚未下载的压缩包不会被清理。
+压缩文件大多是压缩包缓存的硬链接，多个任务可能共用同一份数据：总大小按 (设备, inode) 去重统计，
+删除目录中某份数据的最后一个链接时总大小才减少，数据没有其他链接（包括缓存）时才计为释放的空间。
+超过最短保留时间未再写入的未完成文件（.part，进程中断时遗留）一并删除。
+文件已不存在的已完成任务和已失败的任务删除任务记录，等待和执行中的任务不受影响。
+服务启动时在后台线程中每隔 interval 秒执行一次。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CompressionStatus, CompressionTask
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    """获取压缩文件保留配置"""
+    config = {
+        'max_bytes': 5 * 1024 ** 3,
+        'min_ttl': 3600,
+        'max_age': 7 * 24 * 3600,
+        'interval': 300,
+        'directory': os.path.join(settings.BASE_DIR, 'temp', 'compressed_files'),
+    }
+    config.update(getattr(settings, 'ARCHIVE_RETENTION', {}))
+    return config
+
+
+def touch(file_path):
+    """记录压缩文件的访问时间（下载时调用）"""
+    try:
+        os.utime(file_path)
+    except OSError:
+        pass
+
+
+def _list_files(directory, suffix='.zip'):
+    """压缩文件列表 [(最近访问时间, 字节数, 路径, (设备, inode))]"""
+    files = []
+    try:
+        it = os.scandir(directory)
+    except FileNotFoundError:
+        return files
+    with it:
+        for entry in it:
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                # 使用 os.stat 而不是 entry.stat()：Windows 下后者不提供 inode
+                st = os.stat(entry.path)
+            except FileNotFoundError:
+                # 列出目录后文件被任务或下载清理删除
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path, (st.st_dev, st.st_ino)))
+    return files
+
+
+def _disk_usage(files):
+    """按 (设备, inode) 去重后的总字节数，硬链接共用的数据只计一次"""
+    return sum(dict((inode, size) for _, size, _, inode in files).values())
+
+
+def _remove(path):
+    """删除文件，返回释放的字节数；还有其他硬链接时数据仍在磁盘上，释放 0 字节；删除失败时返回 None"""
+    try:
+        st = os.stat(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        # 文件正在被下载等情况，下次再清理
+        logger.warning(f'删除压缩文件失败: {path} - {e}')
+        return None
+    return st.st_size if st.st_nlink <= 1 else 0
+
+
+def _delete_orphan_tasks(min_ttl):
+    """删除文件已不存在的已完成任务，以及已失败的任务（均需超过最短保留时间）"""
+    cutoff = timezone.now() - timedelta(seconds=min_ttl)
+    base_dir = str(settings.BASE_DIR)
+    tasks = CompressionTask.objects.filter(
+        Q(status=CompressionStatus.COMPLETED.value) | Q(status=CompressionStatus.FAILED.value),
+        updated_at__lt=cutoff,
+    ).values_list('task_id', 'compressed_file_path')
+    orphan_ids = [
+        task_id for task_id, file_path in tasks.iterator()
+        if not file_path or not os.path.exists(os.path.join(base_dir, file_path))
+    ]
+    deleted = 0
+    for i in range(0, len(orphan_ids), 500):
+        deleted += CompressionTask.objects.filter(task_id__in=orphan_ids[i:i + 500]).delete()[0]
+    return deleted
+
+
+def enforce_retention():
+    """按保留时间和磁盘预算清理压缩文件，并删除文件已不存在的任务记录。
+    返回 (删除文件数, 释放字节数, 删除任务数)"""
+    config = get_config()
+    now = time.time()
+    files = sorted(_list_files(config['directory']))
+    total = _disk_usage(files)
+    # 目录中每份数据剩余的链接数，最后一个链接删除后才从总大小中扣除
+    links = Counter(inode for _, _, _, inode in files)
+    removed = 0
+    freed = 0
+
+    def unlink(size, path, inode):
+        nonlocal removed, freed, total
+        released = _remove(path)
+        if released is None:
+            return False
+        removed += 1
+        freed += released
+        links[inode] -= 1
+        if not links[inode]:
+            total -= size
+        return True
+
+    kept = []
+    # 1. 超过最长保留时间的文件
+    for accessed, size, path, inode in files:
+        if not (config['max_age'] and now - accessed > config['max_age'] and unlink(size, path, inode)):
+            kept.append((accessed, size, path, inode))
+
+    # 2. 超出磁盘预算时按最近访问时间从旧到新删除，最近访问不足最短保留时间的文件保留
+    for accessed, size, path, inode in kept:
+        if total <= config['max_bytes']:
+            break
+        if now - accessed < config['min_ttl']:
+            break
+        unlink(size, path, inode)
+    if total > config['max_bytes']:
+        logger.warning(f'压缩文件总大小 {total / 1024 / 1024:.2f} MB 超出预算，剩余文件均在最短保留时间内')
+
+    # 3. 进程中断时遗留的未完成压缩文件（.part），正在写入的文件修改时间不断更新，不会被删除
+    for written, size, path, inode in _list_files(config['directory'], '.part'):
+        if now - written > config['min_ttl']:
+            released = _remove(path)
+            if released is not None:
+                removed += 1
+                freed += released
+
+    # 4. 文件已不存在的任务记录
+    deleted_tasks = _delete_orphan_tasks(config['min_ttl'])
+
+    if removed or deleted_tasks:
+        logger.info(f'压缩文件清理完成: 删除 {removed} 个文件，释放 {freed / 1024 / 1024:.2f} MB，'
+                    f'删除 {deleted_tasks} 个任务记录，当前 {total / 1024 / 1024:.2f} MB')
+    return removed, freed, deleted_tasks
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _run(interval):
+    while True:
+        try:
+            enforce_retention()
+        except Exception as e:
+            logger.error(f'清理压缩文件失败: {e}')
+        finally:
+            connection.close()
+        time.sleep(interval)
+
+
+def start():
+    """启动定时清理线程（服务启动时调用）"""
+    global _thread
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        interval = max(1, int(get_config()['interval']))
+        _thread = threading.Thread(target=_run, args=(interval,), name='archive-retention', daemon=True)
+        _thread.start()
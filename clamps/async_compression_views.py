@@ -21,13 +21,18 @@ from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
 from .models import Product, CompressionTask, UserProfile
 from .pdf_utils import PDFProcessor
+from .log_buffer import log_action
+from .media_index import get_product_file_sizes
+from .compression_scheduler import get_scheduler
+from . import archive_cache, archive_retention
+from .progress import get_progress
 
 
 @login_required
@@ -52,24 +57,41 @@ def start_compression(request):
                 'message': '未选择任何产品或文件类型。'
             })
         
-        # 创建压缩任务
+        products = list(Product.objects.filter(id__in=product_ids))
+        
+        # 相同请求的压缩包已缓存时直接完成任务，不再排队压缩
+        from .tasks import complete_compression_task, compressed_file_destination
+        cache_key = archive_cache.archive_key(products, file_type, request.user.username)
+        task = CompressionTask(product_ids=product_ids_str, file_type=file_type, user_id=request.user.id)
+        dest_path, relative_path = compressed_file_destination(task.task_id)
+        if archive_cache.fetch(cache_key, dest_path):
+            task.started_at = timezone.now()
+            complete_compression_task(task, relative_path)
+            return JsonResponse({
+                'success': True,
+                'task_id': str(task.task_id),
+                'message': '压缩任务已完成'
+            })
+        
+        # 待压缩文件总大小，调度时小任务优先
+        file_sizes = get_product_file_sizes(products, file_type)
+        total_bytes = sum(size for size in file_sizes.values() if size)
+        
+        # 创建压缩任务，由调度器的工作线程排队执行
         task = CompressionTask.objects.create(
             product_ids=product_ids_str,
             file_type=file_type,
             status='pending',
             progress=0,
-            user_id=request.user.id
+            user_id=request.user.id,
+            total_bytes=total_bytes
         )
-        
-        # 启动异步压缩处理
-        from .tasks import process_compression_task
-        import threading
-        threading.Thread(target=process_compression_task, args=(task.task_id,), daemon=True).start()
+        get_scheduler().notify()
         
         return JsonResponse({
             'success': True,
             'task_id': str(task.task_id),
-            'message': '压缩任务已开始'
+            'message': '压缩任务已提交'
         })
     
     return JsonResponse({
@@ -88,6 +110,18 @@ def check_compression_progress(request):
             'message': '缺少任务ID'
         })
     
+    # 执行中和已结束的任务从缓存读取进度，不访问数据库；排队中的任务需要计算排队位置
+    cached = get_progress(task_id)
+    if cached and cached['status'] != 'pending':
+        return JsonResponse({
+            'success': True,
+            'progress': cached['progress'],
+            'status': cached['status'],
+            'is_completed': cached['status'] == 'completed',
+            'error_message': cached['error_message'],
+            'queue_position': None
+        })
+    
     try:
         task = CompressionTask.objects.get(task_id=task_id)
         return JsonResponse({
@@ -95,7 +129,9 @@ def check_compression_progress(request):
             'progress': task.progress,
             'status': task.status,
             'is_completed': task.status == 'completed',
-            'error_message': task.error_message
+            'error_message': task.error_message,
+            # 排队中的任务前面还有多少个任务
+            'queue_position': get_scheduler().queue_position(task)
         })
     except CompressionTask.DoesNotExist:
         return JsonResponse({
@@ -109,6 +145,16 @@ def check_compression_progress(request):
         })
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff or u.is_superuser)
+def compression_queue_stats(request):
+    """压缩任务队列统计：排队深度、执行中任务数和等待时间"""
+    return JsonResponse({
+        'success': True,
+        'stats': get_scheduler().get_stats()
+    })
+
+
 @login_required
 def download_compressed_file(request):
     """下载压缩文件"""
@@ -150,6 +196,8 @@ def download_compressed_file(request):
             # 读取文件内容
             with open(full_file_path, 'rb') as f:
                 file_content = f.read()
+            # 记录访问时间，按最近访问时间保留
+            archive_retention.touch(full_file_path)
             
             # 设置响应头
             response = HttpResponse(file_content, content_type='application/zip')
@@ -183,12 +231,12 @@ def download_compressed_file(request):
                 zip_filename = zip_filename[:-4] + '.zip'
             
             # 计算文件大小（必须在使用前定义）
-            file_size_mb = os.path.getsize(full_file_path) / (1024 * 1024)
+            file_size_bytes = os.path.getsize(full_file_path)
+            file_size_mb = file_size_bytes / (1024 * 1024)
             
             response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
             
             # 记录下载日志，使用与profile视图兼容的格式
-            from .models import Log
             # 判断是单个下载还是批量下载
             is_single_download = len(task.product_ids.split(',')) == 1
             action_type = 'single_download' if is_single_download else 'batch_download'
@@ -206,13 +254,10 @@ def download_compressed_file(request):
                 drawing_nos_str = ', '.join(drawing_nos)
                 details = f'Drawing Nos: {drawing_nos_str}, File Type: {task.file_type}, Total Size: {file_size_mb:.2f} MB, Async Task ID: {task_id}'
             
-            Log.objects.create(
-                user=request.user,
-                action_type=action_type,
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                details=details
-            )
+            product_id_list = [pid.strip() for pid in task.product_ids.split(',') if pid.strip().isdigit()]
+            log_action(request, action_type, details=details, file_type=task.file_type, size_bytes=file_size_bytes,
+                       file_count=len(product_id_list) * (2 if task.file_type == 'both' else 1),
+                       product_ids=','.join(product_id_list))
             
             # 记录下载统计
             user_profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -297,6 +342,8 @@ def check_batch_file_size(request):
             })
 
         products = Product.objects.filter(id__in=product_ids)
+        # 一次查询媒体文件索引取得全部文件大小，None 表示文件不存在
+        file_sizes = get_product_file_sizes(products, file_type)
         total_size_mb = 0
         missing_files = []
 
@@ -311,9 +358,8 @@ def check_batch_file_size(request):
             elif file_type == 'both':
                 # 对于'both'类型，检查PDF和STEP文件大小
                 if product.pdf_file_path:
-                    full_pdf_path = os.path.join(settings.MEDIA_ROOT, str(product.pdf_file_path).replace('media/', ''))
-                    if os.path.exists(full_pdf_path):
-                        total_size_mb += os.path.getsize(full_pdf_path) / (1024 * 1024)
+                    if file_sizes.get(product.pdf_file_path) is not None:
+                        total_size_mb += file_sizes[product.pdf_file_path] / (1024 * 1024)
                     else:
                         # PDF文件不存在时，显示产品图号
                         if is_english:
@@ -321,9 +367,8 @@ def check_batch_file_size(request):
                         else:
                             missing_files.append(f"产品 {product.drawing_no_1} PDF文件不存在")
                 if product.step_file_path:
-                    full_step_path = os.path.join(settings.MEDIA_ROOT, str(product.step_file_path).replace('media/', ''))
-                    if os.path.exists(full_step_path):
-                        total_size_mb += os.path.getsize(full_step_path) / (1024 * 1024)
+                    if file_sizes.get(product.step_file_path) is not None:
+                        total_size_mb += file_sizes[product.step_file_path] / (1024 * 1024)
                     else:
                         # STEP文件不存在时，显示产品图号
                         if is_english:
@@ -333,16 +378,8 @@ def check_batch_file_size(request):
                 continue # 跳过下面的通用文件处理逻辑
             
             if file_path:
-                relative_path = str(file_path)
-                if relative_path.startswith('media/'):
-                    relative_path = relative_path[len('media/'):]
-                elif relative_path.startswith('/media/'):
-                    relative_path = relative_path[len('/media/'):]
-                
-                full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-                
-                if os.path.exists(full_file_path):
-                    file_size_bytes = os.path.getsize(full_file_path)
+                file_size_bytes = file_sizes.get(file_path)
+                if file_size_bytes is not None:
                     total_size_mb += file_size_bytes / (1024 * 1024)
                 else:
                     # 当file_path存在但文件不存在时，显示产品图号
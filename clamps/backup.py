@@ -35,7 +35,6 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 import django
 from django.conf import settings
 from django.utils import timezone
-from clamps.models import CompressionTask
 
 # 只在非Django启动环境下执行setup
 def initialize_django():
@@ -62,11 +61,6 @@ DB_FILE = BASE_DIR / 'db.sqlite3'
 RETENTION_DAYS = 30
 BACKUP_TIME = "00:01"
 
-# 临时文件配置
-TEMP_DIR = BASE_DIR / 'temp'
-COMPRESSED_FILES_DIR = TEMP_DIR / 'compressed_files'
-COMPRESSED_RETENTION_DAYS = 7
-
 
 def create_backup():
     """创建备份"""
@@ -95,10 +89,9 @@ def create_backup():
 
 
 def daily_task():
-    """每日任务：备份数据库和清理临时文件"""
+    """每日任务：备份数据库（压缩文件由 archive_retention 按磁盘预算定时清理）"""
     logger.info("开始执行每日任务")
     create_backup()
-    cleanup_compressed_files()
     logger.info("每日任务执行完成")
 
 
@@ -124,46 +117,6 @@ def cleanup_old_backups():
         logger.error(f"清理旧备份失败: {str(e)}")
 
 
-def cleanup_compressed_files():
-    """直接清空压缩文件目录"""
-    try:
-        logger.info("开始清空压缩文件目录")
-        
-        # 确保temp目录存在
-        os.makedirs(TEMP_DIR, exist_ok=True)
-        
-        # 确保compressed_files目录存在
-        os.makedirs(COMPRESSED_FILES_DIR, exist_ok=True)
-        
-        file_count = 0
-        total_size = 0
-        
-        # 直接清空compressed_files目录
-        for file in os.listdir(COMPRESSED_FILES_DIR):
-            file_path = COMPRESSED_FILES_DIR / file
-            if file_path.is_file():
-                file_size = os.path.getsize(file_path)
-                file_count += 1
-                total_size += file_size
-                
-                try:
-                    os.remove(file_path)
-                    logger.info(f"已删除压缩文件: {file_path} ({file_size / 1024 / 1024:.2f} MB)")
-                except Exception as e:
-                    logger.error(f"删除压缩文件失败: {file_path} - {str(e)}")
-        
-        # 删除所有压缩任务记录
-        task_count = CompressionTask.objects.count()
-        if task_count > 0:
-            CompressionTask.objects.all().delete()
-            logger.info(f"已删除所有{task_count}个压缩任务记录")
-        
-        logger.info(f"压缩文件目录清空完成: 删除了{file_count}个文件，总大小{total_size / 1024 / 1024:.2f}MB")
-        
-    except Exception as e:
-        logger.error(f"清空压缩文件目录失败: {str(e)}")
-
-
 def run_backup():
     """运行备份，用于手动执行或系统定时任务调用"""
     logger.info("开始执行数据库备份任务")
@@ -0,0 +1,50 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+产品目录版本号
+导入 CSV、文件同步、后台编辑产品时递增，所有依赖产品数据的缓存（搜索结果、
+产品详情、内存索引）都以版本号作为键的一部分，数据变化后自然失效。
+版本号保存在 Django 缓存中，使用共享缓存后端时各进程看到的是同一个版本。
+"""
+
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def _seed_version():
+    # 以毫秒时间戳作为初始值：缓存被清空后重新播种的版本号不会与旧版本重复
+    cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def get_catalog_version():
+    """获取当前产品目录版本号"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        _seed_version()
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """产品数据变化后调用，递增版本号并返回新版本"""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # 键不存在（首次使用或已被淘汰）
+        _seed_version()
+        return cache.incr(CATALOG_VERSION_KEY)
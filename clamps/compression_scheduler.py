@@ -0,0 +1,252 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+压缩任务调度器
+CompressionTask 表即任务队列：提交任务只写入一行 pending 记录，由固定数量的工作线程领取执行，
+同时压缩的任务数有上限，每个用户同时执行的任务数也有上限。领取时小任务（待压缩字节数少）优先，
+等待超过 max_wait 秒的任务不再让位，避免大任务一直排不上。
+领取任务时记录执行者（主机名:进程号:启动标识），执行期间由心跳线程定期更新 heartbeat_at。
+心跳超过 stale_after 秒未更新的 processing 任务视为执行进程已退出，重置为 pending 重新执行，
+服务重启不会丢失任务；多个进程（如 waitress 与 ASGI 进程、runserver 的自动重载进程）各自运行调度器时，
+不会重置其他进程正在执行的任务。
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import CompressionStatus, CompressionTask
+from .progress import clear_progress
+
+logger = logging.getLogger(__name__)
+
+PENDING = CompressionStatus.PENDING.value
+PROCESSING = CompressionStatus.PROCESSING.value
+
+# 每次领取时参与排序的等待任务数上限
+CANDIDATE_LIMIT = 200
+
+
+def get_config():
+    """获取压缩调度器配置"""
+    config = {
+        'workers': 2,
+        'per_user': 1,
+        'max_wait': 300,
+        'poll_interval': 5.0,
+        'heartbeat_interval': 30,
+        'stale_after': 120,
+    }
+    config.update(getattr(settings, 'COMPRESSION_SCHEDULER', {}))
+    return config
+
+
+class CompressionScheduler:
+    """固定数量的工作线程，从 CompressionTask 表领取 pending 任务执行"""
+
+    def __init__(self, workers=2, per_user=1, max_wait=300, poll_interval=5.0, heartbeat_interval=30, stale_after=120):
+        self.workers = max(1, int(workers))
+        self.per_user = max(1, int(per_user))
+        self.max_wait = float(max_wait)
+        self.poll_interval = float(poll_interval)
+        self.heartbeat_interval = max(1.0, float(heartbeat_interval))
+        # 至少容忍两次心跳间隔，避免数据库繁忙时误判
+        self.stale_after = max(float(stale_after), 2 * self.heartbeat_interval)
+        # 本调度器的执行者标识，进程号可能被复用，附加启动时生成的随机标识
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'[:100]
+        self._threads = []
+        self._heartbeat_thread = None
+        self._start_lock = threading.Lock()
+        # 领取任务时持有，保证每用户上限的检查和领取在进程内是原子的
+        self._claim_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+
+    def start(self):
+        """启动工作线程（首次提交任务或服务启动时调用），并恢复上次中断的任务"""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._resume_interrupted()
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'compression-worker-{i + 1}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name='compression-heartbeat', daemon=True)
+            thread.start()
+            self._heartbeat_thread = thread
+
+    def notify(self):
+        """有新任务提交时唤醒空闲的工作线程"""
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _stale_processing(self):
+        """心跳已超时的 processing 任务：执行进程已退出（本调度器自己的任务除外）"""
+        cutoff = timezone.now() - timedelta(seconds=self.stale_after)
+        return (CompressionTask.objects.filter(status=PROCESSING)
+                .filter(Q(heartbeat_at__lt=cutoff)
+                        | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+                        | Q(heartbeat_at__isnull=True, started_at__isnull=True))
+                .exclude(worker=self.worker_id))
+
+    def _resume_interrupted(self):
+        """执行进程已退出的 processing 任务已没有线程在执行，重置为 pending 重新排队"""
+        try:
+            interrupted = list(self._stale_processing().values_list('task_id', flat=True))
+            if not interrupted:
+                return
+            # 条件更新：重新检查心跳，期间恢复心跳的任务不会被重置
+            count = self._stale_processing().filter(task_id__in=interrupted).update(
+                status=PENDING, progress=0, started_at=None, worker='', heartbeat_at=None
+            )
+            # 缓存中的进度已过时，进度查询改为读取数据库
+            for task_id in interrupted:
+                clear_progress(task_id)
+            if count:
+                logger.info(f'恢复 {count} 个中断的压缩任务')
+        except Exception as e:
+            logger.error(f'恢复中断的压缩任务失败: {e}')
+        finally:
+            connection.close()
+
+    def _heartbeat(self):
+        """定期更新本调度器执行中任务的心跳，并重新排队执行进程已退出的任务"""
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                CompressionTask.objects.filter(status=PROCESSING, worker=self.worker_id).update(
+                    heartbeat_at=timezone.now()
+                )
+            except Exception as e:
+                logger.error(f'更新压缩任务心跳失败: {e}')
+            finally:
+                connection.close()
+            self._resume_interrupted()
+
+    def _run(self):
+        from .tasks import process_compression_task
+
+        while not self._stop.is_set():
+            try:
+                task_id = self._claim()
+            except Exception as e:
+                logger.error(f'领取压缩任务失败: {e}')
+                task_id = None
+            if task_id is None:
+                connection.close()
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                process_compression_task(task_id)
+            except Exception as e:
+                logger.error(f'压缩任务 {task_id} 执行异常: {e}')
+            finally:
+                connection.close()
+            # 一个任务结束后，同一用户排队的任务可能可以开始了
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _claim(self):
+        """按调度顺序领取一个可执行的任务，标记为 processing 并返回其 ID；没有时返回 None"""
+        with self._claim_lock:
+            running = dict(
+                CompressionTask.objects.filter(status=PROCESSING, user_id__isnull=False)
+                .values_list('user_id').annotate(count=Count('task_id')).order_by()
+            )
+            blocked = [user_id for user_id, count in running.items() if count >= self.per_user]
+            candidates = CompressionTask.objects.filter(status=PENDING).exclude(user_id__in=blocked)
+
+            overdue_before = timezone.now() - timedelta(seconds=self.max_wait)
+            overdue = candidates.filter(created_at__lt=overdue_before).order_by('created_at')
+            ordered = candidates.order_by('total_bytes', 'created_at')
+            for queryset in (overdue, ordered):
+                for task_id in queryset.values_list('task_id', flat=True)[:CANDIDATE_LIMIT]:
+                    # 条件更新：任务可能已被取消或被其他进程领取
+                    now = timezone.now()
+                    if CompressionTask.objects.filter(task_id=task_id, status=PENDING).update(
+                        status=PROCESSING, started_at=now, worker=self.worker_id, heartbeat_at=now
+                    ):
+                        return task_id
+            return None
+
+    def queue_position(self, task):
+        """排队任务前面还有多少个等待中的任务（按小任务优先的顺序估算），不在排队时返回 None"""
+        if task.status != PENDING:
+            return None
+        overdue_before = timezone.now() - timedelta(seconds=self.max_wait)
+        pending = CompressionTask.objects.filter(status=PENDING).exclude(task_id=task.task_id)
+        if task.created_at < overdue_before:
+            return pending.filter(created_at__lt=task.created_at).count()
+        return (pending.filter(created_at__lt=overdue_before).count()
+                + pending.filter(created_at__gte=overdue_before, total_bytes__lt=task.total_bytes).count()
+                + pending.filter(created_at__gte=overdue_before, total_bytes=task.total_bytes,
+                                 created_at__lt=task.created_at).count())
+
+    def get_stats(self):
+        """队列统计：等待和执行中的任务数、最久等待时间、最近一小时任务的平均等待时间"""
+        now = timezone.now()
+        counts = dict(
+            CompressionTask.objects.filter(status__in=[PENDING, PROCESSING])
+            .values_list('status').annotate(count=Count('task_id')).order_by()
+        )
+        oldest = (CompressionTask.objects.filter(status=PENDING)
+                  .order_by('created_at').values_list('created_at', flat=True).first())
+        recent = CompressionTask.objects.filter(
+            started_at__gte=now - timedelta(hours=1)
+        ).values_list('created_at', 'started_at')
+        waits = [(started_at - created_at).total_seconds() for created_at, started_at in recent]
+        return {
+            'workers': self.workers,
+            'workers_alive': sum(1 for thread in self._threads if thread.is_alive()),
+            'per_user': self.per_user,
+            'pending': counts.get(PENDING, 0),
+            'processing': counts.get(PROCESSING, 0),
+            'oldest_wait_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0,
+            'avg_wait_seconds': round(sum(waits) / len(waits), 1) if waits else 0,
+            'max_wait_seconds': round(max(waits), 1) if waits else 0,
+            'started_last_hour': len(waits),
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """进程内共享的调度器"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = CompressionScheduler(**get_config())
+    return _scheduler
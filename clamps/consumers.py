@@ -16,6 +16,9 @@ import json
 from channels.generic.websocket import WebsocketConsumer
 from asgiref.sync import async_to_sync
 
+# 文件同步进度推送的频道组，管理员连接后加入，所有管理员都能收到进度
+FILE_SYNC_GROUP = 'file_sync'
+
 
 class CompressionConsumer(WebsocketConsumer):
     """压缩任务WebSocket消费者"""
@@ -37,14 +40,21 @@ class CompressionConsumer(WebsocketConsumer):
             self.channel_name
         )
         
+        # 管理员同时接收文件同步进度（不论由哪个管理员发起）
+        self.groups_joined = [self.group_name]
+        if user.is_staff or user.is_superuser:
+            async_to_sync(self.channel_layer.group_add)(FILE_SYNC_GROUP, self.channel_name)
+            self.groups_joined.append(FILE_SYNC_GROUP)
+        
         self.accept()
     
     def disconnect(self, close_code):
         # 离开组
-        async_to_sync(self.channel_layer.group_discard)(
-            self.group_name,
-            self.channel_name
-        )
+        for group_name in getattr(self, 'groups_joined', []):
+            async_to_sync(self.channel_layer.group_discard)(
+                group_name,
+                self.channel_name
+            )
     
     def receive(self, text_data):
         # 处理来自客户端的消息（如果需要）
@@ -58,3 +68,8 @@ class CompressionConsumer(WebsocketConsumer):
             'status': event['status'],
             'message': event['message']
         }))
+
+    def file_sync_update(self, event):
+        # 发送文件同步进度给客户端
+        data = {key: value for key, value in event.items() if key != 'type'}
+        self.send(text_data=json.dumps({'type': 'file_sync', **data}))
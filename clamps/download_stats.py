@@ -0,0 +1,117 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+下载统计日汇总
+下载日志写入数据库时，按 (本地日期, 用户, 文件类型) 累加到 DownloadDailyStat；
+下载分析接口只读取汇总行，耗时与统计天数和用户数相关，与日志条数无关。
+汇总数据可用 rebuild_download_stats 命令从日志重新生成。
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DownloadDailyStat, Log
+
+
+def _aggregate(records):
+    """按 (日期, 用户, 文件类型) 汇总日志记录，返回 {键: [次数, 文件数, 字节数, 最后时间]}"""
+    totals = {}
+    for record in records:
+        if record.get('action_type') not in Log.DOWNLOAD_ACTIONS or record.get('user_id') is None:
+            continue
+        timestamp = record['timestamp']
+        key = (timezone.localtime(timestamp).date(), record['user_id'], record.get('file_type') or '')
+        total = totals.setdefault(key, [0, 0, 0, timestamp])
+        total[0] += 1
+        total[1] += record.get('file_count') or 0
+        total[2] += record.get('size_bytes') or 0
+        total[3] = max(total[3], timestamp)
+    return totals
+
+
+def _increment(date, user_id, file_type, count, files, size_bytes, last_download):
+    """累加一行汇总，不存在时创建"""
+    lookup = {'date': date, 'user_id': user_id, 'file_type': file_type}
+    changes = {
+        'download_count': F('download_count') + count,
+        'file_count': F('file_count') + files,
+        'size_bytes': F('size_bytes') + size_bytes,
+        'last_download': Case(
+            When(Q(last_download__isnull=True) | Q(last_download__lt=last_download), then=Value(last_download)),
+            default=F('last_download'),
+        ),
+    }
+    if DownloadDailyStat.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DownloadDailyStat.objects.create(
+                download_count=count, file_count=files, size_bytes=size_bytes,
+                last_download=last_download, **lookup
+            )
+    except IntegrityError:
+        # 并发写入时另一进程已创建该行
+        DownloadDailyStat.objects.filter(**lookup).update(**changes)
+
+
+def record_download_stats(records):
+    """把一批日志记录（字段同 Log 的字典）累加进日汇总；非下载和匿名记录忽略"""
+    for (date, user_id, file_type), (count, files, size_bytes, last_download) in _aggregate(records).items():
+        _increment(date, user_id, file_type, count, files, size_bytes, last_download)
+
+
+def rebuild_download_stats(start_date=None, end_date=None):
+    """从下载日志重新生成日汇总（日期区间含两端，省略时为全部），返回生成的汇总行数"""
+    logs = Log.objects.filter(action_type__in=Log.DOWNLOAD_ACTIONS, user__isnull=False)
+    stats = DownloadDailyStat.objects.all()
+    if start_date:
+        logs = logs.filter(timestamp__gte=timezone.make_aware(datetime.combine(start_date, time.min)))
+        stats = stats.filter(date__gte=start_date)
+    if end_date:
+        logs = logs.filter(timestamp__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)))
+        stats = stats.filter(date__lte=end_date)
+
+    # TruncDate 按当前时区（TIME_ZONE）取日期，与写入时的本地日期一致
+    rows = logs.annotate(day=TruncDate('timestamp')).values('day', 'user_id', 'file_type').annotate(
+        count=Count('id'),
+        files=Sum('file_count', default=0),
+        total_bytes=Sum('size_bytes', default=0),
+        last=Max('timestamp'),
+    ).order_by()
+
+    totals = {}
+    for row in rows:
+        # 文件类型为 NULL 和空字符串的日志归入同一行
+        key = (row['day'], row['user_id'], row['file_type'] or '')
+        total = totals.setdefault(key, [0, 0, 0, row['last']])
+        total[0] += row['count']
+        total[1] += row['files']
+        total[2] += row['total_bytes']
+        total[3] = max(total[3], row['last'])
+
+    with transaction.atomic():
+        stats.delete()
+        DownloadDailyStat.objects.bulk_create([
+            DownloadDailyStat(
+                date=date, user_id=user_id, file_type=file_type, download_count=count,
+                file_count=files, size_bytes=size_bytes, last_download=last_download,
+            )
+            for (date, user_id, file_type), (count, files, size_bytes, last_download) in totals.items()
+        ], batch_size=500)
+    return len(totals)
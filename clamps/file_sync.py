@@ -0,0 +1,269 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+媒体文件同步
+把 MEDIA_ROOT 下的 PDF、STEP、BMP 文件按文件名（图号）关联到产品的文件路径字段，并维护媒体文件索引。
+
+增量同步使用上次同步保存的目录快照（MediaDirectory）：修改时间与快照一致的目录不再列出内容，
+沿用索引中的文件和快照中的子目录，只检查子目录的修改时间；只有新增的文件和上次未匹配的文件
+参与产品匹配，已删除的文件从索引中移除。目录修改时间只在目录项增删、改名时变化，
+文件被原地覆盖时不会变化，这类变化以及产品图号修改需要全量同步发现。
+目录由 media_scanner 并发扫描，扫描结果边到达边匹配产品。
+"""
+
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Trim, Upper
+
+from .catalog import bump_catalog_version
+from .media_index import update_media_index
+from .media_scanner import scan_directories
+from .models import MediaDirectory, MediaFile, Product
+
+logger = logging.getLogger(__name__)
+
+# 文件后缀 -> 模型字段
+EXT_FIELD = {
+    '.pdf': 'pdf_file_path',
+    '.step': 'step_file_path',
+    '.bmp': 'bmp_file_path',
+}
+
+BATCH_SIZE = 500
+
+
+@dataclass
+class Snapshot:
+    """上次同步的状态：目录 -> (修改时间, 扫描时间)，目录 -> {文件: (字节数, 修改时间)}，目录 -> [子目录]"""
+    dirs: dict
+    files: dict
+    subdirs: dict
+
+
+def match_key(filename):
+    """文件名 -> (产品图号键, 产品文件字段)，不是媒体文件时返回 None"""
+    name, ext = os.path.splitext(filename.lower())
+    if ext not in EXT_FIELD:
+        return None
+    # 优化：一次性替换所有后缀
+    clean = name.upper()
+    if clean.endswith(('_PDF', '_STEP', '_BMP')):
+        clean = clean[:-4]  # 移除最后4个字符
+    return clean, EXT_FIELD[ext]
+
+
+def _parent(path):
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+
+def load_snapshot():
+    """从目录快照和媒体文件索引加载上次同步的状态"""
+    dirs = {}
+    subdirs = defaultdict(list)
+    for path, mtime, scanned_at in MediaDirectory.objects.values_list('path', 'mtime', 'scanned_at'):
+        dirs[path] = (mtime, scanned_at)
+        if path:
+            subdirs[_parent(path)].append(path)
+    files = defaultdict(dict)
+    for path, size_bytes, mtime in MediaFile.objects.values_list('path', 'size_bytes', 'mtime'):
+        files[_parent(path)][path] = (size_bytes, mtime)
+    return Snapshot(dirs=dirs, files=files, subdirs=subdirs)
+
+
+def _save_snapshot(dirs):
+    """保存目录快照：新增、更新变化的目录，删除已不存在的目录"""
+    existing = {path: (pk, mtime, scanned_at) for pk, path, mtime, scanned_at in
+                MediaDirectory.objects.values_list('id', 'path', 'mtime', 'scanned_at')}
+    to_create = []
+    to_update = []
+    for path, (mtime, scanned_at) in dirs.items():
+        old = existing.pop(path, None)
+        if old is None:
+            to_create.append(MediaDirectory(path=path, mtime=mtime, scanned_at=scanned_at))
+        elif (old[1], old[2]) != (mtime, scanned_at):
+            to_update.append(MediaDirectory(id=old[0], path=path, mtime=mtime, scanned_at=scanned_at))
+    stale_ids = [pk for pk, _, _ in existing.values()]
+    with transaction.atomic():
+        MediaDirectory.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        MediaDirectory.objects.bulk_update(to_update, ['mtime', 'scanned_at'], batch_size=BATCH_SIZE)
+        for i in range(0, len(stale_ids), BATCH_SIZE):
+            MediaDirectory.objects.filter(id__in=stale_ids[i:i + BATCH_SIZE]).delete()
+
+
+def _load_products(keys, full):
+    """图号键 -> 产品；全量同步加载全部产品，增量同步只查询涉及的图号"""
+    products = Product.objects.only('id', 'drawing_no_1', 'pdf_file_path', 'step_file_path', 'bmp_file_path')
+    product_map = {}
+    if full:
+        for product in products:
+            if product.drawing_no_1:
+                product_map[product.drawing_no_1.strip().upper()] = product
+        return product_map
+    keys = list(keys)
+    products = products.annotate(match_key=Upper(Trim('drawing_no_1')))
+    for i in range(0, len(keys), BATCH_SIZE):
+        for product in products.filter(match_key__in=keys[i:i + BATCH_SIZE]):
+            product_map[product.drawing_no_1.strip().upper()] = product
+    return product_map
+
+
+class _Matcher:
+    """边扫描边匹配产品：全量同步预先加载全部产品逐个匹配；增量同步只匹配新增和上次未匹配的文件，
+    攒够一批再按图号查询产品"""
+
+    def __init__(self, full, matched_before):
+        self.full = full
+        self.matched_before = matched_before
+        self.product_map = _load_products(None, True) if full else {}
+        self.looked_up = set()  # 增量同步中已查询过的图号键
+        self.pending = []
+        self.to_update = defaultdict(list)
+        self.updated = 0
+        self.matched_paths = []
+        self.unmatched_paths = []
+
+    def add(self, path):
+        if not self.full and path in self.matched_before:
+            return
+        self.pending.append(path)
+        if self.full or len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        keys = {path: match_key(path.rsplit('/', 1)[-1]) for path in pending}
+        if not self.full:
+            new_keys = {key for key, _ in keys.values()} - self.looked_up
+            self.product_map.update(_load_products(new_keys, False))
+            self.looked_up |= new_keys
+
+        for path in pending:
+            key, field_name = keys[path]
+            product = self.product_map.get(key)
+            if not product:
+                self.unmatched_paths.append(path)
+                continue
+            self.matched_paths.append(path)
+            filename = path.rsplit('/', 1)[-1]
+            # 只保留文件名
+            if getattr(product, field_name) != filename:
+                setattr(product, field_name, filename)
+                self.to_update[field_name].append(product)
+                self.updated += 1
+
+
+def _set_matched(paths, matched):
+    for i in range(0, len(paths), BATCH_SIZE):
+        MediaFile.objects.filter(path__in=paths[i:i + BATCH_SIZE]).update(matched=matched)
+
+
+def _write_unmatched_log(media_root, total_files, unmatched_names):
+    """保存所有未匹配文件到日志文件"""
+    log_dir = os.path.join(settings.BASE_DIR, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    unmatched_log_path = os.path.join(log_dir, 'unmatched_files.log')
+
+    with open(unmatched_log_path, 'w', encoding='utf-8') as f:
+        f.write(f'# 文件同步未匹配文件记录 - 生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}\n')
+        f.write(f'# 总处理文件数：{total_files}，未匹配文件数：{len(unmatched_names)}\n')
+        f.write(f'# 媒体目录：{media_root}\n')
+        f.write('\n')
+        for filename in unmatched_names:
+            f.write(f'{filename}\n')
+
+    logger.debug(f'未匹配文件列表已保存到：{unmatched_log_path}')
+
+
+def sync_media_files(full=False, progress=None):
+    """同步媒体文件到产品文件路径，full=True 时全量扫描并重新匹配全部文件。
+    progress(已完成目录数, 已发现文件数) 在扫描过程中按间隔调用。
+    返回 (是否成功, 消息, 统计)，统计包含文件数 files、更新记录数 updated、未匹配文件数 unmatched 等"""
+    start_time = time.time()
+
+    media_root = settings.MEDIA_ROOT
+    if not os.path.isdir(media_root):
+        logger.error(f'媒体目录 {media_root} 不存在。')
+        return False, f'媒体目录 {media_root} 不存在。', {}
+
+    # 1. 并发扫描媒体目录（增量同步时跳过未变化的目录），扫描结果边到达边匹配产品；
+    #    需要匹配的文件：全量同步为全部文件，增量同步为新增文件和上次未匹配的文件
+    snapshot = None if full else load_snapshot()
+    matched_before = set() if full else set(MediaFile.objects.filter(matched=True).values_list('path', flat=True))
+    matcher = _Matcher(full, matched_before)
+    files = {}  # 相对路径 -> (字节数, 修改时间)
+    dirs = {}  # 相对路径 -> (修改时间, 扫描时间)
+    listed = skipped = 0
+    for scan in scan_directories(media_root, snapshot, include=match_key, progress=progress):
+        dirs[scan.path] = (scan.mtime, scan.scanned_at)
+        if scan.skipped:
+            skipped += 1
+        else:
+            listed += 1
+        files.update(scan.files)
+        for path in scan.files:
+            matcher.add(path)
+    matcher.flush()
+
+    # 2. 批量更新产品
+    with transaction.atomic():
+        for field_name, objs in matcher.to_update.items():
+            for i in range(0, len(objs), BATCH_SIZE):
+                Product.objects.bulk_update(objs[i:i + BATCH_SIZE], [field_name])
+    if matcher.updated:
+        bump_catalog_version()
+
+    # 3. 更新媒体文件索引、匹配状态和目录快照
+    indexed, removed = update_media_index(files)
+    _set_matched(matcher.matched_paths, True)
+    _set_matched(matcher.unmatched_paths, False)
+    _save_snapshot(dirs)
+
+    # 4. 未匹配文件列表（包括本次未重新匹配、仍未匹配的文件）
+    unmatched_names = sorted(
+        path.rsplit('/', 1)[-1] for path in MediaFile.objects.filter(matched=False).values_list('path', flat=True)
+    )
+    _write_unmatched_log(media_root, len(files), unmatched_names)
+
+    # 5. 计算耗时并返回结果
+    total_time = time.time() - start_time
+    msg = f'同步完成：处理 {len(files)} 个文件，更新 {matcher.updated} 条记录。耗时 {total_time:.2f} 秒。'
+    if not full:
+        msg += (f'（增量同步：列出 {listed} 个目录，跳过 {skipped} 个未变化目录，'
+                f'新增或变化 {indexed} 个文件，删除 {removed} 个文件）')
+    unmatch = len(unmatched_names)
+    if unmatch:
+        msg += f' 未匹配 {unmatch} 个文件'
+        msg += f'：{', '.join(unmatched_names[:5])}'
+        if unmatch > 5:
+            msg += ' ...\n未匹配文件完整列表已保存到 logs/unmatched_files.log'
+
+    logger.debug(f'{msg}')
+    stats = {
+        'files': len(files),
+        'updated': matcher.updated,
+        'unmatched': unmatch,
+        'dirs_listed': listed,
+        'dirs_skipped': skipped,
+        'indexed': indexed,
+        'removed': removed,
+        'seconds': total_time,
+    }
+    return True, msg, stats
@@ -0,0 +1,272 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+操作日志缓冲写入
+视图调用 log_action() 把日志记录放入进程内有界队列后立即返回，后台线程按条数或时间阈值
+用 bulk_create 批量写入，SQLite 下多次页面访问合并为一个写事务，减少对数据库锁的争用。
+数据库繁忙（写入失败）或队列已满时，记录追加到本地 JSONL 文件，下次成功写入时回放；
+进程正常退出（atexit）或收到终止信号（由启动脚本安装处理函数）时排空队列，已入队的记录不会丢失；
+缓冲时间不超过 MAX_FLUSH_INTERVAL 秒，进程被强制结束时最多丢失这段时间内的记录。
+下载日志写入时在同一事务内累加下载日汇总。
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 可由调用方指定的日志字段（对应 Log 模型的列名）
+LOG_FIELDS = (
+    'user_id', 'action_type', 'details', 'timestamp', 'ip_address', 'user_agent', 'path', 'method',
+    'file_type', 'size_bytes', 'file_count', 'product_ids',
+)
+
+
+# 最长缓冲时间上限（秒），flush_interval 配置得再大也按此值写入
+MAX_FLUSH_INTERVAL = 10.0
+
+
+def get_config():
+    """获取日志缓冲配置"""
+    config = {
+        'enabled': True,
+        'batch_size': 200,
+        'flush_interval': 2.0,
+        'max_queue': 10000,
+        'fallback_file': os.path.join(settings.BASE_DIR, 'logs', 'pending_logs.jsonl'),
+    }
+    config.update(getattr(settings, 'LOG_BUFFER', {}))
+    return config
+
+
+def _to_json(record):
+    data = dict(record)
+    data['timestamp'] = data['timestamp'].isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _from_json(line):
+    data = json.loads(line)
+    data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+    return {key: data.get(key) for key in LOG_FIELDS}
+
+
+def save_records(records, batch_size=None):
+    """日志记录写入数据库，同一事务内累加下载日汇总"""
+    from .download_stats import record_download_stats
+    from .models import Log
+
+    with transaction.atomic():
+        Log.objects.bulk_create([Log(**record) for record in records], batch_size=batch_size)
+        record_download_stats(records)
+
+
+class LogBuffer:
+    """有界队列 + 后台批量写入线程"""
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue=10000, fallback_file=None):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = min(float(flush_interval), MAX_FLUSH_INTERVAL)
+        self.fallback_file = fallback_file
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        # 回退文件中可能有待回放的记录（上次运行遗留或本进程写入）
+        self._pending_file = bool(fallback_file and os.path.exists(fallback_file))
+
+    def start(self):
+        """启动后台写入线程（首次入队时自动调用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='log-buffer-flusher', daemon=True)
+            self._thread.start()
+
+    def put(self, record):
+        """记录入队；队列已满时直接写入回退文件"""
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._append_fallback([record])
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+            elif self._pending_file:
+                self._replay_fallback()
+        connection.close()
+
+    def _collect(self):
+        """收集一批记录：达到 batch_size 或距第一条记录超过 flush_interval 即返回"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if self._stop.is_set():
+                break
+        return batch
+
+    def _write(self, records):
+        """批量写入数据库，失败时转存回退文件；写入成功后顺带回放回退文件"""
+        try:
+            save_records(records, batch_size=self.batch_size)
+        except Exception as e:
+            logger.warning(f"日志批量写入失败，转存到回退文件: {e}")
+            self._append_fallback(records)
+            # 出错的连接可能处于异常状态，下次写入时重新建立
+            connection.close()
+            return False
+        if self._pending_file:
+            self._replay_fallback()
+        return True
+
+    def _append_fallback(self, records):
+        if not self.fallback_file:
+            logger.error(f"日志队列已满且未配置回退文件，丢弃 {len(records)} 条日志")
+            return
+        with self._file_lock:
+            os.makedirs(os.path.dirname(self.fallback_file), exist_ok=True)
+            with open(self.fallback_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(_to_json(record) + '\n' for record in records))
+            self._pending_file = True
+
+    def _replay_fallback(self):
+        """回放回退文件中的记录；先改名再读取，多进程共用同一文件时不会重复回放"""
+        with self._file_lock:
+            self._pending_file = False
+            if not os.path.exists(self.fallback_file):
+                return
+            replay_file = f'{self.fallback_file}.{os.getpid()}.replay'
+            try:
+                os.replace(self.fallback_file, replay_file)
+            except OSError:
+                return
+
+        records = []
+        with open(replay_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(_from_json(line))
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"跳过无法解析的回退日志: {e}")
+        os.remove(replay_file)
+
+        for i in range(0, len(records), self.batch_size):
+            try:
+                save_records(records[i:i + self.batch_size])
+            except Exception as e:
+                logger.warning(f"回放日志失败，稍后重试: {e}")
+                self._append_fallback(records[i:])
+                connection.close()
+                return
+        if records:
+            logger.info(f"已回放 {len(records)} 条回退日志")
+
+    def drain(self, timeout=10):
+        """停止后台线程并把队列中剩余的记录全部写入（进程退出时调用）"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+        elif self._pending_file:
+            self._replay_fallback()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_log_buffer():
+    """获取进程内的日志缓冲；配置为关闭时返回 None"""
+    global _buffer
+    config = get_config()
+    if not config['enabled']:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LogBuffer(
+                    batch_size=config['batch_size'],
+                    flush_interval=config['flush_interval'],
+                    max_queue=config['max_queue'],
+                    fallback_file=config['fallback_file'],
+                )
+                atexit.register(_buffer.drain)
+    return _buffer
+
+
+def drain_log_buffer():
+    """排空进程内的日志缓冲（收到终止信号时调用），缓冲尚未创建时不做任何事"""
+    if _buffer is not None:
+        _buffer.drain()
+
+
+def log_action(request, action_type, details=None, user=None, **fields):
+    """记录操作日志：默认取 request 中的当前用户、IP 和 User-Agent，操作时间取入队时刻"""
+    if user is None and request is not None and request.user.is_authenticated:
+        user = request.user
+    record = {
+        'user_id': user.pk if user is not None else None,
+        'action_type': action_type,
+        'details': details,
+        'timestamp': timezone.now(),
+        'ip_address': request.META.get('REMOTE_ADDR') if request is not None else None,
+        'user_agent': request.META.get('HTTP_USER_AGENT', '') if request is not None else None,
+        'path': None,
+        'method': None,
+    }
+    record.update((key, value) for key, value in fields.items() if key in LOG_FIELDS)
+
+    buffer = get_log_buffer()
+    if buffer is None:
+        save_records([record])
+    else:
+        buffer.put(record)
@@ -0,0 +1,40 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clamps.download_stats import rebuild_download_stats
+
+
+class Command(BaseCommand):
+    help = '从下载日志重新生成下载日汇总（DownloadDailyStat）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='起始日期（含），格式 YYYY-MM-DD，默认不限')
+        parser.add_argument('--end', help='结束日期（含），格式 YYYY-MM-DD，默认不限')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f'日期格式错误: {e}')
+
+        self.stdout.write('开始重建下载日汇总...')
+        count = rebuild_download_stats(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'下载日汇总重建完成，共 {count} 行'))
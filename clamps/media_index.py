@@ -0,0 +1,223 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+媒体文件元数据索引
+文件同步时把 MEDIA_ROOT 下 PDF、STEP、BMP 文件的相对路径、大小、修改时间和内容哈希写入 MediaFile；
+下载和文件大小检查按批次一次查询索引，只有索引中没有的文件才访问文件系统
+（媒体目录在网络共享上时，每次 exists / getsize 都是一次网络往返）。
+"""
+
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MediaFile
+
+logger = logging.getLogger(__name__)
+
+# 产品文件路径中可能带有的媒体目录前缀
+MEDIA_PREFIXES = ('media/', '/media/', '\\media\\')
+
+# 下载类型 -> 产品文件字段
+FILE_TYPE_FIELDS = {
+    'pdf': ('pdf_file_path',),
+    'step': ('step_file_path',),
+    'bmp': ('bmp_file_path',),
+    'both': ('pdf_file_path', 'step_file_path'),
+}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_config():
+    """获取媒体文件索引配置"""
+    config = {
+        'content_hash': True,  # 新增或变化的文件计算内容哈希
+        'batch_size': 500,
+    }
+    config.update(getattr(settings, 'MEDIA_INDEX', {}))
+    return config
+
+
+def relative_media_path(file_path):
+    """产品文件路径转换为相对 MEDIA_ROOT 的路径（使用 / 分隔）"""
+    path = str(file_path)
+    for prefix in MEDIA_PREFIXES:
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    return path.replace('\\', '/')
+
+
+def full_media_path(file_path):
+    """产品文件路径转换为完整路径"""
+    return os.path.join(settings.MEDIA_ROOT, relative_media_path(file_path))
+
+
+def file_digest(full_path):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_stats(file_paths):
+    """批量获取媒体文件元数据，返回 {文件路径: (字节数, 修改时间, 内容哈希)}，文件不存在时为 None。
+    先分批查询索引，索引中没有的文件再访问文件系统（内容哈希为空）"""
+    paths = {file_path: relative_media_path(file_path) for file_path in file_paths if file_path}
+    relative_paths = list(set(paths.values()))
+    batch_size = get_config()['batch_size']
+    indexed = {}
+    for i in range(0, len(relative_paths), batch_size):
+        for path, size_bytes, mtime, content_hash in MediaFile.objects.filter(
+                path__in=relative_paths[i:i + batch_size]).values_list('path', 'size_bytes', 'mtime', 'content_hash'):
+            indexed[path] = (size_bytes, mtime, content_hash)
+
+    stats = {}
+    for file_path, relative_path in paths.items():
+        stat = indexed.get(relative_path)
+        if stat is None:
+            try:
+                st = os.stat(os.path.join(settings.MEDIA_ROOT, relative_path))
+                stat = (st.st_size, st.st_mtime, '')
+            except OSError:
+                stat = None
+        stats[file_path] = stat
+    return stats
+
+
+def get_file_sizes(file_paths):
+    """批量获取媒体文件大小，返回 {文件路径: 字节数}，文件不存在时为 None"""
+    return {file_path: stat[0] if stat else None for file_path, stat in get_file_stats(file_paths).items()}
+
+
+def get_file_size(file_path):
+    """获取单个媒体文件大小（字节），文件不存在时返回 None"""
+    if not file_path:
+        return None
+    return get_file_sizes([file_path])[file_path]
+
+
+def product_file_paths(products, file_type):
+    """产品在该下载类型下关联的文件路径"""
+    fields = FILE_TYPE_FIELDS.get(file_type, ())
+    return [getattr(product, field) for product in products for field in fields if getattr(product, field)]
+
+
+def get_product_file_sizes(products, file_type):
+    """批量获取产品在该下载类型下关联文件的大小，返回 {文件路径: 字节数或 None}"""
+    return get_file_sizes(product_file_paths(products, file_type))
+
+
+def revalidate_index(file_paths):
+    """按文件系统的实时状态校正索引中这些文件的条目（只在后台任务中调用，请求线程只读索引）：
+    大小或修改时间与索引不同的文件重新计算内容哈希并更新，已不存在的文件从索引删除，
+    增量同步漏掉的原地覆盖由此得到更正。返回校正的条目数"""
+    paths = list({relative_media_path(file_path) for file_path in file_paths if file_path})
+    config = get_config()
+    batch_size = config['batch_size']
+    indexed = {}
+    for i in range(0, len(paths), batch_size):
+        for media_file in MediaFile.objects.filter(path__in=paths[i:i + batch_size]):
+            indexed[media_file.path] = media_file
+
+    to_update = []
+    stale_ids = []
+    now = timezone.now()
+    for path, media_file in indexed.items():
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        try:
+            st = os.stat(full_path)
+            if st.st_size == media_file.size_bytes and st.st_mtime == media_file.mtime:
+                continue
+            content_hash = file_digest(full_path) if config['content_hash'] else ''
+        except FileNotFoundError:
+            stale_ids.append(media_file.id)
+            continue
+        except OSError as e:
+            # 暂时无法读取（如网络共享抖动），保留原条目
+            logger.warning(f"校验媒体文件失败，保留索引: {path}: {e}")
+            continue
+        media_file.size_bytes = st.st_size
+        media_file.mtime = st.st_mtime
+        media_file.content_hash = content_hash
+        media_file.indexed_at = now
+        to_update.append(media_file)
+
+    if to_update or stale_ids:
+        with transaction.atomic():
+            MediaFile.objects.bulk_update(to_update, ['size_bytes', 'mtime', 'content_hash', 'indexed_at'])
+            MediaFile.objects.filter(id__in=stale_ids).delete()
+        logger.info(f"媒体文件索引校正: 更新 {len(to_update)} 个，删除 {len(stale_ids)} 个")
+    return len(to_update) + len(stale_ids)
+
+
+def update_media_index(files):
+    """用扫描结果更新索引。
+    files: {相对路径: (字节数, 修改时间)}，为 MEDIA_ROOT 下全部媒体文件；
+    新增或大小、修改时间有变化的文件重新计算内容哈希，扫描中已不存在的文件从索引删除。
+    返回 (新增或更新数, 删除数)"""
+    config = get_config()
+    now = timezone.now()
+    existing = {
+        path: (pk, size_bytes, mtime)
+        for pk, path, size_bytes, mtime in MediaFile.objects.values_list('id', 'path', 'size_bytes', 'mtime')
+    }
+
+    to_create = []
+    to_update = []
+    for path, (size_bytes, mtime) in files.items():
+        old = existing.pop(path, None)
+        if old is not None and old[1] == size_bytes and old[2] == mtime:
+            continue
+        content_hash = ''
+        if config['content_hash']:
+            try:
+                content_hash = file_digest(os.path.join(settings.MEDIA_ROOT, path))
+            except FileNotFoundError:
+                # 扫描后文件被删除，原条目随其他已不存在的文件一起删除
+                if old is not None:
+                    existing[path] = old
+                continue
+            except OSError as e:
+                # 暂时无法读取（如网络共享抖动），保留原条目，下次同步时再更新
+                logger.warning(f"计算文件哈希失败，跳过索引: {path}: {e}")
+                continue
+        media_file = MediaFile(
+            path=path, file_type=os.path.splitext(path)[1].lstrip('.').lower(),
+            size_bytes=size_bytes, mtime=mtime, content_hash=content_hash, indexed_at=now,
+        )
+        if old is None:
+            to_create.append(media_file)
+        else:
+            media_file.id = old[0]
+            to_update.append(media_file)
+
+    stale_ids = [pk for pk, _, _ in existing.values()]
+    batch_size = config['batch_size']
+    with transaction.atomic():
+        MediaFile.objects.bulk_create(to_create, batch_size=batch_size)
+        MediaFile.objects.bulk_update(
+            to_update, ['file_type', 'size_bytes', 'mtime', 'content_hash', 'indexed_at'], batch_size=batch_size
+        )
+        for i in range(0, len(stale_ids), batch_size):
+            MediaFile.objects.filter(id__in=stale_ids[i:i + batch_size]).delete()
+    return len(to_create) + len(to_update), len(stale_ids)
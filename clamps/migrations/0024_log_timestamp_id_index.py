@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0023_auto_20260105_1108'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['timestamp', 'id'], name='clamps_log_timesta_6fc3aa_idx'),
+        ),
+    ]
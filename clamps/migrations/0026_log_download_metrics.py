@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0025_log_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='file_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='文件数量'),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='file_type',
+            field=models.CharField(blank=True, max_length=10, null=True, verbose_name='文件类型'),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='product_ids',
+            field=models.TextField(blank=True, help_text='产品ID列表，用逗号分隔', null=True, verbose_name='产品ID列表'),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='size_bytes',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='下载大小(字节)'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['action_type', 'timestamp'], name='clamps_log_action__2c048e_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:30
+
+import re
+
+from django.db import migrations
+
+DOWNLOAD_ACTIONS = ('download', 'batch_download', 'single_download')
+BATCH_SIZE = 500
+
+SIZE_RE = re.compile(r'(?:File|Total) Size: ([\d.]+) MB')
+FILE_TYPE_RE = re.compile(r'File Type: (\w+)')
+PRODUCT_IDS_RE = re.compile(r'Product IDs?: ([\d,\s]+)')
+DRAWING_NO_RE = re.compile(r'Drawing No\.: ([^,]+)')
+# 批量下载图号列表的结束标记（图号之间也用逗号分隔，不能按逗号截断）
+DRAWING_NOS_END_RE = re.compile(r'File Type:|Total Size:|Async Task ID:')
+
+
+def parse_details(details):
+    """解析历史日志的 details 文本，返回 (文件类型, 字节数, 产品ID列表, 图号列表)"""
+    details = details or ''
+    size_match = SIZE_RE.search(details)
+    size_bytes = round(float(size_match.group(1)) * 1024 * 1024) if size_match else None
+    type_match = FILE_TYPE_RE.search(details)
+    file_type = type_match.group(1).lower() if type_match else None
+
+    product_ids = []
+    drawing_nos = []
+    ids_match = PRODUCT_IDS_RE.search(details)
+    if ids_match:
+        product_ids = [int(pid) for pid in re.split(r'[,\s]+', ids_match.group(1)) if pid.isdigit()]
+    elif 'Drawing Nos:' in details:
+        start = details.index('Drawing Nos:') + len('Drawing Nos:')
+        end_match = DRAWING_NOS_END_RE.search(details, start)
+        part = details[start:end_match.start() if end_match else len(details)]
+        # 视图以 ', ' 连接图号，图号本身可能包含空格，只按逗号拆分
+        drawing_nos = [no.strip() for no in part.split(',') if no.strip()]
+    else:
+        no_match = DRAWING_NO_RE.search(details)
+        if no_match:
+            drawing_nos = [no_match.group(1).strip()]
+    return file_type, size_bytes, product_ids, drawing_nos
+
+
+def backfill_download_metrics(apps, schema_editor):
+    """从 details 文本中一次性回填下载日志的结构化指标"""
+    Log = apps.get_model('clamps', 'Log')
+    Product = apps.get_model('clamps', 'Product')
+
+    # 历史日志大多只记录了图号，按图号映射回产品ID
+    drawing_no_to_id = {}
+    for pk, drawing_no in Product.objects.exclude(drawing_no_1__isnull=True).values_list('id', 'drawing_no_1'):
+        drawing_no_to_id.setdefault(drawing_no, pk)
+
+    # 先取出全部ID再分批处理，避免一边遍历游标一边更新同一张表
+    log_ids = list(
+        Log.objects.filter(action_type__in=DOWNLOAD_ACTIONS, file_count__isnull=True)
+        .order_by('id').values_list('id', flat=True)
+    )
+    for i in range(0, len(log_ids), BATCH_SIZE):
+        logs = list(Log.objects.filter(id__in=log_ids[i:i + BATCH_SIZE]).only('id', 'details'))
+        for log in logs:
+            file_type, size_bytes, product_ids, drawing_nos = parse_details(log.details)
+            if not product_ids:
+                product_ids = [drawing_no_to_id[no] for no in drawing_nos if no in drawing_no_to_id]
+            item_count = len(product_ids) or len(drawing_nos) or 1
+            log.file_type = file_type
+            log.size_bytes = size_bytes
+            log.file_count = item_count * 2 if file_type == 'both' else item_count
+            log.product_ids = ','.join(str(pid) for pid in product_ids) or None
+        Log.objects.bulk_update(logs, ['file_type', 'size_bytes', 'file_count', 'product_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0026_log_download_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_download_metrics, migrations.RunPython.noop),
+    ]
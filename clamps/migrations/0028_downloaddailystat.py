@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0027_backfill_log_download_metrics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('file_type', models.CharField(blank=True, default='', max_length=10, verbose_name='文件类型')),
+                ('download_count', models.PositiveIntegerField(default=0, verbose_name='下载次数')),
+                ('file_count', models.PositiveIntegerField(default=0, verbose_name='文件数量')),
+                ('size_bytes', models.BigIntegerField(default=0, verbose_name='下载大小(字节)')),
+                ('last_download', models.DateTimeField(blank=True, null=True, verbose_name='最后下载时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='download_daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '下载日汇总',
+                'verbose_name_plural': '下载日汇总',
+                'ordering': ['-date'],
+                'unique_together': {('date', 'user', 'file_type')},
+            },
+        ),
+    ]
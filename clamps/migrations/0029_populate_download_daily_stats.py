@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:50
+
+from django.db import migrations
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+
+DOWNLOAD_ACTIONS = ('download', 'batch_download', 'single_download')
+
+
+def populate_download_daily_stats(apps, schema_editor):
+    """根据已有的下载日志生成下载日汇总"""
+    Log = apps.get_model('clamps', 'Log')
+    DownloadDailyStat = apps.get_model('clamps', 'DownloadDailyStat')
+
+    rows = Log.objects.filter(action_type__in=DOWNLOAD_ACTIONS, user__isnull=False).annotate(
+        day=TruncDate('timestamp'),
+    ).values('day', 'user_id', 'file_type').annotate(
+        count=Count('id'),
+        files=Sum('file_count', default=0),
+        total_bytes=Sum('size_bytes', default=0),
+        last=Max('timestamp'),
+    ).order_by()
+
+    totals = {}
+    for row in rows:
+        # 文件类型为 NULL 和空字符串的日志归入同一行
+        key = (row['day'], row['user_id'], row['file_type'] or '')
+        total = totals.setdefault(key, [0, 0, 0, row['last']])
+        total[0] += row['count']
+        total[1] += row['files']
+        total[2] += row['total_bytes']
+        total[3] = max(total[3], row['last'])
+
+    DownloadDailyStat.objects.bulk_create([
+        DownloadDailyStat(
+            date=date, user_id=user_id, file_type=file_type, download_count=count,
+            file_count=files, size_bytes=size_bytes, last_download=last_download,
+        )
+        for (date, user_id, file_type), (count, files, size_bytes, last_download) in totals.items()
+    ], batch_size=500)
+
+
+def clear_download_daily_stats(apps, schema_editor):
+    apps.get_model('clamps', 'DownloadDailyStat').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0028_downloaddailystat'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_download_daily_stats, clear_download_daily_stats),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0029_populate_download_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='相对 MEDIA_ROOT 的路径，使用 / 分隔', max_length=500, unique=True, verbose_name='相对路径')),
+                ('file_type', models.CharField(max_length=10, verbose_name='文件类型')),
+                ('size_bytes', models.BigIntegerField(verbose_name='文件大小(字节)')),
+                ('mtime', models.FloatField(help_text='文件系统修改时间（Unix 时间戳）', verbose_name='修改时间')),
+                ('content_hash', models.CharField(blank=True, default='', help_text='SHA-256', max_length=64, verbose_name='内容哈希')),
+                ('indexed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='索引时间')),
+            ],
+            options={
+                'verbose_name': '媒体文件索引',
+                'verbose_name_plural': '媒体文件索引',
+                'ordering': ['path'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0030_mediafile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(blank=True, help_text='相对 MEDIA_ROOT 的路径，使用 / 分隔，根目录为空', max_length=500, unique=True, verbose_name='相对路径')),
+                ('mtime', models.FloatField(help_text='目录修改时间（Unix 时间戳）', verbose_name='修改时间')),
+                ('scanned_at', models.FloatField(help_text='最后一次列出目录内容的时间（Unix 时间戳）', verbose_name='扫描时间')),
+            ],
+            options={
+                'verbose_name': '媒体目录快照',
+                'verbose_name_plural': '媒体目录快照',
+                'ordering': ['path'],
+            },
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='matched',
+            field=models.BooleanField(default=False, help_text='文件名是否匹配到产品图号', verbose_name='已匹配产品'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:42
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0031_media_sync_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileSyncJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('full', models.BooleanField(default=False, verbose_name='全量扫描')),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('processing', 'PROCESSING'), ('completed', 'COMPLETED'), ('failed', 'FAILED')], default='pending', max_length=20)),
+                ('message', models.TextField(blank=True, default='', help_text='进度或结果信息')),
+                ('dirs_scanned', models.IntegerField(default=0, help_text='已扫描目录数')),
+                ('files_found', models.IntegerField(default=0, help_text='已发现文件数')),
+                ('updated_count', models.IntegerField(default=0, help_text='更新产品记录数')),
+                ('unmatched_count', models.IntegerField(default=0, help_text='未匹配文件数')),
+                ('error_message', models.TextField(blank=True, help_text='错误信息', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='file_sync_jobs', to=settings.AUTH_USER_MODEL, verbose_name='发起用户')),
+            ],
+            options={
+                'verbose_name': '文件同步任务',
+                'verbose_name_plural': '文件同步任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0032_file_sync_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compressiontask',
+            name='started_at',
+            field=models.DateTimeField(blank=True, help_text='开始执行时间', null=True),
+        ),
+        migrations.AddField(
+            model_name='compressiontask',
+            name='total_bytes',
+            field=models.BigIntegerField(default=0, help_text='待压缩文件总字节数，调度时小任务优先'),
+        ),
+        migrations.AddIndex(
+            model_name='compressiontask',
+            index=models.Index(fields=['status', 'created_at'], name='clamps_comp_status_ac66e8_idx'),
+        ),
+    ]
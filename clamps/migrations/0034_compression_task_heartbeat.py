@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clamps', '0033_compression_task_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compressiontask',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='执行中任务的最近心跳时间，超时未更新视为执行进程已退出', null=True),
+        ),
+        migrations.AddField(
+            model_name='compressiontask',
+            name='worker',
+            field=models.CharField(blank=True, default='', help_text='执行任务的调度器（主机名:进程号:启动标识）', max_length=100),
+        ),
+    ]
@@ -388,20 +388,102 @@ class Log(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="操作用户")
     action_type = models.CharField(max_length=100, verbose_name="操作类型")
     details = models.TextField(null=True, blank=True, verbose_name="操作详情")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="操作时间")
+    # 默认取当前时间；日志经缓冲批量写入时由入队时刻显式赋值
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="操作时间")
     ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP地址")
     user_agent = models.CharField(max_length=500, null=True, blank=True, verbose_name="用户代理")
     path = models.CharField(max_length=255, null=True, blank=True, verbose_name="访问路径")
     method = models.CharField(max_length=10, null=True, blank=True, verbose_name="HTTP方法")
+    # 下载日志的结构化指标，写入时填充，统计时直接聚合，无需解析 details
+    file_type = models.CharField(max_length=10, null=True, blank=True, verbose_name="文件类型")
+    size_bytes = models.BigIntegerField(null=True, blank=True, verbose_name="下载大小(字节)")
+    file_count = models.PositiveIntegerField(null=True, blank=True, verbose_name="文件数量")
+    product_ids = models.TextField(null=True, blank=True, verbose_name="产品ID列表", help_text="产品ID列表，用逗号分隔")
+
+    # 计入下载统计的操作类型
+    DOWNLOAD_ACTIONS = ('download', 'batch_download', 'single_download')
 
     class Meta:
         verbose_name = "操作日志"
         verbose_name_plural = "操作日志"
         ordering = ['-timestamp']
+        indexes = [
+            # 日志列表按 (timestamp, id) 游标分页
+            models.Index(fields=['timestamp', 'id']),
+            # 下载统计按操作类型 + 时间范围过滤
+            models.Index(fields=['action_type', 'timestamp']),
+        ]
 
     def __str__(self):
         return f"{self.timestamp}: {self.user or '匿名'} - {self.action_type}"
 
+    def get_product_ids(self):
+        """产品ID列表"""
+        if not self.product_ids:
+            return []
+        return [int(pid) for pid in self.product_ids.split(',') if pid.strip().isdigit()]
+
+    @property
+    def size_mb(self):
+        """下载大小（MB），未记录时为 None"""
+        if self.size_bytes is None:
+            return None
+        return self.size_bytes / (1024 * 1024)
+
+
+class DownloadDailyStat(models.Model):
+    """下载统计日汇总（按 日期 + 用户 + 文件类型），下载日志写入时同步累加"""
+    date = models.DateField(verbose_name="日期")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='download_daily_stats', verbose_name="用户")
+    file_type = models.CharField(max_length=10, blank=True, default='', verbose_name="文件类型")
+    download_count = models.PositiveIntegerField(default=0, verbose_name="下载次数")
+    file_count = models.PositiveIntegerField(default=0, verbose_name="文件数量")
+    size_bytes = models.BigIntegerField(default=0, verbose_name="下载大小(字节)")
+    last_download = models.DateTimeField(null=True, blank=True, verbose_name="最后下载时间")
+
+    class Meta:
+        verbose_name = "下载日汇总"
+        verbose_name_plural = "下载日汇总"
+        ordering = ['-date']
+        unique_together = [['date', 'user', 'file_type']]
+
+    def __str__(self):
+        return f"{self.date} {self.user.username} {self.file_type}: {self.download_count}"
+
+
+class MediaFile(models.Model):
+    """媒体文件元数据索引（MEDIA_ROOT 下的 PDF、STEP、BMP 文件），由文件同步写入"""
+    path = models.CharField(max_length=500, unique=True, verbose_name="相对路径", help_text="相对 MEDIA_ROOT 的路径，使用 / 分隔")
+    file_type = models.CharField(max_length=10, verbose_name="文件类型")
+    size_bytes = models.BigIntegerField(verbose_name="文件大小(字节)")
+    mtime = models.FloatField(verbose_name="修改时间", help_text="文件系统修改时间（Unix 时间戳）")
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="内容哈希", help_text="SHA-256")
+    matched = models.BooleanField(default=False, verbose_name="已匹配产品", help_text="文件名是否匹配到产品图号")
+    indexed_at = models.DateTimeField(default=timezone.now, verbose_name="索引时间")
+
+    class Meta:
+        verbose_name = "媒体文件索引"
+        verbose_name_plural = "媒体文件索引"
+        ordering = ['path']
+
+    def __str__(self):
+        return self.path
+
+
+class MediaDirectory(models.Model):
+    """媒体目录快照，增量同步时按目录修改时间判断目录内容是否变化"""
+    path = models.CharField(max_length=500, unique=True, blank=True, verbose_name="相对路径", help_text="相对 MEDIA_ROOT 的路径，使用 / 分隔，根目录为空")
+    mtime = models.FloatField(verbose_name="修改时间", help_text="目录修改时间（Unix 时间戳）")
+    scanned_at = models.FloatField(verbose_name="扫描时间", help_text="最后一次列出目录内容的时间（Unix 时间戳）")
+
+    class Meta:
+        verbose_name = "媒体目录快照"
+        verbose_name_plural = "媒体目录快照"
+        ordering = ['path']
+
+    def __str__(self):
+        return self.path or '/'
+
 
 class UserProfile(models.Model):
     """用户配置模型，用于存储用户的额外配置信息"""
@@ -779,6 +861,10 @@ class CompressionTask(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     error_message = models.TextField(blank=True, null=True, help_text="错误信息")
     user_id = models.IntegerField(blank=True, null=True, help_text="发起任务的用户ID")
+    total_bytes = models.BigIntegerField(default=0, help_text="待压缩文件总字节数，调度时小任务优先")
+    started_at = models.DateTimeField(blank=True, null=True, help_text="开始执行时间")
+    worker = models.CharField(max_length=100, blank=True, default='', help_text="执行任务的调度器（主机名:进程号:启动标识）")
+    heartbeat_at = models.DateTimeField(blank=True, null=True, help_text="执行中任务的最近心跳时间，超时未更新视为执行进程已退出")
 
     def __str__(self):
         return f"CompressionTask {self.task_id} - {self.status}"
@@ -787,4 +873,75 @@ class CompressionTask(models.Model):
         verbose_name = "压缩任务"
         verbose_name_plural = "压缩任务"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
 
+class FileSyncJob(models.Model):
+    """文件同步任务模型：后台执行的文件同步及其进度和结果"""
+    # 超过该时间没有更新的进行中任务视为已中断（如服务重启），允许重新发起同步
+    STALE_AFTER = timedelta(hours=1)
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    full = models.BooleanField(default=False, verbose_name="全量扫描")
+    status = models.CharField(max_length=20, choices=[(status.value, status.name) for status in CompressionStatus], default=CompressionStatus.PENDING.value)
+    message = models.TextField(blank=True, default='', help_text="进度或结果信息")
+    dirs_scanned = models.IntegerField(default=0, help_text="已扫描目录数")
+    files_found = models.IntegerField(default=0, help_text="已发现文件数")
+    updated_count = models.IntegerField(default=0, help_text="更新产品记录数")
+    unmatched_count = models.IntegerField(default=0, help_text="未匹配文件数")
+    error_message = models.TextField(blank=True, null=True, help_text="错误信息")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='file_sync_jobs', verbose_name="发起用户")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"FileSyncJob {self.job_id} - {self.status}"
+
+    @property
+    def is_active(self):
+        """任务是否仍在进行（等待或执行中，且没有长时间停止更新）"""
+        return (self.status in (CompressionStatus.PENDING.value, CompressionStatus.PROCESSING.value)
+                and self.updated_at > timezone.now() - self.STALE_AFTER)
+
+    @property
+    def duration(self):
+        """执行耗时（秒），未开始时为 None"""
+        if not self.started_at:
+            return None
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    @classmethod
+    def active_job(cls):
+        """当前正在进行的同步任务，没有时返回 None"""
+        return cls.objects.filter(
+            status__in=[CompressionStatus.PENDING.value, CompressionStatus.PROCESSING.value],
+            updated_at__gt=timezone.now() - cls.STALE_AFTER,
+        ).first()
+
+    def to_dict(self):
+        duration = self.duration
+        return {
+            'job_id': str(self.job_id),
+            'full': self.full,
+            'status': self.status,
+            'message': self.message,
+            'dirs_scanned': self.dirs_scanned,
+            'files_found': self.files_found,
+            'updated_count': self.updated_count,
+            'unmatched_count': self.unmatched_count,
+            'error_message': self.error_message,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration': round(duration, 2) if duration is not None else None,
+            'is_active': self.is_active,
+        }
+
+    class Meta:
+        verbose_name = "文件同步任务"
+        verbose_name_plural = "文件同步任务"
+        ordering = ['-created_at']
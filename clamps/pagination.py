@@ -0,0 +1,128 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+游标（keyset）分页
+按 (排序字段, id) 定位，翻页使用 WHERE 条件代替 OFFSET，任意深度的页面耗时恒定。
+游标是对最后/第一条记录 (排序值, id) 的 base64 编码，对用户不透明。
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(value, pk):
+    """将 (排序值, id) 编码为游标字符串"""
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    payload = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, value_type=datetime):
+    """解析游标字符串，无效时返回 None。
+    value_type 为排序字段值的类型：游标由用户提交，排序值和 id 的类型不符时同样视为无效，
+    不会在构造查询时才报错"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+    except (ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(value, value_type) or isinstance(value, bool):
+        return None
+    if not isinstance(pk, int) or isinstance(pk, bool):
+        return None
+    return value, pk
+
+
+class KeysetPage:
+    """游标分页的一页，提供与 Page 相同的迭代和前后页判断接口"""
+
+    def __init__(self, object_list, field, has_next, has_previous):
+        self.object_list = object_list
+        self.field = field
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.object_list:
+            return ''
+        last = self.object_list[-1]
+        return encode_cursor(getattr(last, self.field), last.pk)
+
+    @property
+    def previous_cursor(self):
+        if not self.object_list:
+            return ''
+        first = self.object_list[0]
+        return encode_cursor(getattr(first, self.field), first.pk)
+
+
+def keyset_page(queryset, field, per_page, after=None, before=None):
+    """按 (field, id) 降序取一页。
+    after: 取该游标之后（更旧）的记录；before: 取该游标之前（更新）的记录"""
+    if before is not None:
+        value, pk = before
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            .order_by(field, 'pk')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        return KeysetPage(rows, field, has_next=True, has_previous=has_previous)
+
+    if after is not None:
+        value, pk = after
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+    rows = list(queryset.order_by(f'-{field}', '-pk')[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], field, has_next=has_next, has_previous=after is not None)
+
+
+class CountedPaginator(Paginator):
+    """使用外部（缓存的）总数的分页器，避免每次请求都执行 COUNT(*)"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @cached_property
+    def count(self):
+        return self._known_count
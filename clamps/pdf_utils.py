@@ -12,23 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import io
+import logging
+import math
+import re
+import shutil
+import threading
+from collections import OrderedDict
 from reportlab.lib.colors import Color
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject,
+    NameObject, NumberObject, RectangleObject, StreamObject,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class PDFProcessor:
     """PDF处理工具类，提供水印添加等功能"""
     
+    # 水印页缓存：(水印文本, 页面几何) -> 解析后的水印页，按最近使用淘汰
+    # 页面几何为 (左下角x, 左下角y, 宽, 高, 旋转角度)，同一几何的页面共用一个水印页
+    # 水印文本精确到秒，同一批次内的文件和并发请求大多可以复用
+    OVERLAY_CACHE_SIZE = 64
+    _overlay_cache = OrderedDict()
+    _overlay_cache_lock = threading.Lock()
+    
+    # 加水印方式：rewrite 重写整个文档；incremental 以增量更新方式追加到原文件之后，
+    # 输出文件开头即原文件，截断或查看历史版本可以得到不带水印的原文件，仅在明确需要时使用
+    WATERMARK_MODES = ('incremental', 'rewrite')
+    DEFAULT_WATERMARK_MODE = 'rewrite'
+    
     @staticmethod
-    def create_watermark(watermark_text, output_path):
-        """创建水印PDF文件，支持文件路径或BytesIO对象"""
-        # 将页面尺寸设置为A4横向
+    def create_watermark(watermark_text, output_path, pagesize=None, rotation=0, origin=(0, 0)):
+        """创建水印PDF文件，支持文件路径或BytesIO对象；默认页面尺寸为A4横向。
+        rotation 为目标页面的 /Rotate，origin 为目标页面 mediabox 的左下角坐标"""
         pagesize_landscape_a4 = landscape(A4)
-        c = canvas.Canvas(output_path, pagesize=pagesize_landscape_a4)
+        page_width, page_height = pagesize or pagesize_landscape_a4
+        c = canvas.Canvas(output_path, pagesize=(page_width, page_height))
 
         # 水印内容拆分为两行
         # 假设 watermark_text 格式为 "For Reference Only[OBARA] {username} {datetime}"
@@ -43,15 +69,17 @@ class PDFProcessor:
             line2 = ''
 
         # 调整字体大小和透明度
-        font_size = 18  # 调整字体大小以合理填充纸张，减小
+        # A3、A1 等大幅面图纸按短边相对A4等比放大字号，水印在整页上的疏密与A4一致
+        scale = max(1.0, min(page_width, page_height) / min(pagesize_landscape_a4))
+        font_size = 18 * scale  # 调整字体大小以合理填充纸张，减小
         c.setFillColor(Color(1, 0, 0, alpha=0.3))  # 红色，颜色改为红色
         c.setFont("Helvetica-Bold", font_size)
 
         # 旋转水印
-        c.rotate(30)  # 调整旋转角度
-
-        # 获取页面尺寸
-        page_width, page_height = pagesize_landscape_a4
+        # 页面显示时按 /Rotate 顺时针旋转，水印预先逆时针多转相同角度，显示效果与未旋转页面一致
+        c.translate(*origin)
+        angle = 30 + rotation % 360
+        c.rotate(angle)  # 调整旋转角度
 
         # 计算水印的重复间隔和起始位置
         # 假设每行水印的宽度和高度
@@ -62,36 +90,317 @@ class PDFProcessor:
 
         # 调整循环范围和步长，使水印合理填充整个纸张
         # 增加水印密度，调整x和y的步长
-        x_step = max_line_width * 1.5  # 调整x方向的步长
-        y_step = line_height * 4.5  # 调整y方向的步长
+        x_step = int(max_line_width * 1.5)  # 调整x方向的步长
+        y_step = int(line_height * 4.5)  # 调整y方向的步长
 
         # 调整起始位置，确保水印覆盖整个页面
-        start_x = -page_width / 2
-        start_y = -page_height / 2
+        start_x = int(-page_width / 2)
+        start_y = int(-page_height / 2)
+
+        # 页面四角换算到旋转后的坐标系，只绘制与页面相交的水印
+        cos_a, sin_a = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        corners = [(0, 0), (page_width, 0), (0, page_height), (page_width, page_height)]
+        xs = [px * cos_a + py * sin_a for px, py in corners]
+        ys = [py * cos_a - px * sin_a for px, py in corners]
+        first_x = start_x + math.floor((min(xs) - max_line_width - start_x) / x_step) * x_step
+        first_y = start_y + math.floor((min(ys) - start_y) / y_step) * y_step
 
-        for x in range(int(start_x), int(page_width * 1.5), int(x_step)):
-            for y in range(int(start_y), int(page_height * 1.5), int(y_step)):
+        for x in range(first_x, int(max(xs)) + 1, x_step):
+            for y in range(first_y, int(max(ys) + line_height + font_size) + 1, y_step):
                 c.drawString(x, y, line1)
                 c.drawString(x, y - line_height, line2)  # 第二行在第一行下方
 
         c.save()
 
     @staticmethod
-    def add_watermark(input_pdf_path, output_pdf_path, watermark_text):
-        """为PDF文件添加水印"""
+    def _resolve_objects(obj, seen=None):
+        """递归解析对象中的间接引用"""
+        seen = set() if seen is None else seen
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in seen:
+                return
+            seen.add(obj.idnum)
+            obj = obj.get_object()
+        if isinstance(obj, dict):
+            for value in obj.values():
+                PDFProcessor._resolve_objects(value, seen)
+        elif isinstance(obj, list):
+            for value in obj:
+                PDFProcessor._resolve_objects(value, seen)
+
+    @staticmethod
+    def page_geometry(page):
+        """页面几何：(左下角x, 左下角y, 宽, 高, 旋转角度)，按 mediabox 和 /Rotate 计算"""
+        box = page.mediabox
+        return (
+            round(float(box.left), 2), round(float(box.bottom), 2),
+            round(float(box.width), 2), round(float(box.height), 2),
+            (page.rotation or 0) % 360,
+        )
+
+    @classmethod
+    def get_watermark_page(cls, watermark_text, geometry=None):
+        """获取与页面几何匹配的解析后水印页，优先使用缓存；geometry 默认为A4横向"""
+        geometry = geometry or (0, 0) + tuple(landscape(A4)) + (0,)
+        key = (watermark_text,) + tuple(geometry)
+        with cls._overlay_cache_lock:
+            watermark_page = cls._overlay_cache.get(key)
+            if watermark_page is not None:
+                cls._overlay_cache.move_to_end(key)
+                return watermark_page
+        
+        left, bottom, width, height, rotation = geometry
         watermark_buffer = io.BytesIO()
-        PDFProcessor.create_watermark(watermark_text, watermark_buffer)
+        cls.create_watermark(watermark_text, watermark_buffer, pagesize=(width, height),
+                             rotation=rotation, origin=(left, bottom))
         watermark_buffer.seek(0)
-        watermark_pdf = PdfReader(watermark_buffer)
-        watermark_page = watermark_pdf.pages[0]
-        reader = PdfReader(input_pdf_path)
+        watermark_page = PdfReader(watermark_buffer).pages[0]
+        # 合并时按水印页的页面框裁剪，页面框与目标页面的 mediabox 保持一致
+        if left or bottom:
+            watermark_page.mediabox = RectangleObject([left, bottom, left + width, bottom + height])
+        # 预先解析页面引用的全部间接对象（读取器会缓存），
+        # 之后多个线程共用该页时不会再并发读取底层数据流
+        PDFProcessor._resolve_objects(watermark_page)
+        
+        with cls._overlay_cache_lock:
+            cls._overlay_cache[key] = watermark_page
+            cls._overlay_cache.move_to_end(key)
+            while len(cls._overlay_cache) > cls.OVERLAY_CACHE_SIZE:
+                cls._overlay_cache.popitem(last=False)
+        return watermark_page
+
+    @staticmethod
+    def _copy_object(obj, numbers, queue):
+        """复制水印页中的对象，其中的间接引用换成增量更新中新分配的对象号"""
+        if isinstance(obj, IndirectObject):
+            # 不同几何的水印页来自不同的读取器，对象号可能相同
+            key = (id(obj.pdf), obj.idnum)
+            if key not in numbers:
+                numbers[key] = numbers['next']
+                numbers['next'] += 1
+                queue.append((numbers[key], obj.get_object()))
+            return IndirectObject(numbers[key], 0, None)
+        if isinstance(obj, StreamObject):
+            stream = obj.__class__()
+            stream.update({key: PDFProcessor._copy_object(value, numbers, queue) for key, value in obj.items()})
+            stream._data = obj._data
+            return stream
+        if isinstance(obj, dict):
+            return DictionaryObject({key: PDFProcessor._copy_object(value, numbers, queue) for key, value in obj.items()})
+        if isinstance(obj, list):
+            return ArrayObject([PDFProcessor._copy_object(value, numbers, queue) for value in obj])
+        return obj
+
+    @staticmethod
+    def _find_startxref(source, file_size):
+        """读取文件末尾 startxref 指向的交叉引用位置，返回 (位置, 是否为交叉引用流)"""
+        source.seek(max(0, file_size - 1024))
+        tail = source.read()
+        index = tail.rfind(b'startxref')
+        if index < 0:
+            raise ValueError('找不到 startxref')
+        startxref = int(tail[index + len(b'startxref'):].split()[0])
+        source.seek(startxref)
+        head = source.read(32)
+        if head.startswith(b'xref'):
+            return startxref, False
+        if re.match(rb'\d+\s+\d+\s+obj', head):
+            return startxref, True
+        raise ValueError('startxref 指向的位置不是交叉引用')
+
+    @classmethod
+    def _incremental_update(cls, reader, source, watermark_text):
+        """生成加水印的增量更新数据（追加在原文件之后）：
+        每种页面几何一个水印 Form XObject，每页写入新版本的页面对象，内容改为
+        [q, 原内容..., Q 绘制水印]，最后是新的交叉引用和 trailer，原有对象保持不变"""
+        if reader.is_encrypted:
+            raise ValueError('加密文档不支持增量更新')
+        file_size = source.seek(0, io.SEEK_END)
+        startxref, xref_stream = cls._find_startxref(source, file_size)
+        trailer = reader.trailer
+
+        # 交叉引用流的字典里 /Size 不会保留到 trailer 中，按已读取的对象号推算
+        used = [number for entries in reader.xref.values() for number in entries] + list(reader.xref_objStm)
+        numbers = {'next': max([int(trailer.get('/Size', 0))] + [number + 1 for number in used])}
+        objects = []  # [(对象号, 代数, 对象)]
+
+        def add_object(obj):
+            number = numbers['next']
+            numbers['next'] += 1
+            objects.append((number, 0, obj))
+            return IndirectObject(number, 0, None)
+
+        begin = DecodedStreamObject()
+        begin.set_data(b'q\n')
+        begin_ref = add_object(begin)
+
+        # 页面几何 -> (XObject名称, 结束内容流引用)
+        watermarks = {}
+        for page in reader.pages:
+            page_ref = page.indirect_reference
+            if page_ref is None:
+                raise ValueError('页面不是间接对象')
+            geometry = cls.page_geometry(page)
+            if geometry not in watermarks:
+                watermark_page = cls.get_watermark_page(watermark_text, geometry)
+                left, bottom, width, height, _ = geometry
+                form = DecodedStreamObject()
+                form.set_data(watermark_page.get_contents().get_data())
+                form = form.flate_encode()
+                form[NameObject('/Type')] = NameObject('/XObject')
+                form[NameObject('/Subtype')] = NameObject('/Form')
+                form[NameObject('/BBox')] = ArrayObject(
+                    [FloatObject(left), FloatObject(bottom), FloatObject(left + width), FloatObject(bottom + height)]
+                )
+                queue = []
+                form[NameObject('/Resources')] = cls._copy_object(watermark_page['/Resources'], numbers, queue)
+                form_ref = add_object(form)
+                # 水印资源（字体、透明度）引用的对象一并复制
+                while queue:
+                    number, obj = queue.pop()
+                    objects.append((number, 0, cls._copy_object(obj, numbers, queue)))
+                name = NameObject(f'/OBARAWatermark{len(watermarks)}')
+                end = DecodedStreamObject()
+                end.set_data(f'Q\nq {name} Do Q\n'.encode('ascii'))
+                watermarks[geometry] = (name, form_ref, add_object(end))
+            name, form_ref, end_ref = watermarks[geometry]
+
+            contents = page.get('/Contents')
+            if isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+                contents = contents.get_object()
+            if contents is None:
+                contents = []
+            elif not isinstance(contents, ArrayObject):
+                contents = [contents]
+
+            # 资源可能是多个页面共用的对象，复制一份写在新页面对象内，不修改原对象
+            resources = DictionaryObject(page.get('/Resources', DictionaryObject()).get_object())
+            xobjects = DictionaryObject(resources.get('/XObject', DictionaryObject()).get_object())
+            xobjects[name] = form_ref
+            resources[NameObject('/XObject')] = xobjects
+
+            new_page = DictionaryObject(page)
+            new_page[NameObject('/Contents')] = ArrayObject([begin_ref] + list(contents) + [end_ref])
+            new_page[NameObject('/Resources')] = resources
+            objects.append((page_ref.idnum, page_ref.generation, new_page))
+
+        # 原文件不以换行结尾时补一个换行，偏移量从原文件末尾算起
+        source.seek(file_size - 1)
+        update = io.BytesIO()
+        if source.read(1) not in (b'\n', b'\r'):
+            update.write(b'\n')
+        offsets = {}
+        for number, generation, obj in objects:
+            offsets[number] = (file_size + update.tell(), generation)
+            update.write(f'{number} {generation} obj\n'.encode('ascii'))
+            obj.write_to_stream(update, None)
+            update.write(b'\nendobj\n')
+
+        new_trailer = DictionaryObject()
+        for key in ('/Root', '/Info', '/ID'):
+            if key in trailer:
+                new_trailer[NameObject(key)] = trailer.raw_get(key)
+        new_trailer[NameObject('/Prev')] = NumberObject(startxref)
+
+        xref_offset = file_size + update.tell()
+        if xref_stream:
+            # 原文件使用交叉引用流时，增量部分也写交叉引用流
+            xref_number = numbers['next']
+            offsets[xref_number] = (xref_offset, 0)
+            offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+            runs = cls._xref_runs(offsets)
+            data = b''.join(
+                b'\x01' + offsets[number][0].to_bytes(offset_width, 'big') + offsets[number][1].to_bytes(2, 'big')
+                for first, count in runs for number in range(first, first + count)
+            )
+            xref = DecodedStreamObject()
+            xref.set_data(data)
+            xref.update(new_trailer)
+            xref[NameObject('/Type')] = NameObject('/XRef')
+            xref[NameObject('/Size')] = NumberObject(xref_number + 1)
+            xref[NameObject('/W')] = ArrayObject([NumberObject(1), NumberObject(offset_width), NumberObject(2)])
+            xref[NameObject('/Index')] = ArrayObject([NumberObject(n) for run in runs for n in run])
+            update.write(f'{xref_number} 0 obj\n'.encode('ascii'))
+            xref.write_to_stream(update, None)
+            update.write(b'\nendobj\n')
+        else:
+            # 第0号对象（空闲链表头）单独成段，交叉引用表从0开始，兼容按首段对象号校正偏移的读取器
+            update.write(b'xref\n0 1\n0000000000 65535 f\r\n')
+            for first, count in cls._xref_runs(offsets):
+                update.write(f'{first} {count}\n'.encode('ascii'))
+                for number in range(first, first + count):
+                    offset, generation = offsets[number]
+                    update.write(f'{offset:010d} {generation:05d} n\r\n'.encode('ascii'))
+            new_trailer[NameObject('/Size')] = NumberObject(numbers['next'])
+            update.write(b'trailer\n')
+            new_trailer.write_to_stream(update, None)
+            update.write(b'\n')
+        update.write(f'startxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
+        return update.getvalue()
+
+    @staticmethod
+    def _xref_runs(offsets):
+        """把对象号分成连续的区段，返回 [(起始对象号, 个数)]"""
+        runs = []
+        for number in sorted(offsets):
+            if runs and runs[-1][0] + runs[-1][1] == number:
+                runs[-1][1] += 1
+            else:
+                runs.append([number, 1])
+        return [tuple(run) for run in runs]
+
+    @classmethod
+    def _rewrite_watermark(cls, reader, output, watermark_text):
+        """重写整个文档加水印：页面按几何（尺寸、原点、旋转）分组，每组使用一个匹配的水印页，
+        每页只做一次不带变换的合并"""
         writer = PdfWriter()
-        for i in range(len(reader.pages)):
-            page = reader.pages[i]
+        overlays = {}
+        for page in reader.pages:
+            geometry = cls.page_geometry(page)
+            watermark_page = overlays.get(geometry)
+            if watermark_page is None:
+                watermark_page = overlays[geometry] = cls.get_watermark_page(watermark_text, geometry)
             page.merge_page(watermark_page)
             writer.add_page(page)
-        with open(output_pdf_path, "wb") as output_file:
-            writer.write(output_file)
+        writer.write(output)
+
+    @classmethod
+    def _write_watermarked(cls, source, output, watermark_text, mode):
+        reader = PdfReader(source)
+        if mode == 'incremental':
+            try:
+                update = cls._incremental_update(reader, source, watermark_text)
+            except Exception as e:
+                # 加密、交叉引用损坏等情况改为重写整个文档
+                logger.warning(f"增量更新加水印失败，改为重写文档: {e}")
+            else:
+                # 原文件按块原样输出，再追加增量更新部分
+                source.seek(0)
+                shutil.copyfileobj(source, output)
+                output.write(update)
+                return
+        cls._rewrite_watermark(reader, output, watermark_text)
+
+    @classmethod
+    def add_watermark(cls, input_pdf_path, output_pdf_path, watermark_text, mode=DEFAULT_WATERMARK_MODE):
+        """为PDF文件添加水印；输入、输出可以是文件路径或文件对象。
+        mode 为 rewrite（默认）时重写整个文档；为 incremental 时以增量更新方式追加水印
+        （原文件内容不变，耗时与页数相关，但可以从输出中恢复不带水印的原文件）"""
+        with contextlib.ExitStack() as stack:
+            source = input_pdf_path
+            if not hasattr(source, 'read'):
+                source = stack.enter_context(open(input_pdf_path, 'rb'))
+            output = output_pdf_path
+            if not hasattr(output, 'write'):
+                output = stack.enter_context(open(output_pdf_path, 'wb'))
+            cls._write_watermarked(source, output, watermark_text, mode)
+
+    @staticmethod
+    def watermark_bytes(input_pdf_path, watermark_text, mode=DEFAULT_WATERMARK_MODE):
+        """为PDF文件添加水印，返回加水印后的PDF内容"""
+        output = io.BytesIO()
+        PDFProcessor.add_watermark(input_pdf_path, output, watermark_text, mode)
+        return output.getvalue()
 
     @staticmethod
     def validate_file_size(file_path, user_profile, is_batch=False):
@@ -0,0 +1,128 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+压缩任务进度上报
+每次进度变化都写入缓存（进度查询接口先读缓存，不访问数据库）；写数据库和推送 WebSocket 消息
+按时间间隔和进度步长节流：距上次写入不足 min_interval 秒或进度增加不足 min_step 时只更新缓存，
+期间的多次进度合并为下一次推送。状态变化（开始、完成、失败）总是立即写入和推送。
+数据库只更新变化的字段（update_fields）。
+"""
+
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_config():
+    """获取进度上报配置"""
+    config = {
+        'min_interval': 1.0,
+        'min_step': 5,
+        'cache_timeout': 3600,
+    }
+    config.update(getattr(settings, 'COMPRESSION_PROGRESS', {}))
+    return config
+
+
+def _cache_key(task_id):
+    return f'compression_progress:{task_id}'
+
+
+def _normalize_task_id(task_id):
+    try:
+        return str(uuid.UUID(str(task_id)))
+    except ValueError:
+        return None
+
+
+def set_progress(task_id, progress, status, message='', error_message=None):
+    """写入缓存中的任务进度"""
+    cache.set(_cache_key(task_id), {
+        'progress': progress,
+        'status': status,
+        'message': message,
+        'error_message': error_message,
+    }, get_config()['cache_timeout'])
+
+
+def get_progress(task_id):
+    """读取缓存中的任务进度，没有时返回 None"""
+    task_id = _normalize_task_id(task_id)
+    if task_id is None:
+        return None
+    return cache.get(_cache_key(task_id))
+
+
+def clear_progress(task_id):
+    cache.delete(_cache_key(task_id))
+
+
+class ProgressReporter:
+    """压缩任务进度上报：缓存每次更新，数据库写入和 WebSocket 推送按时间和步长节流"""
+
+    def __init__(self, task, min_interval=None, min_step=None):
+        config = get_config()
+        self.task = task
+        self.min_interval = config['min_interval'] if min_interval is None else min_interval
+        self.min_step = config['min_step'] if min_step is None else min_step
+        self.channel_layer = get_channel_layer()
+        self._saved_progress = task.progress
+        self._saved_at = 0.0
+
+    def update(self, progress, message='', status=None, force=False, **fields):
+        """更新进度；status 或其他字段（如 error_message）变化时立即写入数据库并推送。
+        返回本次是否写入了数据库"""
+        task = self.task
+        progress = max(0, min(100, int(progress)))
+        status_changed = status is not None and status != task.status
+        task.progress = progress
+        if status is not None:
+            task.status = status
+        for name, value in fields.items():
+            setattr(task, name, value)
+        set_progress(task.task_id, progress, task.status, message, task.error_message)
+
+        now = time.monotonic()
+        due = (progress - self._saved_progress >= self.min_step
+               and now - self._saved_at >= self.min_interval)
+        if not (force or status_changed or fields or due):
+            return False
+
+        task.save(update_fields=['progress', 'status', 'updated_at', *fields])
+        self._saved_progress = progress
+        self._saved_at = now
+        self._send(message)
+        return True
+
+    def _send(self, message):
+        # 尝试发送进度更新，处理Redis连接失败情况
+        try:
+            async_to_sync(self.channel_layer.group_send)(
+                f'compression_{self.task.user_id}',
+                {
+                    'type': 'compression_update',
+                    'task_id': str(self.task.task_id),
+                    'progress': self.task.progress,
+                    'status': self.task.status,
+                    'message': message
+                }
+            )
+        except Exception:
+            # WebSocket通知失败，继续执行压缩任务
+            pass
@@ -0,0 +1,87 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+搜索结果缓存
+缓存键由规范化后的查询参数计算 SHA-256 摘要得到，与参数顺序和进程无关；
+键中带有产品目录版本号，导入或同步后旧条目不再命中。
+缓存内容为排序后的产品ID数组（array('I')）和总数，与页码无关，
+任意页都由切片 + in_bulk 取回，翻页不会重新执行过滤。
+"""
+
+import hashlib
+import json
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalog import get_catalog_version
+
+# 不影响结果集的参数（页码只影响切片位置）
+IGNORED_PARAMS = ('csrfmiddlewaretoken', 'ide_webview_request_time', 'page')
+# 排序参数的默认值，省略时与显式传入默认值视为同一查询
+DEFAULT_SORT = {'sort_by': 'drawing_no_1', 'sort_dir': 'asc'}
+
+
+def get_config():
+    """获取缓存配置"""
+    return {
+        'timeout': getattr(settings, 'SEARCH_CACHE_TIMEOUT', 86400),
+    }
+
+
+def normalize_query(query_params):
+    """规范化查询参数：去掉无关参数和空值（搜索时会被忽略），按键排序"""
+    normalized = dict(DEFAULT_SORT)
+    for key in query_params:
+        # 与搜索视图一致，同名参数只取最后一个值
+        value = query_params.get(key)
+        if key not in IGNORED_PARAMS and value:
+            normalized[key] = value
+    if normalized['sort_dir'] != 'desc':
+        normalized['sort_dir'] = 'asc'
+    return sorted(normalized.items())
+
+
+def search_cache_key(query_params, version=None, prefix='search_results'):
+    """计算搜索结果缓存键"""
+    if version is None:
+        version = get_catalog_version()
+    payload = json.dumps(normalize_query(query_params), ensure_ascii=False, separators=(',', ':'))
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f'{prefix}_v{version}_{digest}'
+
+
+def pack_ids(product_ids):
+    """产品ID列表压缩为数组，超出32位范围时改用64位"""
+    try:
+        return array('I', product_ids)
+    except OverflowError:
+        return array('Q', product_ids)
+
+
+def get_cached_ids(cache_key):
+    """读取缓存的产品ID数组，未命中返回 None"""
+    cached = cache.get(cache_key)
+    if cached is None:
+        return None
+    return cached['ids']
+
+
+def set_cached_ids(cache_key, product_ids):
+    """缓存排序后的产品ID数组和总数，返回压缩后的数组"""
+    ids = pack_ids(product_ids)
+    cache.set(cache_key, {'ids': ids, 'total': len(ids)}, timeout=get_config()['timeout'])
+    return ids
@@ -0,0 +1,572 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+产品搜索内存索引
+将 Product 表加载为列式快照：分类字段使用位图倒排表，数值字段使用有序数组，
+描述和图号使用 n-gram 全文倒排索引，
+搜索时在内存中做位运算求交集，只按主键取回当前页的记录。
+无法由索引表达的查询返回 None，由调用方回退到 ORM 查询。
+快照与产品目录版本号绑定，版本变化后在下一次搜索时重建。
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import models
+
+from .catalog import get_catalog_version
+from .models import Category, Product
+
+logger = logging.getLogger('clamps')
+
+# 文本字段（n-gram 倒排索引做子串匹配）
+TEXT_FIELDS = ('description', 'drawing_no_1')
+# 候选记录超过总数的该比例时，直接扫描拼接文本比逐条校验更快
+TEXT_SCAN_RATIO = 16
+# 最多参与求交集的倒排表个数，以及停止求交集的候选数
+TEXT_MAX_INTERSECT = 4
+TEXT_VERIFY_LIMIT = 32
+# 不参与索引的字符型字段（文件路径基数过高，且搜索表单不会使用）
+EXCLUDED_FIELDS = ('pdf_file_path', 'step_file_path', 'bmp_file_path')
+# 数值列按块预计算位图的块数，行数较少时不分块
+NUMERIC_CHUNKS = 32
+MIN_CHUNKED_ROWS = 4096
+
+# search_results_base 中已单独处理、不走动态字段逻辑的参数
+HANDLED_PARAMS = (
+    "category", "description", "drawing_no_1", "sub_category_type",
+    "stroke", "clamping_force", "weight", "throat_depth", "throat_width",
+    "transformer", "electrode_arm_end", "motor_manufacturer", "has_balance",
+    "transformer_placement", "flange_pcd", "bracket_direction", "water_circuit",
+    "page", "csrfmiddlewaretoken", "ide_webview_request_time",
+)
+RANGE_PARAMS = ('stroke', 'clamping_force', 'weight', 'throat_depth', 'throat_width')
+# 排序参数 -> 实际排序字段。category 按分类 id 排序：内存索引与数据库回退共用此映射，
+# 结果不受 Category 默认排序（Meta.ordering）变化的影响
+SORT_FIELDS = {'category': 'category_id'}
+ICONTAINS_PARAMS = (
+    'transformer', 'electrode_arm_end', 'motor_manufacturer', 'gearbox_type',
+    'transformer_placement', 'flange_pcd', 'bracket_direction', 'water_circuit',
+)
+
+# 每个字节值中被置位的比特位置，用于位图转位置列表
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+_NONZERO_BYTES = re.compile(rb'[^\x00]+')
+
+
+def _numeric_fields():
+    return [f.name for f in Product._meta.concrete_fields if isinstance(f, models.FloatField)]
+
+
+def _categorical_fields():
+    return [
+        f.name for f in Product._meta.concrete_fields
+        if isinstance(f, models.CharField)
+        and f.name not in TEXT_FIELDS and f.name not in EXCLUDED_FIELDS
+    ]
+
+
+def parse_range(query_string):
+    """解析 "a~b" / "a~" / "~b" / 精确值，返回 (下限, 上限)，规则与 build_range_q 一致"""
+    low = high = None
+    if not query_string:
+        return low, high
+    query_string = query_string.strip()
+    if '~' in query_string:
+        parts = query_string.split('~')
+        try:
+            low = float(parts[0].strip()) if parts[0].strip() else None
+        except ValueError:
+            pass  # 忽略无效的最小值
+        try:
+            high = float(parts[1].strip()) if parts[1].strip() else None
+        except ValueError:
+            pass  # 忽略无效的最大值
+    else:
+        try:
+            low = high = float(query_string)
+        except ValueError:
+            pass  # 忽略无效的精确值
+    return low, high
+
+
+def bits_from_positions(positions, nbytes):
+    """位置序列转位图（Python 整数）"""
+    buf = bytearray(nbytes)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def positions_from_bits(bits, nbytes):
+    """位图转升序位置列表，跳过全零字节"""
+    if not bits:
+        return []
+    data = bits.to_bytes(nbytes, 'little')
+    positions = []
+    append = positions.append
+    for match in _NONZERO_BYTES.finditer(data):
+        start = match.start()
+        for offset, byte in enumerate(match.group()):
+            base = (start + offset) << 3
+            for i in _BYTE_BITS[byte]:
+                append(base + i)
+    return positions
+
+
+class _NumericColumn:
+    """数值列：原始值 + 升序位置数组 + 分块位图"""
+
+    __slots__ = ('values', 'sorted_values', 'order', 'chunk_size', 'chunk_bits')
+
+    def __init__(self, values, nbytes):
+        self.values = values
+        present = [pos for pos, value in enumerate(values) if not math.isnan(value)]
+        present.sort(key=values.__getitem__)
+        self.order = array('I', present)
+        self.sorted_values = array('d', (values[pos] for pos in present))
+        self.chunk_bits = []
+        self.chunk_size = 0
+        if len(present) >= MIN_CHUNKED_ROWS:
+            self.chunk_size = -(-len(present) // NUMERIC_CHUNKS)
+            for start in range(0, len(present), self.chunk_size):
+                self.chunk_bits.append(
+                    bits_from_positions(self.order[start:start + self.chunk_size], nbytes))
+
+    def range_bits(self, low, high, nbytes):
+        """闭区间 [low, high] 的位图，边界为 None 表示不限"""
+        i = 0 if low is None else bisect_left(self.sorted_values, low)
+        j = len(self.sorted_values) if high is None else bisect_right(self.sorted_values, high)
+        if i >= j:
+            return 0
+        size = self.chunk_size
+        if not size:
+            return bits_from_positions(self.order[i:j], nbytes)
+        first = -(-i // size)
+        last = j // size
+        if first >= last:
+            return bits_from_positions(self.order[i:j], nbytes)
+        # 完整覆盖的块直接合并预计算位图，只有首尾零散部分逐条置位
+        bits = bits_from_positions(self.order[i:first * size], nbytes)
+        bits |= bits_from_positions(self.order[last * size:j], nbytes)
+        for chunk in range(first, last):
+            bits |= self.chunk_bits[chunk]
+        return bits
+
+
+class _TextColumn:
+    """文本列全文索引：二元组/三元组（n-gram）倒排表，不依赖分词，适用于中文描述和图号。
+    所有文本转小写后以 \x00 拼接成一个字符串，记录各条的起始偏移；
+    查询时对关键词中最稀有的几个 n-gram 倒排表求交集作为候选，再在拼接文本上校验子串。
+    单字或常见短词候选过多时，改为在拼接文本上直接 str.find 扫描"""
+
+    __slots__ = ('size', 'blob', 'starts', 'grams')
+
+    def __init__(self, values):
+        texts = [(value or '').lower() for value in values]
+        self.size = len(texts)
+        self.starts = array('q')
+        offset = 0
+        grams = {}
+        for pos, text in enumerate(texts):
+            self.starts.append(offset)
+            offset += len(text) + 1
+            # 同时收录二元组和三元组：二元组用于两字查询，三元组选择性更高
+            for gram in {text[i:i + n] for n in (2, 3) for i in range(len(text) - n + 1)}:
+                posting = grams.get(gram)
+                if posting is None:
+                    grams[gram] = posting = array('I')
+                posting.append(pos)
+        self.starts.append(offset)
+        self.blob = '\x00'.join(texts)
+        self.grams = grams
+
+    def matches(self, needle):
+        """返回包含子串 needle 的记录位置（needle 已转小写）"""
+        if not needle or '\x00' in needle:
+            return ()
+        if len(needle) >= 2:
+            n = 2 if len(needle) == 2 else 3
+            postings = []
+            for i in range(len(needle) - n + 1):
+                posting = self.grams.get(needle[i:i + n])
+                if posting is None:
+                    return ()
+                postings.append(posting)
+            postings.sort(key=len)
+            if len(postings[0]) * TEXT_SCAN_RATIO <= self.size:
+                if len(needle) == n:
+                    return postings[0]
+                # 依次与较稀有的倒排表求交集，候选足够少时停止，剩余交给子串校验
+                candidates = set(postings[0])
+                for posting in postings[1:TEXT_MAX_INTERSECT]:
+                    if len(candidates) <= TEXT_VERIFY_LIMIT:
+                        break
+                    candidates.intersection_update(posting)
+                starts, find = self.starts, self.blob.find
+                return [pos for pos in candidates if find(needle, starts[pos], starts[pos + 1] - 1) != -1]
+        return self._scan(needle)
+
+    def _scan(self, needle):
+        blob, starts = self.blob, self.starts
+        positions = []
+        i = blob.find(needle)
+        while i != -1:
+            pos = bisect_right(starts, i) - 1
+            positions.append(pos)
+            # 同一记录只需命中一次，直接跳到下一条记录继续查找
+            i = blob.find(needle, starts[pos + 1]) if pos + 1 < self.size else -1
+        return positions
+
+
+def sort_field(sort_by):
+    """排序参数对应的排序字段"""
+    return SORT_FIELDS.get(sort_by, sort_by)
+
+
+class ProductSearchIndex:
+    """Product 列式内存快照"""
+
+    def __init__(self, rows, category_names):
+        self.numeric_fields = _numeric_fields()
+        self.categorical_fields = _categorical_fields()
+        fields = ['id', 'category_id', *TEXT_FIELDS, *self.categorical_fields, *self.numeric_fields]
+
+        columns = {name: [] for name in fields}
+        for row in rows:
+            for name, value in zip(fields, row):
+                columns[name].append(value)
+
+        self.size = len(columns['id'])
+        self.nbytes = (self.size + 7) // 8
+        self.built_at = time.time()
+        self.version = None
+        self.ids = array('q', columns['id'])
+        self.columns = {name: columns[name] for name in ('category_id', *TEXT_FIELDS, *self.categorical_fields)}
+
+        # 分类：名称 -> id，category 参数既可能是 id 也可能是名称
+        self.category_ids = {name: pk for pk, name in category_names}
+        self.category_bits = self._postings(columns['category_id'])
+
+        # 文本字段：n-gram 倒排索引 + 拼接文本，匹配语义与 SQLite 的 LIKE 一致
+        self.text = {name: _TextColumn(columns[name]) for name in TEXT_FIELDS}
+
+        # 分类字段：取值 -> 位图
+        self.postings = {name: self._postings(columns[name]) for name in self.categorical_fields}
+        self.postings_lower = {
+            name: [(value.lower(), bits) for value, bits in postings.items() if value]
+            for name, postings in self.postings.items()
+        }
+
+        # 数值字段：NULL 记为 NaN
+        self.numeric = {}
+        for name in self.numeric_fields:
+            values = array('d', (math.nan if value is None else value for value in columns[name]))
+            self.numeric[name] = _NumericColumn(values, self.nbytes)
+
+        self._orders = {}
+        self._ranks = {}
+
+    @classmethod
+    def build(cls):
+        """从数据库加载快照"""
+        fields = ['id', 'category_id', *TEXT_FIELDS, *_categorical_fields(), *_numeric_fields()]
+        rows = Product.objects.order_by('id').values_list(*fields).iterator(chunk_size=5000)
+        category_names = Category.objects.values_list('id', 'name')
+        return cls(rows, category_names)
+
+    def _postings(self, values):
+        positions = {}
+        for pos, value in enumerate(values):
+            if value is not None:
+                positions.setdefault(value, []).append(pos)
+        return {value: bits_from_positions(plist, self.nbytes) for value, plist in positions.items()}
+
+    # ---------- 过滤 ----------
+
+    def contains_bits(self, field, needle):
+        """分类字段 icontains：合并所有包含子串的取值的位图"""
+        needle = needle.lower()
+        bits = 0
+        for value, value_bits in self.postings_lower[field]:
+            if needle in value:
+                bits |= value_bits
+        return bits
+
+    def text_bits(self, field, needles):
+        """文本字段：任一关键词为子串即命中（OR 语义）"""
+        column = self.text[field]
+        buf = bytearray(self.nbytes)
+        for needle in {needle.lower() for needle in needles}:
+            for pos in column.matches(needle):
+                buf[pos >> 3] |= 1 << (pos & 7)
+        return int.from_bytes(buf, 'little')
+
+    def filter_clauses(self, query_params):
+        """按 search_results_base 的语义计算各参数的命中位图，返回 {参数名: 位图}。
+        各条件之间为 AND 关系；返回 None 表示索引无法表达该查询"""
+        clauses = {}
+
+        def narrow(key, value_bits):
+            clauses[key] = clauses[key] & value_bits if key in clauses else value_bits
+
+        category = query_params.get('category')
+        if category:
+            try:
+                category_id = int(category)
+            except ValueError:
+                category_id = self.category_ids.get(category)
+            narrow('category', self.category_bits.get(category_id, 0))
+
+        description = query_params.get('description')
+        if description:
+            keywords = [keyword.strip() for keyword in description.split() if keyword.strip()]
+            if keywords:
+                narrow('description', self.text_bits('description', keywords))
+
+        drawing_no_1 = query_params.get('drawing_no_1')
+        if drawing_no_1:
+            numbers = [num.strip() for num in drawing_no_1.split(',') if num.strip()]
+            if numbers:
+                narrow('drawing_no_1', self.text_bits('drawing_no_1', numbers))
+
+        sub_category_type = query_params.get('sub_category_type')
+        if sub_category_type:
+            narrow('sub_category_type', self.contains_bits('sub_category_type', sub_category_type))
+
+        for field in RANGE_PARAMS:
+            low, high = parse_range(query_params.get(field))
+            if low is not None or high is not None:
+                narrow(field, self.numeric[field].range_bits(low, high, self.nbytes))
+
+        for field in ICONTAINS_PARAMS:
+            value = query_params.get(field)
+            if value:
+                narrow(field, self.contains_bits(field, value))
+
+        has_balance = query_params.get('has_balance')
+        if has_balance:
+            # has_balance 为字符型字段，Q(has_balance=True) 实际匹配字符串 'True'
+            if has_balance in ['有', 'Yes']:
+                narrow('has_balance', self.postings['has_balance'].get('True', 0))
+            elif has_balance in ['无', 'No']:
+                narrow('has_balance', self.postings['has_balance'].get('False', 0))
+
+        # 动态字段：只支持数值字段的范围查询，其余交给 ORM
+        for key, value in query_params.items():
+            if key in HANDLED_PARAMS or not value or not hasattr(Product, key):
+                continue
+            low, high = parse_range(value)
+            if low is None and high is None:
+                continue
+            if key not in self.numeric:
+                return None
+            narrow(key, self.numeric[key].range_bits(low, high, self.nbytes))
+
+        return clauses
+
+    def filter_bits(self, query_params):
+        """计算命中位图。返回 None 表示全部命中，返回 False 表示索引无法表达该查询"""
+        clauses = self.filter_clauses(query_params)
+        if clauses is None:
+            return False
+        return self._combine(clauses)
+
+    @staticmethod
+    def _combine(clauses, exclude=None):
+        bits = None
+        for key, value_bits in clauses.items():
+            if key != exclude:
+                bits = value_bits if bits is None else bits & value_bits
+        return bits
+
+    # ---------- 排序 ----------
+
+    def _order(self, field):
+        """字段升序下的位置数组（NULL 在前，相同值按 id 升序），与 SQLite 排序一致"""
+        order = self._orders.get(field)
+        if order is None:
+            if field == 'id':
+                order = array('I', range(self.size))
+            elif field in self.numeric:
+                values = self.numeric[field].values
+                order = array('I', sorted(range(self.size), key=lambda pos: (values[pos] == values[pos], values[pos])))
+            else:
+                column = self.columns[field]
+                order = array('I', sorted(range(self.size), key=lambda pos: (column[pos] is not None, column[pos] or '')))
+            self._orders[field] = order
+        return order
+
+    def _rank(self, field):
+        rank = self._ranks.get(field)
+        if rank is None:
+            rank = array('I', bytes(4 * self.size))
+            for i, pos in enumerate(self._order(field)):
+                rank[pos] = i
+            self._ranks[field] = rank
+        return rank
+
+    def sortable(self, field):
+        return field == 'id' or field in self.numeric or field in self.columns
+
+    def search(self, query_params, sort_by='drawing_no_1', sort_dir='asc'):
+        """返回排序后的产品 id 列表；无法由索引处理时返回 None"""
+        sort_by = sort_field(sort_by)
+        if not self.sortable(sort_by):
+            return None
+        bits = self.filter_bits(query_params)
+        if bits is False:
+            return None
+
+        descending = sort_dir == 'desc'
+        if bits is None:
+            positions = self._order(sort_by)
+            if descending:
+                positions = reversed(positions)
+        else:
+            positions = positions_from_bits(bits, self.nbytes)
+            positions.sort(key=self._rank(sort_by).__getitem__, reverse=descending)
+        ids = self.ids
+        return [ids[pos] for pos in positions]
+
+
+    def facets(self, query_params, numeric_fields=RANGE_PARAMS, buckets=10):
+        """分面统计：分类字段各取值的命中数，数值字段的最小/最大值和等宽直方图。
+        每个字段的统计排除该字段自身的条件，便于用户看到可切换的其他取值；
+        返回 None 表示索引无法表达该查询"""
+        clauses = self.filter_clauses(query_params)
+        if clauses is None:
+            return None
+        all_bits = (1 << self.size) - 1
+        matched = self._combine(clauses)
+        matched = all_bits if matched is None else matched
+
+        def base_bits(key):
+            if key not in clauses:
+                return matched
+            bits = self._combine(clauses, exclude=key)
+            return all_bits if bits is None else bits
+
+        bits = base_bits('category')
+        categories = {}
+        for category_id, value_bits in self.category_bits.items():
+            count = (bits & value_bits).bit_count()
+            if count:
+                categories[category_id] = count
+
+        fields = {}
+        for field in self.categorical_fields:
+            bits = base_bits(field)
+            counts = {}
+            for value, value_bits in self.postings[field].items():
+                if value:
+                    count = (bits & value_bits).bit_count()
+                    if count:
+                        counts[value] = count
+            fields[field] = counts
+
+        numeric = {}
+        matched_positions = None
+        for field in numeric_fields:
+            column = self.numeric[field]
+            bits = base_bits(field)
+            if bits == all_bits:
+                # 无其他条件时直接使用预先排好序的数值
+                present = column.sorted_values
+            else:
+                if bits is matched:
+                    if matched_positions is None:
+                        matched_positions = positions_from_bits(matched, self.nbytes)
+                    positions = matched_positions
+                else:
+                    positions = positions_from_bits(bits, self.nbytes)
+                values = column.values
+                present = sorted(value for value in map(values.__getitem__, positions) if value == value)
+            numeric[field] = _histogram(present, buckets)
+
+        return {
+            'total': matched.bit_count(),
+            'categories': categories,
+            'fields': fields,
+            'numeric': numeric,
+        }
+
+
+def _histogram(present, buckets):
+    """已排序的非空数值的统计：数量、最小值、最大值和等宽直方图，按桶边界二分计数"""
+    if not present:
+        return {'count': 0, 'min': None, 'max': None, 'histogram': []}
+    low, high = present[0], present[-1]
+    if low == high:
+        return {'count': len(present), 'min': low, 'max': high,
+                'histogram': [{'from': low, 'to': high, 'count': len(present)}]}
+    width = (high - low) / buckets
+    edges = [low + i * width for i in range(buckets)] + [high]
+    cuts = [0] + [bisect_left(present, edge) for edge in edges[1:-1]] + [len(present)]
+    histogram = [
+        {'from': round(edges[i], 4), 'to': round(edges[i + 1], 4), 'count': cuts[i + 1] - cuts[i]}
+        for i in range(buckets)
+    ]
+    return {'count': len(present), 'min': low, 'max': high, 'histogram': histogram}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_config():
+    """获取索引配置"""
+    config = getattr(settings, 'PRODUCT_SEARCH_INDEX', {})
+    return {
+        'enabled': config.get('enabled', True),
+        'ttl': config.get('ttl', 600),
+    }
+
+
+def _is_fresh(index, version, ttl):
+    return index is not None and index.version == version and time.time() - index.built_at < ttl
+
+
+def get_product_index():
+    """获取当前进程的索引快照，目录版本变化或超过 TTL 时重建；不可用时返回 None"""
+    global _index
+    config = get_config()
+    if not config['enabled']:
+        return None
+
+    version = get_catalog_version()
+    if _is_fresh(_index, version, config['ttl']):
+        return _index
+
+    with _index_lock:
+        if _is_fresh(_index, version, config['ttl']):
+            return _index
+        try:
+            started = time.time()
+            # 先取版本号再加载数据，构建期间发生的变更会在下一次请求时触发重建
+            index = ProductSearchIndex.build()
+        except Exception:
+            logger.exception('构建产品搜索索引失败，回退到数据库查询')
+            return None
+        index.version = version
+        _index = index
+        logger.info(f'产品搜索索引已重建：{index.size} 条记录，耗时 {time.time() - started:.2f} 秒')
+        return index
@@ -12,10 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import Category, Product, UserProfile
+from .catalog import bump_catalog_version
 
 
 @receiver(post_save, sender=User)
@@ -34,4 +35,13 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """保存用户时，确保UserProfile也被保存"""
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_on_change(sender, **kwargs):
+    """产品或分类变更（如后台编辑）时递增目录版本，使搜索缓存和索引失效"""
+    bump_catalog_version()
@@ -0,0 +1,113 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+相似焊枪查询
+用内存搜索索引中的数值列构建 NumPy 矩阵（行程、加压力、重量、喉深、喉宽，按列标准化），
+对目标产品做向量化的批量距离计算，取距离最小的 top-k，可按分类和变压器过滤。
+矩阵依附于索引快照，产品目录版本变化、索引重建后随之重新生成，无需再次查询数据库。
+"""
+
+import threading
+
+import numpy as np
+
+from .search_index import get_product_index
+
+SIMILARITY_FIELDS = ('stroke', 'clamping_force', 'weight', 'throat_depth', 'throat_width')
+# 目标产品有该参数而候选产品缺失时，按 2 个标准差计入距离（平方）
+MISSING_PENALTY = 4.0
+
+
+class SimilarityEngine:
+    """标准化数值矩阵 + 暴力向量化近邻搜索"""
+
+    def __init__(self, index):
+        self.index = index
+        self.ids = np.frombuffer(index.ids, dtype=np.int64)
+        matrix = np.column_stack([
+            np.frombuffer(index.numeric[field].values, dtype=np.float64) for field in SIMILARITY_FIELDS
+        ]) if index.size else np.empty((0, len(SIMILARITY_FIELDS)))
+
+        # 按列做 z-score 标准化，使不同量纲的参数权重一致；NULL 记为缺失
+        with np.errstate(invalid='ignore'):
+            present = ~np.isnan(matrix)
+            counts = present.sum(axis=0)
+            mean = np.where(counts > 0, np.nansum(matrix, axis=0) / np.maximum(counts, 1), 0.0)
+            std = np.sqrt(np.nansum((matrix - mean) ** 2, axis=0) / np.maximum(counts, 1))
+        std[~(std > 0)] = 1.0
+        self.present = present
+        self.matrix = np.nan_to_num((matrix - mean) / std)
+        self.positions = {int(pk): pos for pos, pk in enumerate(self.ids)}
+
+    def mask(self, category=None, transformer=None):
+        """分类 / 变压器过滤条件转为布尔掩码，语义与搜索页一致；无条件时返回 None"""
+        params = {key: value for key, value in (('category', category), ('transformer', transformer)) if value}
+        if not params:
+            return None
+        bits = self.index.filter_bits(params)
+        data = np.frombuffer(bits.to_bytes(self.index.nbytes, 'little'), dtype=np.uint8)
+        return np.unpackbits(data, bitorder='little')[:self.index.size].astype(bool)
+
+    def nearest(self, product_id, k=10, mask=None):
+        """返回与产品最接近的 [(产品id, 距离)]，按距离升序；产品不在快照中时返回 None"""
+        pos = self.positions.get(product_id)
+        if pos is None:
+            return None
+        cols = np.flatnonzero(self.present[pos])
+        if not len(cols):
+            return []
+
+        # 只比较目标产品已有的参数，候选缺失的参数按固定惩罚计入
+        diff = self.matrix[:, cols] - self.matrix[pos, cols]
+        squared = np.where(self.present[:, cols], diff * diff, MISSING_PENALTY)
+        distances = np.sqrt(squared.sum(axis=1))
+        distances[pos] = np.inf
+        if mask is not None:
+            distances[~mask] = np.inf
+
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        # 距离相同时按 id 排序，保证结果稳定
+        nearest = nearest[np.lexsort((self.ids[nearest], distances[nearest]))]
+        return [(int(self.ids[i]), float(distances[i])) for i in nearest]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_similarity_engine():
+    """获取与当前索引快照对应的相似度引擎；索引不可用时返回 None"""
+    global _engine
+    index = get_product_index()
+    if index is None:
+        return None
+    engine = _engine
+    if engine is not None and engine.index is index:
+        return engine
+    with _engine_lock:
+        if _engine is None or _engine.index is not index:
+            _engine = SimilarityEngine(index)
+        return _engine
+
+
+def find_similar(product_id, k=10, category=None, transformer=None):
+    """查询相似产品，返回 [(产品id, 距离)]；索引不可用或产品不存在时返回 None"""
+    engine = get_similarity_engine()
+    if engine is None:
+        return None
+    return engine.nearest(product_id, k=k, mask=engine.mask(category=category, transformer=transformer))
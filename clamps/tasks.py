@@ -15,49 +15,79 @@
 import os
 import io
 import zipfile
-import tempfile
 import uuid
 from datetime import datetime
 from django.conf import settings
 from django.utils import timezone
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from .models import Product, CompressionTask
+from django.db import connection
+from .models import Product, CompressionTask, FileSyncJob
+from .file_sync import sync_media_files
+from .media_index import get_product_file_sizes, product_file_paths, revalidate_index
+from .watermark_pool import watermark_many
+from . import archive_cache
+from .progress import ProgressReporter, set_progress
+from .consumers import FILE_SYNC_GROUP
+
+
+def compressed_file_destination(task_id):
+    """压缩文件保存位置，返回 (完整路径, 相对项目目录的路径)"""
+    from pathlib import Path
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    compressed_files_dir = os.path.join(BASE_DIR, 'temp', 'compressed_files')
+    os.makedirs(compressed_files_dir, exist_ok=True)
+    # 生成唯一的压缩文件名
+    unique_filename = f'{task_id}_{datetime.now().strftime("%Y%m%d%H%M%S")}.zip'
+    return os.path.join(compressed_files_dir, unique_filename), f'temp/compressed_files/{unique_filename}'
+
+
+def complete_compression_task(task, relative_path, message='压缩完成，准备下载...', reporter=None):
+    """标记压缩任务完成并发送完成通知"""
+    if task._state.adding:
+        # 压缩包缓存命中时直接以完成状态创建任务，请求方从响应得知结果，不需要推送
+        task.status = 'completed'
+        task.progress = 100
+        task.compressed_file_path = relative_path
+        task.save()
+        set_progress(task.task_id, 100, 'completed', message)
+        return
+    reporter = reporter or ProgressReporter(task)
+    reporter.update(100, message, status='completed', compressed_file_path=relative_path)
 
 
 def process_compression_task(task_id):
     """处理压缩任务"""
-    channel_layer = get_channel_layer()
-    
     # 不打印开始处理压缩任务的信息
     try:
         task = CompressionTask.objects.get(task_id=task_id)
         product_ids = [int(pid) for pid in task.product_ids.split(',') if pid.strip().isdigit()]
         file_type = task.file_type
         
-        # 更新任务状态为处理中
-        task.status = 'processing'
-        task.progress = 10
-        task.save()
+        # 更新任务状态为处理中；之后的进度按时间和步长节流写入数据库和推送
+        reporter = ProgressReporter(task)
+        reporter.update(10, '开始准备文件...', status='processing', force=True)
+        
+        products = Product.objects.filter(id__in=product_ids)
         
-        # 尝试发送状态更新，处理Redis连接失败情况
+        # 获取用户名，CompressionTask模型只有user_id字段，没有user属性
         try:
-            # 发送状态更新
-            async_to_sync(channel_layer.group_send)(
-                f'compression_{task.user_id}',
-                {
-                    'type': 'compression_update',
-                    'task_id': str(task_id),
-                    'progress': 10,
-                    'status': 'processing',
-                    'message': '开始准备文件...'
-                }
-            )
-        except Exception as ws_error:
-            # WebSocket通知失败，继续执行压缩任务
-            pass
+            from django.contrib.auth.models import User
+            username = User.objects.get(id=task.user_id).username
+        except (User.DoesNotExist, AttributeError):
+            username = 'unknown'
         
-        products = Product.objects.filter(id__in=product_ids)
+        # 先按文件系统实时状态校正源文件的索引条目（增量同步可能漏掉原地覆盖的文件），
+        # 相同产品、文件类型、源文件和水印身份的压缩包已缓存时直接使用
+        revalidate_index(product_file_paths(products, file_type))
+        cache_key = archive_cache.archive_key(products, file_type, username)
+        dest_path, relative_path = compressed_file_destination(task_id)
+        if archive_cache.fetch(cache_key, dest_path):
+            complete_compression_task(task, relative_path, reporter=reporter)
+            return
+        
+        # 一次查询媒体文件索引确认文件是否存在，None 表示文件不存在
+        file_sizes = get_product_file_sizes(products, file_type)
         
         # 计算实际需要处理的文件总数
         total_files = 0
@@ -75,11 +105,22 @@ def process_compression_task(task_id):
         
         processed_files = 0
         
-        # 创建临时目录存储压缩文件
-        with tempfile.TemporaryDirectory() as tmpdir:
-            zip_file_path = os.path.join(tmpdir, f'compressed_{task_id}.zip')
-            
-            with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # 压缩包直接写入最终目录下的 .part 文件，完成后原子改名为最终文件名，
+        # 读取方不会看到不完整的文件，压缩包只写一次磁盘
+        part_path = dest_path + '.part'
+        
+        def report_progress():
+            # 更新进度，保留10%用于后续处理
+            progress = 10 + int((processed_files / total_files) * 80)
+            reporter.update(min(progress, 90), f'已处理 {processed_files}/{total_files} 个文件')
+        
+        # 需要加水印的PDF：(压缩包内文件名, 源文件路径)，交给水印进程池并行处理
+        pdf_jobs = []
+        # 有PDF未能加水印时压缩包不加入缓存
+        watermark_failed = False
+        
+        try:
+            with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED, strict_timestamps=False) as zipf:
                 for product in products:
                     # 根据文件类型处理
                     if file_type in ['pdf', 'both']:
@@ -98,87 +139,11 @@ def process_compression_task(task_id):
                             # 构建完整路径
                             full_pdf_path = os.path.join(settings.MEDIA_ROOT, pdf_path)
                             
-                            if os.path.exists(full_pdf_path):
+                            if file_sizes.get(product.pdf_file_path) is not None:
                                 # 获取原始文件名并将后缀改为大写
                                 original_filename = os.path.basename(full_pdf_path)
                                 filename, ext = os.path.splitext(original_filename)
-                                uppercase_filename = f"{filename}{ext.upper()}"
-                                
-                                try:
-                                    # 为PDF文件添加水印
-                                    from django.utils import timezone
-                                    # 获取用户名，CompressionTask模型只有user_id字段，没有user属性
-                                    try:
-                                        from django.contrib.auth.models import User
-                                        user = User.objects.get(id=task.user_id)
-                                        username = user.username
-                                    except (User.DoesNotExist, AttributeError):
-                                        username = 'unknown'
-                                    watermark_text = f"For Reference Only[OBARA] {username} {timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')}"
-                                    
-                                    # 使用唯一的临时文件名，避免冲突
-                                    import uuid
-                                    unique_id = uuid.uuid4().hex[:8]
-                                    temp_watermarked_pdf_path = os.path.join(tmpdir, f"watermarked_{unique_id}_{uppercase_filename}")
-                                    
-                                    from .pdf_utils import PDFProcessor
-                                    
-                                    # 优化：确保临时目录可写
-                                    if not os.path.exists(tmpdir):
-                                        os.makedirs(tmpdir, exist_ok=True)
-                                    
-                                    # 为大型PDF添加内存优化
-                                    from PyPDF2 import PdfReader, PdfWriter
-                                    
-                                    # 1. 创建水印PDF（使用BytesIO避免磁盘I/O）
-                                    watermark_buffer = io.BytesIO()
-                                    PDFProcessor.create_watermark(watermark_text, watermark_buffer)
-                                    watermark_buffer.seek(0)
-                                    
-                                    # 2. 读取水印页面
-                                    watermark_pdf = PdfReader(watermark_buffer)
-                                    watermark_page = watermark_pdf.pages[0]
-                                    
-                                    # 3. 处理原始PDF，逐页添加水印
-                                    reader = PdfReader(full_pdf_path)
-                                    writer = PdfWriter()
-                                    
-                                    for i in range(len(reader.pages)):
-                                        page = reader.pages[i]
-                                        # 优化：使用merge_transformed_page替代merge_page，提高兼容性
-                                        try:
-                                            # 尝试使用merge_transformed_page（PyPDF2 3.x推荐）
-                                            page.merge_transformed_page(watermark_page, (1, 0, 0, 1, 0, 0))
-                                        except AttributeError:
-                                            # 回退到merge_page（旧版本PyPDF2）
-                                            page.merge_page(watermark_page)
-                                        writer.add_page(page)
-                                    
-                                    # 4. 写入带水印的PDF到临时文件
-                                    with open(temp_watermarked_pdf_path, "wb") as output_file:
-                                        writer.write(output_file)
-                                    
-                                    # 5. 添加带水印的PDF到压缩包
-                                    zipf.write(temp_watermarked_pdf_path, uppercase_filename)
-                                    processed_files += 1
-                                    
-                                except Exception as pdf_error:
-                                    # 详细记录错误日志
-                                    print(f"水印添加失败: {str(pdf_error)}，文件: {uppercase_filename}")
-                                    # 水印添加失败，尝试添加原始PDF文件
-                                    try:
-                                        zipf.write(full_pdf_path, uppercase_filename)
-                                        processed_files += 1
-                                    except Exception as original_error:
-                                        # 原始文件也无法添加，只增加计数器
-                                        processed_files += 1
-                                finally:
-                                    # 清理临时文件，添加异常处理
-                                    try:
-                                        if 'temp_watermarked_pdf_path' in locals() and os.path.exists(temp_watermarked_pdf_path):
-                                            os.remove(temp_watermarked_pdf_path)
-                                    except Exception as cleanup_error:
-                                        print(f"清理临时文件失败: {str(cleanup_error)}")
+                                pdf_jobs.append((f"{filename}{ext.upper()}", full_pdf_path))
                             
                     if file_type in ['step', 'both']:
                         if product.step_file_path:
@@ -188,14 +153,18 @@ def process_compression_task(task_id):
                                 step_path = str(step_path)[len('media/'):]
                             full_step_path = os.path.join(settings.MEDIA_ROOT, step_path)
                             
-                            if os.path.exists(full_step_path):
+                            if file_sizes.get(product.step_file_path) is not None:
                                 # 获取原始文件名并将后缀改为大写
                                 original_filename = os.path.basename(full_step_path)
                                 filename, ext = os.path.splitext(original_filename)
                                 uppercase_filename = f"{filename}{ext.upper()}"
-                                # 添加到压缩包
-                                zipf.write(full_step_path, uppercase_filename)
+                                # 添加到压缩包；文件存在与否取自索引，同步后被删除或改名的文件跳过
+                                try:
+                                    zipf.write(full_step_path, uppercase_filename)
+                                except OSError as step_error:
+                                    print(f"文件不存在或无法读取，已跳过: {full_step_path} - {step_error}")
                                 processed_files += 1
+                                report_progress()
                     
                     if file_type == 'bmp':
                         if product.bmp_file_path:
@@ -205,99 +174,110 @@ def process_compression_task(task_id):
                                 bmp_path = str(bmp_path)[len('media/'):]
                             full_bmp_path = os.path.join(settings.MEDIA_ROOT, bmp_path)
                             
-                            if os.path.exists(full_bmp_path):
+                            if file_sizes.get(product.bmp_file_path) is not None:
                                 # 获取原始文件名并将后缀改为大写
                                 original_filename = os.path.basename(full_bmp_path)
                                 filename, ext = os.path.splitext(original_filename)
                                 uppercase_filename = f"{filename}{ext.upper()}"
-                                # 添加到压缩包
-                                zipf.write(full_bmp_path, uppercase_filename)
+                                # 添加到压缩包；文件存在与否取自索引，同步后被删除或改名的文件跳过
+                                try:
+                                    zipf.write(full_bmp_path, uppercase_filename)
+                                except OSError as bmp_error:
+                                    print(f"文件不存在或无法读取，已跳过: {full_bmp_path} - {bmp_error}")
                                 processed_files += 1
-                    
-                    # 更新进度
-                    progress = 10 + int((processed_files / total_files) * 80)
-                    task.progress = min(progress, 90)  # 保留10%用于后续处理
-                    task.save()
-                    
-                    # 尝试发送进度更新，处理Redis连接失败情况
-                    try:
-                        # 发送进度更新
-                        async_to_sync(channel_layer.group_send)(
-                            f'compression_{task.user_id}',
-                            {
-                                'type': 'compression_update',
-                                'task_id': str(task_id),
-                                'progress': task.progress,
-                                'status': 'processing',
-                                'message': f'已处理 {processed_files}/{total_files} 个文件'
-                            }
-                        )
-                    except Exception as ws_error:
-                        # WebSocket通知失败，继续执行压缩任务
-                        pass
-            
-            # 保存压缩文件到指定位置
-            from pathlib import Path
-            BASE_DIR = Path(__file__).resolve().parent.parent
-            temp_dir = os.path.join(BASE_DIR, 'temp')
-            compressed_files_dir = os.path.join(temp_dir, 'compressed_files')
-            os.makedirs(compressed_files_dir, exist_ok=True)
-            
-            # 生成唯一的压缩文件名
-            unique_filename = f'{task_id}_{datetime.now().strftime("%Y%m%d%H%M%S")}.zip'
-            dest_path = os.path.join(compressed_files_dir, unique_filename)
-            
-            # 将临时文件复制到目标位置
-            import shutil
-            shutil.copy2(zip_file_path, dest_path)
-            
-            # 更新任务状态
-            task.status = 'completed'
-            task.progress = 100
-            task.compressed_file_path = f'temp/compressed_files/{unique_filename}'
-            task.save()
-            
-            # 尝试发送完成通知，处理Redis连接失败情况
-            try:
-                # 发送完成通知
-                async_to_sync(channel_layer.group_send)(
-                    f'compression_{task.user_id}',
-                    {
-                        'type': 'compression_update',
-                        'task_id': str(task_id),
-                        'progress': 100,
-                        'status': 'completed',
-                        'message': '压缩完成，准备下载...'
-                    }
+                                report_progress()
+                
+                # 并行加水印，按完成顺序写入压缩包
+                watermark_jobs = (
+                    ((uppercase_filename, full_pdf_path), full_pdf_path, f"For Reference Only[OBARA] {username} {timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')}")
+                    for uppercase_filename, full_pdf_path in pdf_jobs
                 )
-            except Exception as ws_error:
-                # WebSocket通知失败，继续执行
-                pass
+                for (uppercase_filename, full_pdf_path), data, pdf_error in watermark_many(watermark_jobs):
+                    if pdf_error is None:
+                        zipf.writestr(uppercase_filename, data)
+                    else:
+                        # 详细记录错误日志
+                        print(f"水印添加失败: {str(pdf_error)}，文件: {uppercase_filename}")
+                        watermark_failed = True
+                        # 水印添加失败，尝试添加原始PDF文件
+                        try:
+                            zipf.write(full_pdf_path, uppercase_filename)
+                        except Exception as original_error:
+                            # 原始文件也无法添加，只增加计数器
+                            pass
+                    processed_files += 1
+                    report_progress()
+            os.replace(part_path, dest_path)
+        finally:
+            # 压缩失败时删除未完成的文件
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        
+        if not watermark_failed:
+            archive_cache.store(cache_key, dest_path)
+        
+        # 更新任务状态
+        complete_compression_task(task, relative_path, reporter=reporter)
     
     except Exception as e:
         print(f"压缩任务{task_id}处理失败: {e}")
         # 更新任务状态为失败
         try:
             task = CompressionTask.objects.get(task_id=task_id)
-            task.status = 'failed'
-            task.error_message = str(e)
-            task.save()
-            
-            # 尝试发送错误通知，处理Redis连接失败情况
-            try:
-                # 发送错误通知
-                async_to_sync(channel_layer.group_send)(
-                    f'compression_{task.user_id}',
-                    {
-                        'type': 'compression_update',
-                        'task_id': str(task_id),
-                        'progress': 0,
-                        'status': 'failed',
-                        'message': f'压缩失败: {str(e)}'
-                    }
-                )
-            except Exception as ws_error:
-                # WebSocket通知失败，记录错误
-                pass
+            ProgressReporter(task).update(0, f'压缩失败: {str(e)}', status='failed', error_message=str(e))
         except Exception as update_error:
             print(f"更新任务状态失败: {update_error}")
+
+
+def _send_file_sync_update(channel_layer, job):
+    # 推送到所有管理员共用的频道组，页面未连接 WebSocket 时由轮询接口获取
+    try:
+        async_to_sync(channel_layer.group_send)(
+            FILE_SYNC_GROUP,
+            {'type': 'file_sync_update', **job.to_dict()}
+        )
+    except Exception:
+        # WebSocket通知失败，继续执行同步任务
+        pass
+
+
+def process_file_sync_job(job_id):
+    """在后台线程中执行文件同步任务，进度和结果写入 FileSyncJob"""
+    channel_layer = get_channel_layer()
+    try:
+        job = FileSyncJob.objects.get(job_id=job_id)
+        job.status = 'processing'
+        job.started_at = timezone.now()
+        job.message = '正在扫描媒体目录...'
+        job.save()
+        _send_file_sync_update(channel_layer, job)
+
+        def report_progress(dirs_scanned, files_found):
+            # 扫描器按间隔调用，写库和推送频率随之受限
+            job.dirs_scanned = dirs_scanned
+            job.files_found = files_found
+            job.message = f'已扫描 {dirs_scanned} 个目录，发现 {files_found} 个文件'
+            job.save(update_fields=['dirs_scanned', 'files_found', 'message', 'updated_at'])
+            _send_file_sync_update(channel_layer, job)
+
+        try:
+            success, msg, stats = sync_media_files(full=job.full, progress=report_progress)
+        except Exception as e:
+            print(f"文件同步任务{job_id}处理失败: {e}")
+            success, msg, stats = False, f'同步失败: {e}', {}
+
+        job.status = 'completed' if success else 'failed'
+        job.message = msg
+        if not success:
+            job.error_message = msg
+        job.files_found = stats.get('files', job.files_found)
+        job.updated_count = stats.get('updated', 0)
+        job.unmatched_count = stats.get('unmatched', 0)
+        job.finished_at = timezone.now()
+        job.save()
+        _send_file_sync_update(channel_layer, job)
+    except Exception as e:
+        print(f"更新文件同步任务状态失败: {e}")
+    finally:
+        # 后台线程结束时关闭本线程的数据库连接
+        connection.close()
@@ -12,8 +12,67 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import os
+import tempfile
+import zipfile
 
+from django.test import SimpleTestCase, TestCase
 
-from django.test import TestCase
+from .models import Category, Product
+from .search_index import ProductSearchIndex, sort_field
+from .zip_stream import stream_zip
 
-# Create your tests here.
+
+class StreamZipTests(SimpleTestCase):
+    """流式 ZIP：无法读取的条目跳过，压缩包仍然完整"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _write(self, name, content, mtime=None):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def _build(self, entries):
+        data = b''.join(stream_zip(entries))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def test_missing_file_is_skipped(self):
+        present = self._write('a.step', b'step data')
+        with self.assertLogs('clamps.zip_stream', level='WARNING'):
+            archive = self._build([
+                ('A.STEP', present),
+                ('MISSING.STEP', os.path.join(self.tmpdir.name, 'missing.step')),
+                ('NOTE.TXT', b'note'),
+            ])
+        self.assertEqual(archive.namelist(), ['A.STEP', 'NOTE.TXT'])
+        self.assertEqual(archive.read('A.STEP'), b'step data')
+
+    def test_mtime_before_1980_is_clamped(self):
+        old = self._write('old.pdf', b'old drawing', mtime=86400)
+        archive = self._build([('OLD.PDF', old)])
+        self.assertEqual(archive.read('OLD.PDF'), b'old drawing')
+        self.assertEqual(archive.getinfo('OLD.PDF').date_time, (1980, 1, 1, 0, 0, 0))
+
+
+class CategorySortTests(TestCase):
+    """按分类排序：内存索引与数据库回退的结果顺序一致"""
+
+    def test_index_matches_orm(self):
+        # 分类 id 顺序与名称顺序相反
+        second = Category.objects.create(name='B')
+        first = Category.objects.create(name='A')
+        for i, category in enumerate([first, second, first, second]):
+            Product.objects.create(category=category, drawing_no_1=f'P{i}')
+        index = ProductSearchIndex.build()
+        for sort_dir, order_by in (('asc', (sort_field('category'), 'id')), ('desc', (f"-{sort_field('category')}", '-id'))):
+            expected = list(Product.objects.order_by(*order_by).values_list('id', flat=True))
+            self.assertEqual(index.search({}, 'category', sort_dir), expected)
@@ -17,6 +17,7 @@ from . import views, media_views
 from .async_compression_views import (
     start_compression,
     check_compression_progress,
+    compression_queue_stats,
     download_compressed_file,
     check_batch_file_size
 )
@@ -48,6 +49,7 @@ urlpatterns = [
     # 异步压缩相关接口
     path('async_compression/start/', start_compression, name='start_compression'),
     path('async_compression/progress/', check_compression_progress, name='check_compression_progress'),
+    path('async_compression/stats/', compression_queue_stats, name='compression_queue_stats'),
     path('async_compression/download/', download_compressed_file, name='download_compressed_file'),
     # 更新批量文件大小检查接口以使用异步压缩视图
     path('check_batch_file_size/', check_batch_file_size, name='check_batch_file_size'),
@@ -66,6 +68,7 @@ urlpatterns = [
     path('management/export/', views.export_data, name='export_data'),
     path('management/import_csv/', views.import_csv, name='import_csv'),
     path('management/sync_files/', views.sync_files, name='sync_files'),
+    path('management/sync_files/status/', views.sync_files_status, name='sync_files_status'),
     path('management/unmatched_files/', views.view_unmatched_files, name='view_unmatched_files'),
     path('management/analytics/', views.analytics_view, name='analytics'),
     path('management/user_feedback/', views.manage_user_feedback, name='manage_user_feedback'),
@@ -93,6 +96,9 @@ urlpatterns = [
     path('api/download-analytics/', views.download_analytics_api, name='download_analytics_api'),
     path('api/ai_search/', views.ai_search_api, name='ai_search_api'),
     path('api/user_profile_data/', views.get_user_profile_data, name='get_user_profile_data'),
+    path('api/search/facets/', views.search_facets_api, name='search_facets_api'),
+    path('api/search/batch/', views.batch_search_api, name='batch_search_api'),
+    path('api/products/<int:product_id>/similar/', views.similar_products_api, name='similar_products_api'),
     
     # PDF阅读器 - 统一使用一个路由，通过文件名_en后缀区分中英文
     path('pdf/viewer/<path:pdf_filename>/', views.pdf_viewer, name='pdf_viewer'),
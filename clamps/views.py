@@ -14,16 +14,20 @@
 
 
 
+import hashlib
 import io
+import json
 import os
 import re
 import secrets
 import string
 import tempfile
+import threading
 import zipfile
 from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from urllib.parse import urlencode
 
 # 第三方库
 from PyPDF2 import PdfReader, PdfWriter
@@ -43,8 +47,9 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.core.exceptions import FieldError, ValidationError
 from django.db import transaction
-from django.db.models import Q, F
+from django.db.models import Count, Max, Q, F, Sum
 from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.utils import timezone
@@ -53,7 +58,16 @@ from django.views.decorators.csrf import csrf_exempt
 
 # 本地应用
 from .models import Product
+from .pagination import CountedPaginator, decode_cursor, encode_cursor, keyset_page
 from .pdf_utils import PDFProcessor
+from .catalog import bump_catalog_version, get_catalog_version
+from .log_buffer import log_action
+from .media_index import get_file_size, get_product_file_sizes
+from .zip_stream import stream_zip
+from .watermark_pool import watermark_many
+from .search_cache import get_cached_ids, get_config as get_search_cache_config, search_cache_key, set_cached_ids
+from .search_index import HANDLED_PARAMS, RANGE_PARAMS, get_product_index, sort_field
+from .similarity import SIMILARITY_FIELDS, find_similar
 
 
 
@@ -126,7 +140,7 @@ def add_watermark_to_pdf(input_pdf_path, output_pdf_path, watermark_text):
 
 
 
-from .models import Category, Log, UserProfile, StyleLink, UserFeedback, UserStyleLinkVisit
+from .models import Category, FileSyncJob, Log, UserProfile, StyleLink, UserFeedback, UserStyleLinkVisit
 
 
 def is_superuser(user):
@@ -165,12 +179,7 @@ def user_login(request):
             from django.db import transaction
             with transaction.atomic():
                 # 记录登录日志
-                Log.objects.create(
-                    user=user, 
-                    action_type='login', 
-                    ip_address=request.META.get('REMOTE_ADDR'), 
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
+                log_action(request, 'login', user=user)
                 
                 # 检查是否有已处理但未通知的反馈
                 processed_feedback = UserFeedback.objects.filter(
@@ -237,12 +246,7 @@ def user_login_en(request):
             from django.db import transaction
             with transaction.atomic():
                 # 记录登录日志
-                Log.objects.create(
-                    user=user, 
-                    action_type='login', 
-                    ip_address=request.META.get('REMOTE_ADDR'), 
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
+                log_action(request, 'login', user=user)
                 
                 # 检查是否有已处理但未通知的反馈
                 processed_feedback = UserFeedback.objects.filter(
@@ -299,12 +303,7 @@ def generate_random_password(length=12):
 
 @login_required
 def user_logout(request):
-    Log.objects.create(
-        user=request.user, 
-        action_type='logout', 
-        ip_address=request.META.get('REMOTE_ADDR'), 
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    log_action(request, 'logout')
     logout(request)
     messages.info(request, '您已成功登出。')
     return redirect('clamps:login')
@@ -312,12 +311,7 @@ def user_logout(request):
 
 @login_required
 def user_logout_en(request):
-    Log.objects.create(
-        user=request.user, 
-        action_type='logout', 
-        ip_address=request.META.get('REMOTE_ADDR'), 
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    log_action(request, 'logout')
     logout(request)
     messages.info(request, 'You have been successfully logged out.')
     return redirect('clamps:login_en')
@@ -337,24 +331,44 @@ def search_en(request):
 
 
 
-@login_required
-def search_results_base(request, template_name):
-    query_params = request.GET.copy()
+def build_range_q(field_name, query_string):
+    """处理数值范围查询 - 返回Q对象"""
+    range_q = Q()
+    if query_string:
+        query_string = query_string.strip()
+        if '~' in query_string:
+            parts = query_string.split('~')
+            min_val_str = parts[0].strip()
+            max_val_str = parts[1].strip()
+
+            if min_val_str:
+                try:
+                    min_val = float(min_val_str)
+                    range_q &= Q(**{f'{field_name}__gte': min_val})
+                except ValueError:
+                    pass # 忽略无效的最小值
+            if max_val_str:
+                try:
+                    max_val = float(max_val_str)
+                    range_q &= Q(**{f'{field_name}__lte': max_val})
+                except ValueError:
+                    pass # 忽略无效的最大值
+        else:
+            # 精确匹配
+            try:
+                exact_val = float(query_string)
+                range_q &= Q(**{field_name: exact_val})
+            except ValueError:
+                pass # 忽略无效的精确值
+    return range_q
+
+
+def build_search_q(query_params):
+    """根据搜索参数构建Q对象（内存索引不可用时的数据库查询路径）"""
     category_id = query_params.get('category')
     description = query_params.get('description')
     drawing_no_1 = query_params.get('drawing_no_1')
     sub_category_type = query_params.get('sub_category_type')
-    
-    # 创建缓存键，基于搜索参数
-    cache_key = f'search_results_{hash(frozenset(query_params.items()))}'
-    
-    # 检查缓存是否存在
-    cached_context = cache.get(cache_key)
-    if cached_context:
-        # 如果是英文页面，确保使用正确的模板
-        if template_name == 'search_results_en.html':
-            return render(request, template_name, cached_context)
-        return render(request, template_name, cached_context)
 
     # 数值范围参数
     stroke = query_params.get('stroke')
@@ -375,17 +389,6 @@ def search_results_base(request, template_name):
     water_circuit = query_params.get('water_circuit')
     gearbox_type = query_params.get('gearbox_type')
 
-    # 获取排序参数
-    sort_by = request.GET.get('sort_by', 'drawing_no_1')
-    # 获取排序方向，默认为升序
-    sort_dir = request.GET.get('sort_dir', 'asc')
-    
-    # 构建排序表达式
-    if sort_dir == 'desc':
-        order_by = f'-{sort_by}'
-    else:
-        order_by = sort_by
-    
     # 使用Q对象构建复杂查询条件，减少数据库查询次数
     q_objects = Q()
     
@@ -413,37 +416,6 @@ def search_results_base(request, template_name):
     if sub_category_type:
         q_objects &= Q(sub_category_type__icontains=sub_category_type)
 
-    # 处理数值范围查询 - 返回Q对象
-    def build_range_q(field_name, query_string):
-        range_q = Q()
-        if query_string:
-            query_string = query_string.strip()
-            if '~' in query_string:
-                parts = query_string.split('~')
-                min_val_str = parts[0].strip()
-                max_val_str = parts[1].strip()
-
-                if min_val_str:
-                    try:
-                        min_val = float(min_val_str)
-                        range_q &= Q(**{f'{field_name}__gte': min_val})
-                    except ValueError:
-                        pass # 忽略无效的最小值
-                if max_val_str:
-                    try:
-                        max_val = float(max_val_str)
-                        range_q &= Q(**{f'{field_name}__lte': max_val})
-                    except ValueError:
-                        pass # 忽略无效的最大值
-            else:
-                # 精确匹配
-                try:
-                    exact_val = float(query_string)
-                    range_q &= Q(**{field_name: exact_val})
-                except ValueError:
-                    pass # 忽略无效的精确值
-        return range_q
-
     # 添加数值范围查询
     q_objects &= build_range_q('stroke', stroke)
     q_objects &= build_range_q('clamping_force', clamping_force)
@@ -478,34 +450,57 @@ def search_results_base(request, template_name):
         q_objects &= Q(water_circuit__icontains=water_circuit)
 
     # 处理动态字段 (确保 transformer_placement 等已处理的字段不再被动态处理)
-    dynamic_fields = {}
-    for key, value in query_params.items():
-        if key not in ["category", "description", "drawing_no_1", "sub_category_type",
-                       "stroke", "clamping_force", "weight", "throat_depth", "throat_width",
-                       "transformer", "electrode_arm_end", "motor_manufacturer", "has_balance",
-                       "transformer_placement", "flange_pcd", "bracket_direction", "water_circuit",
-                       "page", "csrfmiddlewaretoken", "ide_webview_request_time"] and value:
-            dynamic_fields[key] = value
-
-    for field_name, field_value in dynamic_fields.items():
+    for field_name, field_value in query_params.items():
+        if field_name in HANDLED_PARAMS or not field_value:
+            continue
         # 确保字段存在于Product模型中
         if hasattr(Product, field_name):
             # 动态字段支持范围搜索
             q_objects &= build_range_q(field_name, field_value)
+
+    return q_objects
+
+
+@login_required
+def search_results_base(request, template_name):
+    query_params = request.GET.copy()
     
-    # 执行一次性查询
-    queryset = Product.objects.filter(q_objects).order_by(order_by)
+    # 获取排序参数
+    sort_by = request.GET.get('sort_by') or 'drawing_no_1'
+    # 获取排序方向，默认为升序
+    sort_dir = request.GET.get('sort_dir', 'asc')
 
-    # 记录搜索日志
+    # 记录搜索日志，在查缓存之前记录：缓存命中和翻页的请求同样记录
     # 将QueryDict转换为更易读的格式，排除csrfmiddlewaretoken
     clean_params = {k: v[0] if len(v) == 1 else v for k, v in query_params.lists() if k != 'csrfmiddlewaretoken'}
-    log_entry = Log(user=request.user, action_type='search', ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''), details=str(clean_params))
-    log_entry.save()
+    log_action(request, 'search', details=str(clean_params))
+
+    # 创建缓存键，基于规范化的搜索参数和产品目录版本号，各进程一致；页码不参与
+    cache_key = search_cache_key(query_params)
+    
+    # 检查缓存是否存在，缓存的是完整的有序ID列表，翻页不会重新执行过滤
+    product_ids = get_cached_ids(cache_key)
+    if product_ids is None:
+        # 优先使用内存索引求出有序的产品ID列表，无法处理的查询回退到数据库
+        index = get_product_index()
+        product_ids = index.search(query_params, sort_by, sort_dir) if index else None
+        if product_ids is None:
+            # 构建排序表达式，以id作为次级排序保证分页稳定；排序字段与内存索引一致
+            order_field = sort_field(sort_by)
+            if sort_dir == 'desc':
+                order_by = (f'-{order_field}', '-id')
+            else:
+                order_by = (order_field, 'id')
+            product_ids = Product.objects.filter(build_search_q(query_params)).order_by(*order_by).values_list('id', flat=True)
 
-    paginator = Paginator(queryset, 20)  # 每页20条记录
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        # 缓存搜索结果，产品数据变化后版本号递增，旧缓存自然失效
+        product_ids = set_cached_ids(cache_key, product_ids)
+
+    # 切片得到当前页的ID，只按主键取回这20条记录
+    paginator = Paginator(product_ids, 20)  # 每页20条记录
+    page_obj = paginator.get_page(request.GET.get('page'))
+    products = Product.objects.in_bulk(list(page_obj.object_list))
+    page_obj.object_list = [products[pk] for pk in page_obj.object_list if pk in products]
 
     # 添加排序相关上下文
     context = {
@@ -517,9 +512,6 @@ def search_results_base(request, template_name):
         'sort_dir': sort_dir
     }
     
-    # 缓存搜索结果10分钟
-    cache.set(cache_key, context, timeout=600)
-    
     return render(request, template_name, context)
 
 @login_required
@@ -533,10 +525,19 @@ def search_results_en(request):
 
 
 
+def get_similar_products(product, k=8):
+    """产品详情页的相似焊枪面板：同分类中参数最接近的产品"""
+    similar = find_similar(product.id, k=k, category=product.category_id)
+    if not similar:
+        return []
+    products = Product.objects.in_bulk([pk for pk, _ in similar])
+    return [{'product': products[pk], 'distance': distance} for pk, distance in similar if pk in products]
+
+
 @login_required
 def product_detail(request, product_id):
-    # 缓存键，包含产品ID和语言
-    cache_key = f'product_detail_{product_id}_zh'
+    # 缓存键，包含产品ID、语言和产品目录版本号
+    cache_key = f'product_detail_{product_id}_zh_v{get_catalog_version()}'
     
     # 尝试从缓存获取
     cached_product = cache.get(cache_key)
@@ -549,19 +550,18 @@ def product_detail(request, product_id):
         cache.set(cache_key, product, timeout=3600)
     
     # 记录查看详情日志
-    log_entry = Log(user=request.user, action_type='view', ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''), details=f'Drawing No.: {product.drawing_no_1}')
-    log_entry.save()
+    log_action(request, 'view', details=f'Drawing No.: {product.drawing_no_1}')
     return render(request, 'product_detail.html', {
         'product': product,
-        'is_style_search': request.session.get('from_style_search', False)
+        'is_style_search': request.session.get('from_style_search', False),
+        'similar_products': get_similar_products(product),
     })
 
 
 @login_required
 def product_detail_en(request, product_id):
-    # 缓存键，包含产品ID和语言
-    cache_key = f'product_detail_{product_id}_en'
+    # 缓存键，包含产品ID、语言和产品目录版本号
+    cache_key = f'product_detail_{product_id}_en_v{get_catalog_version()}'
     
     # 尝试从缓存获取
     cached_product = cache.get(cache_key)
@@ -574,12 +574,11 @@ def product_detail_en(request, product_id):
         cache.set(cache_key, product, timeout=3600)
     
     # 记录查看详情日志
-    log_entry = Log(user=request.user, action_type='view', ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''), details=f'Drawing No.: {product.drawing_no_1} (English)')
-    log_entry.save()
+    log_action(request, 'view', details=f'Drawing No.: {product.drawing_no_1} (English)')
     return render(request, 'product_detail_en.html', {
         'product': product,
-        'is_style_search': request.session.get('from_style_search', False)
+        'is_style_search': request.session.get('from_style_search', False),
+        'similar_products': get_similar_products(product),
     })
 
 
@@ -613,23 +612,15 @@ def check_file_size(request, product_id, file_type):
                 'message': f'Product {product.drawing_no_1} has no associated {file_type} file' if is_english else f'产品 {product.drawing_no_1} 没有关联的 {file_type} 文件'
             })
 
-        # 处理路径前缀，确保是相对于 MEDIA_ROOT 的路径
-        relative_path = str(file_path)
-        if relative_path.startswith('media/'):
-            relative_path = relative_path[len('media/'):]
-        elif relative_path.startswith('/media/'):
-            relative_path = relative_path[len('/media/'):]
-
-        full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-        
-        if not os.path.exists(full_file_path):
+        # 文件大小优先读取媒体文件索引，索引中没有时再访问文件系统
+        file_size_bytes = get_file_size(file_path)
+        if file_size_bytes is None:
             return JsonResponse({
                 'can_download': False,
                 'message': f'{file_type.upper()} file does not exist or is corrupted' if is_english else f'{file_type.upper()} 文件不存在或已损坏'
             })
         
         # 获取文件大小（MB）
-        file_size_bytes = os.path.getsize(full_file_path)
         file_size_mb = file_size_bytes / (1024 * 1024)
         
         # 获取或创建用户配置
@@ -675,9 +666,18 @@ def download_file(request, product_id, file_type):
 
         full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
         
-        if os.path.exists(full_file_path):
+        def file_missing():
+            messages.error(request, f"{file_type.upper()} 文件不存在或已损坏")
+            referer = request.META.get('HTTP_REFERER')
+            if referer and 'search_results' in referer:
+                return redirect(referer)
+            else:
+                return redirect('clamps:product_detail', product_id=product_id)
+        
+        # 文件大小优先读取媒体文件索引，索引中没有时再访问文件系统
+        file_size_bytes = get_file_size(file_path)
+        if file_size_bytes is not None:
             # 获取文件大小（MB）
-            file_size_bytes = os.path.getsize(full_file_path)
             file_size_mb = file_size_bytes / (1024 * 1024)
             
             # 获取或创建用户配置
@@ -738,32 +738,31 @@ def download_file(request, product_id, file_type):
                     # 生成水印文本
                     watermark_text = f"For Reference Only[OBARA] {request.user.username} {timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')}"
                     temp_watermarked_pdf_path = os.path.join(tempfile.gettempdir(), f"watermarked_{original_filename}")
-                    PDFProcessor.add_watermark(full_file_path, temp_watermarked_pdf_path, watermark_text)
+                    try:
+                        PDFProcessor.add_watermark(
+                            full_file_path, temp_watermarked_pdf_path, watermark_text,
+                            getattr(settings, 'PDF_WATERMARK_MODE', PDFProcessor.DEFAULT_WATERMARK_MODE)
+                        )
+                    except OSError:
+                        # 索引过期：同步后文件被删除或改名
+                        if os.path.exists(temp_watermarked_pdf_path):
+                            os.remove(temp_watermarked_pdf_path)
+                        return file_missing()
                     final_file_path = temp_watermarked_pdf_path
                 else:
+                    # 文件大小取自索引，打开前再确认文件仍然存在
+                    if not os.path.isfile(full_file_path):
+                        return file_missing()
                     final_file_path = full_file_path
                     
-                # 定义流式生成zip文件的函数
+                # 定义流式生成zip文件的函数：边压缩边输出，不在内存中缓存整个压缩包
                 def zip_generator():
-                    # 使用BytesIO作为zip文件的容器
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        # 添加文件到zip
-                        zf.write(final_file_path, arcname=original_filename_with_uppercase_ext)
-                    
-                    # 清理临时文件
-                    if temp_watermarked_pdf_path and os.path.exists(temp_watermarked_pdf_path):
-                        os.remove(temp_watermarked_pdf_path)
-                    
-                    # 重置buffer位置
-                    zip_buffer.seek(0)
-                    
-                    # 分块读取并返回数据
-                    while True:
-                        chunk = zip_buffer.read(8192)  # 8KB chunks
-                        if not chunk:
-                            break
-                        yield chunk
+                    try:
+                        yield from stream_zip([(original_filename_with_uppercase_ext, final_file_path)])
+                    finally:
+                        # 清理临时文件
+                        if temp_watermarked_pdf_path and os.path.exists(temp_watermarked_pdf_path):
+                            os.remove(temp_watermarked_pdf_path)
                 
                 # 创建StreamingHttpResponse
                 response = StreamingHttpResponse(zip_generator(), content_type='application/zip')
@@ -780,10 +779,8 @@ def download_file(request, product_id, file_type):
                 response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
                 
                 # 记录下载日志
-                log_entry = Log(user=request.user, action_type='download', ip_address=request.META.get('REMOTE_ADDR'),
-                                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                                details=f'Drawing No.: {product.drawing_no_1}, File Type: {file_type}, File Size: {file_size_mb:.2f} MB')
-                log_entry.save()
+                log_action(request, 'download', details=f'Drawing No.: {product.drawing_no_1}, File Type: {file_type}, File Size: {file_size_mb:.2f} MB',
+                           file_type=file_type, size_bytes=file_size_bytes, file_count=1, product_ids=str(product.id))
                 
                 # 记录下载统计
                 user_profile.record_download(file_size_mb)
@@ -792,10 +789,8 @@ def download_file(request, product_id, file_type):
             else:
                 # 对于其他文件类型，重定向到受保护的媒体URL
                 # 记录下载日志
-                log_entry = Log(user=request.user, action_type='download', ip_address=request.META.get('REMOTE_ADDR'),
-                                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                                details=f'Drawing No.: {product.drawing_no_1}, File Type: {file_type}, File Size: {file_size_mb:.2f} MB')
-                log_entry.save()
+                log_action(request, 'download', details=f'Drawing No.: {product.drawing_no_1}, File Type: {file_type}, File Size: {file_size_mb:.2f} MB',
+                           file_type=file_type, size_bytes=file_size_bytes, file_count=1, product_ids=str(product.id))
                 
                 # 记录下载统计
                 user_profile.record_download(file_size_mb)
@@ -803,12 +798,7 @@ def download_file(request, product_id, file_type):
                 return redirect('clamps:protected_media', path=relative_path)
 
         else:
-            messages.error(request, f"{file_type.upper()} 文件不存在或已损坏")
-            referer = request.META.get('HTTP_REFERER')
-            if referer and 'search_results' in referer:
-                return redirect(referer)
-            else:
-                return redirect('clamps:product_detail', product_id=product_id)
+            return file_missing()
     else:
         messages.error(request, f"产品没有关联的 {file_type} 文件")
         referer = request.META.get('HTTP_REFERER')
@@ -830,84 +820,98 @@ def batch_download_view(request, file_type):
             return redirect(request.META.get('HTTP_REFERER', 'clamps:home'))
 
         products = Product.objects.filter(id__in=product_ids)
+        # 一次查询媒体文件索引取得全部文件大小，None 表示文件不存在
+        file_sizes = get_product_file_sizes(products, file_type)
         
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            total_size_mb = 0
-            files_to_add = []
+        total_size_mb = 0
+        files_to_add = []
 
-            for product in products:
-                file_path = None
-                if file_type == 'pdf':
-                    file_path = product.pdf_file_path
-                elif file_type == 'step':
-                    file_path = product.step_file_path
-                elif file_type == 'bmp':
-                    file_path = product.bmp_file_path
-                elif file_type == 'both':
-                    # 对于'both'类型，尝试下载PDF和STEP文件
-                    if product.pdf_file_path:
-                        full_pdf_path = os.path.join(settings.MEDIA_ROOT, str(product.pdf_file_path).replace('media/', ''))
-                        if os.path.exists(full_pdf_path):
-                            # 将PDF文件名的后缀改为大写
-                            pdf_arcname = os.path.basename(str(product.pdf_file_path))
-                            pdf_base, pdf_ext = os.path.splitext(pdf_arcname)
-                            pdf_arcname_with_uppercase_ext = f"{pdf_base}{pdf_ext.upper()}"
-                            files_to_add.append((full_pdf_path, pdf_arcname_with_uppercase_ext))
-                            total_size_mb += os.path.getsize(full_pdf_path) / (1024 * 1024)
-                        else:
-                            messages.warning(request, f"文件 {os.path.basename(str(product.pdf_file_path))} 不存在或已损坏，已跳过。")
-                    if product.step_file_path:
-                        full_step_path = os.path.join(settings.MEDIA_ROOT, str(product.step_file_path).replace('media/', ''))
-                        if os.path.exists(full_step_path):
-                            # 将STEP文件名的后缀改为大写
-                            step_arcname = os.path.basename(str(product.step_file_path))
-                            step_base, step_ext = os.path.splitext(step_arcname)
-                            step_arcname_with_uppercase_ext = f"{step_base}{step_ext.upper()}"
-                            files_to_add.append((full_step_path, step_arcname_with_uppercase_ext))
-                            total_size_mb += os.path.getsize(full_step_path) / (1024 * 1024)
-                        else:
-                            messages.warning(request, f"文件 {os.path.basename(str(product.step_file_path))} 不存在或已损坏，已跳过。")
-                    continue # 跳过下面的通用文件处理逻辑
-                
-                if file_path:
-                    relative_path = str(file_path)
-                    if relative_path.startswith('media/'):
-                        relative_path = relative_path[len('media/'):]
-                    elif relative_path.startswith('/media/'):
-                        relative_path = relative_path[len('/media/'):]
-                    
-                    full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-                    
-                    if os.path.exists(full_file_path):
-                        file_size_bytes = os.path.getsize(full_file_path)
-                        total_size_mb += file_size_bytes / (1024 * 1024)
-                        # 将文件名的后缀改为大写
-                        arcname = os.path.basename(file_path)
-                        base, ext = os.path.splitext(arcname)
-                        arcname_with_uppercase_ext = f"{base}{ext.upper()}"
-                        files_to_add.append((full_file_path, arcname_with_uppercase_ext))
+        for product in products:
+            file_path = None
+            if file_type == 'pdf':
+                file_path = product.pdf_file_path
+            elif file_type == 'step':
+                file_path = product.step_file_path
+            elif file_type == 'bmp':
+                file_path = product.bmp_file_path
+            elif file_type == 'both':
+                # 对于'both'类型，尝试下载PDF和STEP文件
+                if product.pdf_file_path:
+                    full_pdf_path = os.path.join(settings.MEDIA_ROOT, str(product.pdf_file_path).replace('media/', ''))
+                    if file_sizes.get(product.pdf_file_path) is not None:
+                        # 将PDF文件名的后缀改为大写
+                        pdf_arcname = os.path.basename(str(product.pdf_file_path))
+                        pdf_base, pdf_ext = os.path.splitext(pdf_arcname)
+                        pdf_arcname_with_uppercase_ext = f"{pdf_base}{pdf_ext.upper()}"
+                        files_to_add.append((full_pdf_path, pdf_arcname_with_uppercase_ext))
+                        total_size_mb += file_sizes[product.pdf_file_path] / (1024 * 1024)
                     else:
-                        messages.warning(request, f"文件 {os.path.basename(file_path)} 不存在或已损坏，已跳过。")
-                else:
-                    messages.warning(request, f"产品 {product.description} 没有关联的 {file_type} 文件，已跳过。")
+                        messages.warning(request, f"文件 {os.path.basename(str(product.pdf_file_path))} 不存在或已损坏，已跳过。")
+                if product.step_file_path:
+                    full_step_path = os.path.join(settings.MEDIA_ROOT, str(product.step_file_path).replace('media/', ''))
+                    if file_sizes.get(product.step_file_path) is not None:
+                        # 将STEP文件名的后缀改为大写
+                        step_arcname = os.path.basename(str(product.step_file_path))
+                        step_base, step_ext = os.path.splitext(step_arcname)
+                        step_arcname_with_uppercase_ext = f"{step_base}{step_ext.upper()}"
+                        files_to_add.append((full_step_path, step_arcname_with_uppercase_ext))
+                        total_size_mb += file_sizes[product.step_file_path] / (1024 * 1024)
+                    else:
+                        messages.warning(request, f"文件 {os.path.basename(str(product.step_file_path))} 不存在或已损坏，已跳过。")
+                continue # 跳过下面的通用文件处理逻辑
             
-            # 由于前端已经通过checkBatchFileSize检查了文件大小，这里不再重复检查
-            user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-
-            for full_path, arcname in files_to_add:
-                if file_type == 'pdf' or (file_type == 'both' and arcname.lower().endswith('.pdf')):
-                    watermark_text = f"For Reference Only[OBARA] {request.user.username} {timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')}"
-                    temp_watermarked_pdf_path = os.path.join(tempfile.gettempdir(), f"watermarked_{arcname}")
-                    PDFProcessor.add_watermark(full_path, temp_watermarked_pdf_path, watermark_text)
-                    zf.write(temp_watermarked_pdf_path, arcname=arcname)
-                    os.remove(temp_watermarked_pdf_path)
+            if file_path:
+                relative_path = str(file_path)
+                if relative_path.startswith('media/'):
+                    relative_path = relative_path[len('media/'):]
+                elif relative_path.startswith('/media/'):
+                    relative_path = relative_path[len('/media/'):]
+                
+                full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+                
+                file_size_bytes = file_sizes.get(file_path)
+                if file_size_bytes is not None:
+                    total_size_mb += file_size_bytes / (1024 * 1024)
+                    # 将文件名的后缀改为大写
+                    arcname = os.path.basename(file_path)
+                    base, ext = os.path.splitext(arcname)
+                    arcname_with_uppercase_ext = f"{base}{ext.upper()}"
+                    files_to_add.append((full_file_path, arcname_with_uppercase_ext))
                 else:
-                    zf.write(full_path, arcname=arcname)
+                    messages.warning(request, f"文件 {os.path.basename(file_path)} 不存在或已损坏，已跳过。")
+            else:
+                messages.warning(request, f"产品 {product.description} 没有关联的 {file_type} 文件，已跳过。")
+        
+        # 由于前端已经通过checkBatchFileSize检查了文件大小，这里不再重复检查
+        user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+
+        def is_watermarked(arcname):
+            return file_type == 'pdf' or (file_type == 'both' and arcname.lower().endswith('.pdf'))
 
+        def zip_entries():
+            """给出压缩包条目：PDF 由水印进程池并行处理，按完成顺序写入；其余文件随后按原路径写入。
+            响应已经开始输出，这里不能抛出异常；加水印失败（包括超时）的PDF不写入压缩包，不提供不带水印的原文件，
+            失败的文件名记录在压缩包内的说明文件中"""
+            watermark_jobs = (
+                (arcname, full_path, f"For Reference Only[OBARA] {request.user.username} {timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')}")
+                for full_path, arcname in files_to_add if is_watermarked(arcname)
+            )
+            failed = []
+            for arcname, data, error in watermark_many(watermark_jobs):
+                if error is not None:
+                    print(f"水印添加失败: {error}，文件: {arcname}")
+                    failed.append(arcname)
+                    continue
+                yield arcname, data
+            for full_path, arcname in files_to_add:
+                if not is_watermarked(arcname):
+                    yield arcname, full_path
+            if failed:
+                note = '以下文件添加水印失败，未包含在压缩包中，请稍后重新下载：\r\n' + '\r\n'.join(failed) + '\r\n'
+                yield f'{file_type.upper()}_watermark_failed.txt', note.encode('utf-8')
 
-        zip_buffer.seek(0)
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+        # 流式输出压缩包，内存占用与批量大小无关
+        response = StreamingHttpResponse(stream_zip(zip_entries()), content_type='application/zip')
         
         # 检查是否是单个产品批量下载
         is_single_product = len(product_ids) == 1
@@ -926,15 +930,15 @@ def batch_download_view(request, file_type):
         drawing_nos = [product.drawing_no_1 for product in products if product.drawing_no_1]
         drawing_nos_str = ', '.join(drawing_nos)
         
+        # 对于'both'类型，每个产品下载2个文件，否则每个产品下载1个文件
+        file_count = len(products) if file_type != 'both' else len(products) * 2
+        
         # 记录批量下载日志
-        log_entry = Log(user=request.user, action_type='batch_download', ip_address=request.META.get('REMOTE_ADDR'),
-                        user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                        details=f'File Type: {file_type}, Drawing Nos: {drawing_nos_str}, Total Size: {total_size_mb:.2f} MB')
-        log_entry.save()
+        log_action(request, 'batch_download', details=f'File Type: {file_type}, Drawing Nos: {drawing_nos_str}, Total Size: {total_size_mb:.2f} MB',
+                   file_type=file_type, size_bytes=round(total_size_mb * 1024 * 1024), file_count=file_count,
+                   product_ids=','.join(str(product.id) for product in products))
         
         # 记录批量下载统计 - 增加实际下载的文件数量
-        # 对于'both'类型，每个产品下载2个文件，否则每个产品下载1个文件
-        file_count = len(products) if file_type != 'both' else len(products) * 2
         # 记录下载大小
         user_profile.daily_download_size_mb += total_size_mb
         # 增加文件数量统计
@@ -962,6 +966,8 @@ def check_batch_file_size(request):
             })
 
         products = Product.objects.filter(id__in=product_ids)
+        # 一次查询媒体文件索引取得全部文件大小，None 表示文件不存在
+        file_sizes = get_product_file_sizes(products, file_type)
         total_size_mb = 0
         missing_files = []
 
@@ -976,30 +982,20 @@ def check_batch_file_size(request):
             elif file_type == 'both':
                 # 对于'both'类型，检查PDF和STEP文件大小
                 if product.pdf_file_path:
-                    full_pdf_path = os.path.join(settings.MEDIA_ROOT, str(product.pdf_file_path).replace('media/', ''))
-                    if os.path.exists(full_pdf_path):
-                        total_size_mb += os.path.getsize(full_pdf_path) / (1024 * 1024)
+                    if file_sizes.get(product.pdf_file_path) is not None:
+                        total_size_mb += file_sizes[product.pdf_file_path] / (1024 * 1024)
                     else:
                         missing_files.append(os.path.basename(str(product.pdf_file_path)))
                 if product.step_file_path:
-                    full_step_path = os.path.join(settings.MEDIA_ROOT, str(product.step_file_path).replace('media/', ''))
-                    if os.path.exists(full_step_path):
-                        total_size_mb += os.path.getsize(full_step_path) / (1024 * 1024)
+                    if file_sizes.get(product.step_file_path) is not None:
+                        total_size_mb += file_sizes[product.step_file_path] / (1024 * 1024)
                     else:
                         missing_files.append(os.path.basename(str(product.step_file_path)))
                 continue # 跳过下面的通用文件处理逻辑
             
             if file_path:
-                relative_path = str(file_path)
-                if relative_path.startswith('media/'):
-                    relative_path = relative_path[len('media/'):]
-                elif relative_path.startswith('/media/'):
-                    relative_path = relative_path[len('/media/'):]
-                
-                full_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-                
-                if os.path.exists(full_file_path):
-                    file_size_bytes = os.path.getsize(full_file_path)
+                file_size_bytes = file_sizes.get(file_path)
+                if file_size_bytes is not None:
                     total_size_mb += file_size_bytes / (1024 * 1024)
                 else:
                     missing_files.append(os.path.basename(file_path))
@@ -1046,12 +1042,15 @@ def management_dashboard(request):
     total_users = User.objects.count()
     total_categories = Category.objects.count()
     recent_logs = Log.objects.order_by('-timestamp')[:10]
+    file_sync_jobs = list(FileSyncJob.objects.select_related('user')[:10])
     
     context = {
         'total_products': total_products,
         'total_users': total_users,
         'total_categories': total_categories,
         'recent_logs': recent_logs,
+        'file_sync_jobs': file_sync_jobs,
+        'active_sync_job': next((job for job in file_sync_jobs if job.is_active), None),
     }
     return render(request, 'management/dashboard.html', context)
 
@@ -1112,9 +1111,7 @@ def manage_users(request):
             user_profile.password_last_changed = timezone.now()
             user_profile.save()
             
-            log_entry = Log(user=request.user, action_type='set_user_password', ip_address=request.META.get('REMOTE_ADDR'),
-                            user_agent=request.META.get('HTTP_USER_AGENT', ''), details=f'User {user.username} password set manually')
-            log_entry.save()
+            log_action(request, 'set_user_password', details=f'User {user.username} password set manually')
             
             messages.success(request, f'用户 {user.username} 的密码已成功设置。')
             return redirect('clamps:manage_users')
@@ -1276,9 +1273,7 @@ def reset_user_password(request, user_id):
     user_profile.password_last_changed = timezone.now()
     user_profile.save()
     
-    log_entry = Log(user=request.user, action_type='reset_user_password', ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''), details=f'User {user.username} password reset')
-    log_entry.save()
+    log_action(request, 'reset_user_password', details=f'User {user.username} password reset')
     
     messages.success(request, f'用户 {user.username} 的新密码是: {new_password}')
     return redirect('clamps:manage_users')
@@ -1346,9 +1341,7 @@ def add_user(request):
             
             profile.save()
             
-            log_entry = Log(user=request.user, action_type='add_user', ip_address=request.META.get('REMOTE_ADDR'),
-                            user_agent=request.META.get('HTTP_USER_AGENT', ''), details=f'Added new user {username} with customer name {customer_name}')
-            log_entry.save()
+            log_action(request, 'add_user', details=f'Added new user {username} with customer name {customer_name}')
             messages.success(request, f'用户 {username} 添加成功。')
         except Exception as e:
             messages.error(request, f'添加用户失败: {e}')
@@ -1360,13 +1353,7 @@ def add_user(request):
 @user_passes_test(is_staff_or_superuser)
 def export_users(request):
     # 记录导出数据日志
-    Log.objects.create(
-        user=request.user, 
-        action_type='export_data', 
-        details='导出用户信息数据',
-        ip_address=request.META.get('REMOTE_ADDR'), 
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    log_action(request, 'export_data', details='导出用户信息数据')
     
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="users.csv"'
@@ -1409,13 +1396,7 @@ def export_users(request):
 def batch_add_template(request):
     """提供批量添加用户的CSV模板下载"""
     # 记录日志
-    Log.objects.create(
-        user=request.user, 
-        action_type='download_template', 
-        details='下载批量添加用户模板',
-        ip_address=request.META.get('REMOTE_ADDR'), 
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    log_action(request, 'download_template', details='下载批量添加用户模板')
     
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="batch_add_template.csv"'
@@ -1513,10 +1494,7 @@ def batch_add_users(request):
                         profile.save()
                         
                         # 记录日志
-                        log_entry = Log(user=request.user, action_type='add_user', ip_address=request.META.get('REMOTE_ADDR'),
-                                        user_agent=request.META.get('HTTP_USER_AGENT', ''), 
-                                        details=f'Batch added user {username} with customer name {customer_name}')
-                        log_entry.save()
+                        log_action(request, 'add_user', details=f'Batch added user {username} with customer name {customer_name}')
                         
                         added_count += 1
                 except Exception as e:
@@ -1565,16 +1543,47 @@ def view_logs(request):
         aware_date = timezone.make_aware(naive_date)
         logs = logs.filter(timestamp__lte=aware_date)
     
-    logs = logs.order_by("-timestamp")
-    total_count = logs.count()
-    login_count = logs.filter(action_type='login').count()
-    search_count = logs.filter(action_type='search').count()
-    download_count = logs.filter(action_type__in=['download', 'batch_download', 'single_download']).count()
-    view_count = logs.filter(action_type='view').count()
-    
-    paginator = Paginator(logs, 20)  # 每页显示20条日志
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # 各类日志数量合并为一次条件聚合查询，并短时缓存，翻页时不再重复 COUNT
+    filter_params = {key: request.GET.get(key) for key in ('action_type', 'username', 'date_from', 'date_to') if request.GET.get(key)}
+    counts_key = 'log_counts_' + hashlib.sha256(json.dumps(filter_params, sort_keys=True).encode('utf-8')).hexdigest()
+    counts = cache.get(counts_key)
+    if counts is None:
+        counts = logs.aggregate(
+            total_count=Count('id'),
+            login_count=Count('id', filter=Q(action_type='login')),
+            search_count=Count('id', filter=Q(action_type='search')),
+            download_count=Count('id', filter=Q(action_type__in=['download', 'batch_download', 'single_download'])),
+            view_count=Count('id', filter=Q(action_type='view')),
+        )
+        cache.set(counts_key, counts, timeout=getattr(settings, 'LOG_COUNT_CACHE_TIMEOUT', 60))
+
+    # 前若干页使用页码分页，更深的页面使用 (timestamp, id) 游标分页，耗时与页码无关
+    per_page = 20  # 每页显示20条日志
+    paginator_pages = getattr(settings, 'LOG_PAGINATOR_PAGES', 10)
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before'))
+    next_cursor = previous_cursor = ''
+    page_numbers = []
+    if after or before:
+        page_obj = keyset_page(logs.select_related('user'), 'timestamp', per_page, after=after, before=before)
+        next_cursor = page_obj.next_cursor
+        previous_cursor = page_obj.previous_cursor
+        cursor_mode = True
+    else:
+        paginator = CountedPaginator(logs.select_related('user').order_by('-timestamp', '-id'), per_page, counts['total_count'])
+        try:
+            # 页码小于 1 时 get_page 会返回最后一页（整表 OFFSET 扫描），按第 1 页处理
+            page_number = max(1, min(int(request.GET.get('page', 1)), paginator_pages))
+        except ValueError:
+            page_number = 1
+        page_obj = paginator.get_page(page_number)
+        page_numbers = [num for num in paginator.page_range[:paginator_pages]
+                        if page_obj.number - 3 < num < page_obj.number + 3]
+        # 页码分页的最后一页，"下一页"切换为游标分页
+        if page_obj.number >= paginator_pages and page_obj.has_next():
+            last = page_obj.object_list[len(page_obj.object_list) - 1]
+            next_cursor = encode_cursor(last.timestamp, last.pk)
+        cursor_mode = False
     
     # 获取所有用户名列表用于筛选
     usernames = Log.objects.values_list('user__username', flat=True).distinct().order_by('user__username')
@@ -1582,12 +1591,13 @@ def view_logs(request):
     
     context = {
         "page_obj": page_obj,
-        "total_count": total_count,
-        "login_count": login_count,
-        "search_count": search_count,
-        "download_count": download_count,
-        "view_count": view_count,
+        **counts,
         "usernames": usernames,
+        "cursor_mode": cursor_mode,
+        "page_numbers": page_numbers,
+        "next_cursor": next_cursor,
+        "previous_cursor": previous_cursor,
+        "filter_query": urlencode(filter_params) + '&' if filter_params else '',
     }
     return render(request, "management/logs.html", context)
 
@@ -1670,13 +1680,7 @@ def export_data(request):
                     clean_path(product.bmp_file_path)
                 ])
 
-            Log.objects.create(
-                user=request.user,
-                action_type='export_data',
-                details='导出全部产品数据',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            log_action(request, 'export_data', details='导出全部产品数据')
             return response
 
         # -------------------- 导出日志 --------------------
@@ -1715,13 +1719,7 @@ def export_data(request):
                     log.details
                 ])
 
-            Log.objects.create(
-                user=request.user,
-                action_type='export_data',
-                details='导出操作日志',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            log_action(request, 'export_data', details='导出操作日志')
             return response
 
     return render(request, 'management/export.html')
@@ -1872,6 +1870,9 @@ def import_csv(request):
                     batch_size=batch_size
                 )
 
+        # bulk_create/bulk_update 不会触发信号，需手动递增目录版本使搜索缓存失效
+        bump_catalog_version()
+
         total_time = time.time() - start_time
         logger.info(f'CSV导入完成：新增 {created_count} 条，更新 {updated_count} 条，耗时 {total_time:.2f} 秒，总记录数 {created_count + updated_count} 条')
         
@@ -1883,147 +1884,57 @@ def import_csv(request):
 
     return render(request, 'management/import_csv.html')
 
-def sync_files_core():
-    """文件同步核心逻辑"""
-    import logging
-    import time
-    from django.conf import settings
-    import os
-    from collections import defaultdict
-    from django.db import transaction
-    from .models import Product
-    
-    logger = logging.getLogger(__name__)
-    
-    start_time = time.time()
-    
-    media_root = settings.MEDIA_ROOT
-    if not os.path.isdir(media_root):
-        logger.error(f'媒体目录 {media_root} 不存在。')
-        return False, f'媒体目录 {media_root} 不存在。'
-
-    # 1. 优化产品查询：只获取需要的字段值，减少内存占用
-    products = Product.objects.all().only(
-        'id', 'drawing_no_1',
-        'pdf_file_path', 'step_file_path', 'bmp_file_path'
-    )
-    # 优化：预处理drawing_no_1，构建更高效的映射
-    product_map = {}
-    for p in products:
-        if p.drawing_no_1:
-            key = p.drawing_no_1.strip().upper()
-            product_map[key] = p
-
-    # 2. 需要批量更新的容器
-    to_update = defaultdict(list)
-    batch_size = 10000  # 优化：增大批量更新大小
-
-    # 3. 文件后缀 -> 模型字段
-    ext_field = {
-        '.pdf': 'pdf_file_path',
-        '.step': 'step_file_path',
-        '.bmp': 'bmp_file_path',
-    }
-
-    updated = unmatch = 0
-    unmatched_files = []
-    all_unmatched_files = []  # 保存所有未匹配文件
-
-    # 4. 遍历 media/ 下所有文件 - 优化：使用scandir替代os.walk
-    processed_files = 0
-    
-    def scan_directory(path):
-        nonlocal updated, unmatch, processed_files, unmatched_files, all_unmatched_files
-        
-        with os.scandir(path) as entries:
-            for entry in entries:
-                if entry.is_dir(follow_symlinks=False):
-                    # 递归处理子目录
-                    scan_directory(entry.path)
-                elif entry.is_file(follow_symlinks=False):
-                    processed_files += 1
-                    filename = entry.name
-                    name, ext = os.path.splitext(filename.lower())
-                    if ext not in ext_field:
-                        continue
-
-                    # 优化：一次性替换所有后缀
-                    clean = name.upper()
-                    if clean.endswith(('_PDF', '_STEP', '_BMP')):
-                        clean = clean[:-4]  # 移除最后4个字符
-                    
-                    product = product_map.get(clean)
-                    if not product:
-                        unmatch += 1
-                        all_unmatched_files.append(filename)  # 保存所有未匹配文件
-                        if len(unmatched_files) < 5:  # 只保留前5个未匹配文件用于消息提示
-                            unmatched_files.append(filename)
-                        continue
-
-                    field = ext_field[ext]
-                    # 只保留文件名
-                    if getattr(product, field) != filename:
-                        setattr(product, field, filename)
-                        to_update[field].append(product)
-                        updated += 1
-    
-    scan_directory(media_root)
-
-    # 5. 批量更新 - 优化：使用更大的批量大小
-    with transaction.atomic():
-        for field, objs in to_update.items():
-            # 分批次更新，减少内存占用和数据库压力
-            for i in range(0, len(objs), batch_size):
-                batch = objs[i:i+batch_size]
-                Product.objects.bulk_update(batch, [field])
-
-    # 6. 保存所有未匹配文件到日志文件
-    log_dir = os.path.join(settings.BASE_DIR, 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    unmatched_log_path = os.path.join(log_dir, 'unmatched_files.log')
-    
-    with open(unmatched_log_path, 'w', encoding='utf-8') as f:
-        f.write(f'# 文件同步未匹配文件记录 - 生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}\n')
-        f.write(f'# 总处理文件数：{processed_files}，未匹配文件数：{unmatch}\n')
-        f.write(f'# 媒体目录：{media_root}\n')
-        f.write('\n')
-        for filename in sorted(all_unmatched_files):
-            f.write(f'{filename}\n')
-    
-    logger.debug(f'未匹配文件列表已保存到：{unmatched_log_path}')
-
-    # 7. 计算耗时并返回结果
-    total_time = time.time() - start_time
-    msg = f'同步完成：处理 {processed_files} 个文件，更新 {updated} 条记录。耗时 {total_time:.2f} 秒。'
-    if unmatch:
-        msg += f' 未匹配 {unmatch} 个文件'
-        if unmatched_files:
-            msg += f'：{', '.join(unmatched_files)}'
-            if unmatch > 5:
-                msg += ' ...\n未匹配文件完整列表已保存到 logs/unmatched_files.log'
-    
-    logger.debug(f'{msg}')
-    return True, msg
+# 保护“检查是否有进行中的同步任务”和“创建任务”这两步；SQLite 不支持 select_for_update，
+# 服务为单进程部署（waitress），用进程内的锁保证同一时间只创建一个同步任务
+_file_sync_start_lock = threading.Lock()
 
 
 @login_required
 @user_passes_test(lambda u: u.is_staff or u.is_superuser)
 def sync_files(request):
     if request.method == 'POST':
-        # 执行同步操作
-        success, msg = sync_files_core()
-        
-        if success:
-            messages.success(request, msg)
-        else:
-            messages.error(request, msg)
-        
+        # 同步在后台线程中执行，避免长时间扫描占用请求线程和超时；同一时间只运行一个同步任务。
+        # 检查和创建在同一把锁内完成，两个管理员同时发起或重复点击时只会创建一个任务
+        with _file_sync_start_lock:
+            active_job = FileSyncJob.active_job()
+            if active_job:
+                messages.warning(request, '已有文件同步任务正在进行，请等待其完成。')
+                return redirect('clamps:management_dashboard')
+
+            # 勾选“全量扫描”时重新扫描全部目录并重新匹配全部文件
+            job = FileSyncJob.objects.create(
+                full=request.POST.get('full_rescan') == '1',
+                user=request.user,
+                message='等待开始...'
+            )
+
+        from .tasks import process_file_sync_job
+        threading.Thread(target=process_file_sync_job, args=(job.job_id,), daemon=True).start()
+
+        messages.info(request, '文件同步已在后台开始，进度见下方同步记录。')
         return redirect('clamps:management_dashboard')
     
     # GET请求，直接返回仪表板，不执行同步操作
     return redirect('clamps:management_dashboard')
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff or u.is_superuser)
+def sync_files_status(request):
+    """查询文件同步任务进度，未指定 job_id 时返回最近一次任务"""
+    job_id = request.GET.get('job_id')
+    if job_id:
+        try:
+            job = FileSyncJob.objects.filter(job_id=job_id).first()
+        except (ValueError, ValidationError):
+            job = None
+        if job is None:
+            return JsonResponse({'success': False, 'message': '同步任务不存在'}, status=404)
+    else:
+        job = FileSyncJob.objects.first()
+    return JsonResponse({'success': True, 'job': job.to_dict() if job else None})
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff or u.is_superuser)
 def view_unmatched_files(request):
@@ -2685,7 +2596,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import JsonResponse
 from django.utils import timezone
 from datetime import timedelta
-from .models import Log, UserProfile
+from .models import DownloadDailyStat, Log, UserProfile
 
 def api_login_required(view_func):
     """
@@ -2718,82 +2629,58 @@ def download_analytics_api(request):
     days = int(request.GET.get('days', 7))  # 默认7天
     user_filter = request.GET.get('user', 'all')  # 默认全部用户
     
-    # 计算时间范围
-    end_date = timezone.now()
-    # 转换为本地时间
-    end_date_local = timezone.localtime(end_date)
-    # 如果是今天，从本地时间00:00:00开始统计，否则按天数计算
+    # 计算日期范围（本地日期，含两端）
+    end_date = timezone.localtime(timezone.now()).date()
+    # 如果是今天，只统计本地日期的今天，否则按天数向前推
     if days == 1:
-        start_date = timezone.make_aware(datetime.combine(end_date_local.date(), datetime.min.time()))
+        start_date = end_date
     else:
         start_date = end_date - timedelta(days=days)
     
-    # 基础查询：下载相关的日志
-    # 只查询有用户关联的日志（排除匿名用户）
-    base_query = Log.objects.filter(
-        action_type__in=['download', 'batch_download', 'single_download'],
-        timestamp__gte=start_date,
-        timestamp__lte=end_date,
-        user__isnull=False  # 排除匿名用户
-    ).select_related('user')  # 预加载user，减少数据库查询
+    # 基础查询：下载日汇总，每天每用户每种文件类型一行
+    # 汇总中没有匿名用户，这里再排除空用户名
+    base_query = DownloadDailyStat.objects.filter(
+        date__gte=start_date,
+        date__lte=end_date,
+    ).exclude(user__username='')
     
     # 用户筛选
     if user_filter != 'all':
         base_query = base_query.filter(user__username=user_filter)
     
-    # 获取所有下载日志
-    download_logs = base_query.order_by('timestamp')
-    
-    # 解析下载数据
-    user_stats = defaultdict(lambda: {
-        'count': 0,
-        'files': 0,
-        'size': 0.0,
-        'lastDownload': ''
-    })
-    
-    # 初始化日期统计字典
-    daily_stats = defaultdict(lambda: {
-        'downloads': 0,
-        'size': 0.0
-    })
+    # 按用户聚合：下载次数、文件数、总字节数、最后下载时间
+    user_rows = base_query.values('user__username').annotate(
+        count=Sum('download_count'),
+        files=Sum('file_count'),
+        total_bytes=Sum('size_bytes'),
+        last_download=Max('last_download'),
+    ).order_by('user__username')
+    
+    user_stats = {}
+    for row in user_rows:
+        user_stats[row['user__username']] = {
+            'count': row['count'],
+            'files': row['files'],
+            'size': row['total_bytes'] / (1024 * 1024),
+            'lastDownload': timezone.localtime(row['last_download']).strftime('%Y-%m-%d %H:%M:%S') if row['last_download'] else '',
+        }
     
-    for log in download_logs:
-        username = log.user.username.strip()
-        
-        # 过滤掉空用户名
-        if not username:
-            continue
-        
-        log_date = log.timestamp.date().isoformat()
-        
-        # 解析details字段获取文件信息
-        size_mb = parse_download_size(log.details)
-        file_count = parse_file_count(log.details)
-        
-        # 更新用户统计
-        user_stats[username]['count'] += 1
-        user_stats[username]['files'] += file_count
-        user_stats[username]['size'] += size_mb
-        
-        # 更新最后下载时间
-        log_time_str = timezone.localtime(log.timestamp).strftime('%Y-%m-%d %H:%M:%S')
-        if not user_stats[username]['lastDownload'] or log_time_str > user_stats[username]['lastDownload']:
-            user_stats[username]['lastDownload'] = log_time_str
-        
-        # 更新日期统计
-        daily_stats[log_date]['downloads'] += 1
-        daily_stats[log_date]['size'] += size_mb
+    # 按日期聚合
+    daily_rows = base_query.values('date').annotate(
+        downloads=Sum('download_count'),
+        total_bytes=Sum('size_bytes'),
+    ).order_by()
+    daily_stats = {row['date']: row for row in daily_rows}
     
     # 生成趋势数据
     trend_data = []
-    current_date = start_date.date()
-    while current_date <= end_date.date():
-        date_str = current_date.isoformat()
+    current_date = start_date
+    while current_date <= end_date:
+        day_stats = daily_stats.get(current_date)
         trend_data.append({
-            'date': date_str,
-            'downloads': daily_stats[date_str]['downloads'],
-            'size': round(daily_stats[date_str]['size'], 1)
+            'date': current_date.isoformat(),
+            'downloads': day_stats['downloads'] if day_stats else 0,
+            'size': round(day_stats['total_bytes'] / (1024 * 1024), 1) if day_stats else 0.0
         })
         current_date += timedelta(days=1)
     
@@ -2808,7 +2695,7 @@ def download_analytics_api(request):
     
     return JsonResponse({
         'users': active_users,
-        'downloads': dict(user_stats),
+        'downloads': user_stats,
         'trend': trend_data,
         'summary': {
             'totalDownloads': total_downloads,
@@ -2819,58 +2706,6 @@ def download_analytics_api(request):
     }, json_dumps_params={'ensure_ascii': False})
 
 
-def parse_download_size(details):
-    """从日志详情中解析下载大小（MB）"""
-    try:
-        # 匹配单个下载的格式: "File Size: 0.03 MB"
-        size_match = re.search(r'File Size: ([\d.]+) MB', details)
-        if size_match:
-            return float(size_match.group(1))
-        # 匹配批量下载的格式: "Total Size: 24.54 MB"
-        total_size_match = re.search(r'Total Size: ([\d.]+) MB', details)
-        if total_size_match:
-            return float(total_size_match.group(1))
-    except Exception:
-        # 静默处理异常，提高性能
-        pass
-    return 0.0
-
-
-
-def parse_file_count(details):
-    """从日志详情中解析下载文件数量"""
-    try:
-        # 单个文件下载 - 检查Product ID: 或 Drawing No.: 或旧格式
-        if ('File Type:' in details and 'Product IDs:' not in details and 'Drawing Nos:' not in details) or 'Product ID:' in details or 'Drawing No.:' in details:
-            return 1
-        # 批量下载 - 检查Product IDs: 或 Drawing Nos:
-        elif 'Product IDs:' in details:
-            ids_match = re.search(r'Product IDs: ([\d,]+)', details)
-            if ids_match:
-                product_ids = [id.strip() for id in ids_match.group(1).split(',') if id.strip().isdigit()]
-                # 检查是否下载多种文件类型（both = pdf + step）
-                if 'File Type: both' in details:
-                    return len(product_ids) * 2
-                # 只下载一种文件类型
-                else:
-                    return len(product_ids)
-        elif 'Drawing Nos:' in details:
-            # Drawing Nos: 格式下使用逗号分隔的图号，不是数字ID，所以直接计算数量
-            nos_match = re.search(r'Drawing Nos: ([^,]+)', details)
-            if nos_match:
-                drawing_nos = [no.strip() for no in nos_match.group(1).split(',') if no.strip()]
-                # 检查是否下载多种文件类型（both = pdf + step）
-                if 'File Type: both' in details:
-                    return len(drawing_nos) * 2
-                # 只下载一种文件类型
-                else:
-                    return len(drawing_nos)
-    except Exception:
-        # 静默处理异常，提高性能
-        pass
-    return 0
-
-
 
 def ai_search_api(request):
     """AI智能搜索API接口"""
@@ -2920,6 +2755,162 @@ def ai_search_api(request):
             'error': f'服务器内部错误: {str(e)}'
         })
 
+@api_login_required
+@require_http_methods(["GET"])
+def search_facets_api(request):
+    """搜索表单分面统计API：根据当前已填写的条件返回各字段可选值的数量和数值范围"""
+    query_params = request.GET.copy()
+    # 统计控制参数，不参与过滤
+    numeric_param = query_params.pop('numeric_fields', [''])[-1]
+    buckets_param = query_params.pop('buckets', ['10'])[-1]
+
+    index = get_product_index()
+    if index is None:
+        return JsonResponse({'success': False, 'error': '搜索索引不可用'}, status=503)
+
+    numeric_fields = [field.strip() for field in numeric_param.split(',') if field.strip()] or list(RANGE_PARAMS)
+    invalid_fields = [field for field in numeric_fields if field not in index.numeric]
+    if invalid_fields:
+        return JsonResponse({'success': False, 'error': f'不支持的数值字段: {", ".join(invalid_fields)}'}, status=400)
+    try:
+        buckets = min(max(int(buckets_param), 1), 50)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'buckets 参数无效'}, status=400)
+
+    # 结果按规范化的条件和产品目录版本缓存
+    cache_params = query_params.copy()
+    cache_params['numeric_fields'] = ','.join(numeric_fields)
+    cache_params['buckets'] = str(buckets)
+    cache_key = search_cache_key(cache_params, version=index.version, prefix='search_facets')
+    result = cache.get(cache_key)
+    if result is None:
+        facets = index.facets(query_params, numeric_fields=numeric_fields, buckets=buckets)
+        if facets is None:
+            return JsonResponse({'success': False, 'error': '该查询条件不支持分面统计'}, status=400)
+        category_names = {pk: name for name, pk in index.category_ids.items()}
+        result = {
+            'success': True,
+            'total': facets['total'],
+            'categories': [
+                {'id': category_id, 'name': category_names.get(category_id, ''), 'count': count}
+                for category_id, count in sorted(facets['categories'].items())
+            ],
+            'fields': {
+                field: [{'value': value, 'count': count} for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+                for field, counts in facets['fields'].items()
+            },
+            'numeric': facets['numeric'],
+        }
+        cache.set(cache_key, result, timeout=get_search_cache_config()['timeout'])
+
+    return JsonResponse(result, json_dumps_params={'ensure_ascii': False})
+
+@api_login_required
+@require_http_methods(["GET"])
+def similar_products_api(request, product_id):
+    """相似焊枪API：按行程、加压力、重量、喉深、喉宽返回最接近的产品"""
+    product = Product.objects.filter(id=product_id).values('id', 'category_id', 'transformer').first()
+    if product is None:
+        return JsonResponse({'success': False, 'error': '产品不存在'}, status=404)
+    try:
+        k = min(max(int(request.GET.get('k', 10)), 1), 100)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'k 参数无效'}, status=400)
+
+    # category / transformer 传 same 表示与目标产品相同
+    category = request.GET.get('category', '')
+    if category == 'same':
+        category = product['category_id']
+    transformer = request.GET.get('transformer', '')
+    if transformer == 'same':
+        transformer = product['transformer']
+
+    similar = find_similar(product_id, k=k, category=category, transformer=transformer)
+    if similar is None:
+        return JsonResponse({'success': False, 'error': '搜索索引不可用'}, status=503)
+
+    fields = ('id', 'drawing_no_1', 'description', 'category__name', 'transformer') + SIMILARITY_FIELDS
+    rows = {row['id']: row for row in Product.objects.filter(id__in=[pk for pk, _ in similar]).values(*fields)}
+    results = [dict(rows[pk], distance=round(distance, 4)) for pk, distance in similar if pk in rows]
+    return JsonResponse({
+        'success': True,
+        'product_id': product_id,
+        'fields': list(SIMILARITY_FIELDS),
+        'results': results,
+    }, json_dumps_params={'ensure_ascii': False})
+
+@api_login_required
+@require_http_methods(["POST"])
+def batch_search_api(request):
+    """批量搜索API：一次请求执行多组与搜索页语义相同的过滤条件，返回紧凑的JSON结果。
+    请求体：{"queries": [{"transformer": "RT752", "stroke": "100~150"}, ...],
+            "fields": ["drawing_no_1", "stroke"], "limit": 50}"""
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': '请求数据格式错误'}, status=400)
+
+    queries = data.get('queries') if isinstance(data, dict) else None
+    max_queries = getattr(settings, 'BATCH_SEARCH_MAX_QUERIES', 500)
+    if not isinstance(queries, list) or not queries:
+        return JsonResponse({'success': False, 'error': 'queries 必须是非空数组'}, status=400)
+    if len(queries) > max_queries:
+        return JsonResponse({'success': False, 'error': f'单次最多 {max_queries} 组查询'}, status=400)
+
+    # 返回字段只允许 Product 的普通字段
+    allowed_fields = {field.attname for field in Product._meta.concrete_fields}
+    fields = data.get('fields') or []
+    if not isinstance(fields, list) or any(field not in allowed_fields for field in fields):
+        return JsonResponse({'success': False, 'error': f'fields 只能包含: {", ".join(sorted(allowed_fields))}'}, status=400)
+    try:
+        limit = min(max(int(data.get('limit', 50)), 1), getattr(settings, 'BATCH_SEARCH_MAX_LIMIT', 500))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'limit 参数无效'}, status=400)
+
+    # 所有查询共享同一个索引快照
+    index = get_product_index()
+    results = []
+    result_ids = set()
+    total_matches = 0
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict):
+            results.append({'index': position, 'error': '查询条件必须是对象'})
+            continue
+        query_params = {str(key): str(value) for key, value in query.items() if value is not None}
+        sort_by = query_params.get('sort_by') or 'drawing_no_1'
+        sort_dir = query_params.get('sort_dir', 'asc')
+        product_ids = index.search(query_params, sort_by, sort_dir) if index else None
+        if product_ids is None:
+            if sort_dir == 'desc':
+                order_by = (f'-{sort_by}', '-id')
+            else:
+                order_by = (sort_by, 'id')
+            try:
+                product_ids = list(Product.objects.filter(build_search_q(query_params)).order_by(*order_by).values_list('id', flat=True))
+            except (FieldError, ValueError) as e:
+                results.append({'index': position, 'error': f'查询条件无效: {str(e)}'})
+                continue
+        total_matches += len(product_ids)
+        ids = list(product_ids[:limit])
+        result_ids.update(ids)
+        results.append({'index': position, 'total': len(product_ids), 'ids': ids})
+
+    # 各查询命中的产品去重后一次取回所需字段
+    products = {}
+    if fields and result_ids:
+        result_ids = list(result_ids)
+        for start in range(0, len(result_ids), 500):
+            for row in Product.objects.filter(id__in=result_ids[start:start + 500]).values('id', *fields):
+                products[row.pop('id')] = row
+
+    # 整批只记录一条日志
+    log_action(request, 'batch_search', details=f'Queries: {len(queries)}, Total Matches: {total_matches}')
+
+    response = {'success': True, 'count': len(results), 'results': results}
+    if fields:
+        response['products'] = products
+    return JsonResponse(response, json_dumps_params={'ensure_ascii': False})
+
 @login_required
 @user_passes_test(is_staff_or_superuser)
 def analytics_view(request):
@@ -3057,160 +3048,43 @@ def user_feedback_en(request):
     return render(request, 'user_feedback_en.html', {'is_style_search': is_style_search})
 
 
+def build_download_history(user, unknown, limit=100):
+    """个人中心的下载记录：直接读取日志的结构化字段，产品ID批量换成图号"""
+    download_logs = list(
+        Log.objects.filter(user=user, action_type__in=Log.DOWNLOAD_ACTIONS)
+        .only('timestamp', 'action_type', 'details', 'file_type', 'size_bytes', 'product_ids')
+        .order_by('-timestamp')[:limit]
+    )
+    
+    # 一次查询取回所有涉及产品的图号
+    product_ids = {pid for log in download_logs for pid in log.get_product_ids()}
+    drawing_nos = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'drawing_no_1'))
+    
+    history = []
+    for log in download_logs:
+        names = [drawing_nos.get(pid) or str(pid) for pid in log.get_product_ids()]
+        history.append({
+            'timestamp': log.timestamp,
+            'action_type': log.action_type,
+            'details': log.details,
+            'product_id': ', '.join(names) or unknown,
+            'file_type': log.file_type.upper() if log.file_type else unknown,
+            'file_size': f'{log.size_mb:.2f} MB' if log.size_bytes is not None else unknown,
+        })
+    return history
+
+
 @login_required
 def profile(request):
     """个人中心页面"""
     # 获取用户的下载记录，最近100条
-    download_logs = Log.objects.filter(
-        user=request.user,
-        action_type__in=['download', 'batch_download', 'single_download']
-    ).order_by('-timestamp')[:100]
+    processed_download_logs = build_download_history(request.user, unknown='未知')
     
     # 获取用户访问过的仕样链接记录
     style_link_visits = UserStyleLinkVisit.objects.filter(
         user=request.user
     ).order_by('-last_visited_at')
     
-    # 预处理下载日志数据，先收集所有需要查询的产品ID
-    temp_logs = []
-    product_ids_to_query = []
-    
-    for log in download_logs:
-        log_data = {
-            'timestamp': log.timestamp,
-            'action_type': log.action_type,
-            'details': log.details
-        }
-        
-        # 解析日志详情
-        if 'Product IDs:' in log.details:
-            log_data['product_id'] = '多个产品'
-            log_data['file_type'] = '多个文件'
-            # 解析批量下载的文件大小
-            if 'Total Size:' in log.details:
-                details = log.details
-                total_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                total_size = total_size_part.split(':')[1].strip()
-            else:
-                total_size = '未知'
-            log_data['file_size'] = total_size
-        elif 'Drawing Nos:' in log.details:
-            # 解析批量下载的图号
-            details = log.details
-            
-            # 处理多行和逗号分隔的图号
-            if 'Drawing Nos:' in details:
-                # 找到Drawing Nos:开始的部分
-                drawing_nos_start = details.index('Drawing Nos:')
-                
-                # 查找结束位置 - 排除逗号，因为逗号可能在图号之间
-                # 查找可能的结束标记：File Type:、Total Size: 或 Async Task ID:
-                end_markers = ['File Type:', 'Total Size:', 'Async Task ID:']
-                end_positions = []
-                
-                for marker in end_markers:
-                    pos = details.find(marker, drawing_nos_start)
-                    if pos != -1:
-                        end_positions.append(pos)
-                
-                if end_positions:
-                    # 使用最接近的结束标记
-                    end_pos = min(end_positions)
-                    drawing_nos_part = details[drawing_nos_start:end_pos]
-                else:
-                    # 如果没有找到结束标记，取整个剩余部分
-                    drawing_nos_part = details[drawing_nos_start:]
-                
-                # 提取图号部分并清理
-                drawing_nos_content = drawing_nos_part.split(':', 1)[1].strip()
-                # 先将逗号替换为空格，再将任意空白字符序列替换为单个逗号+空格，避免双重逗号
-                drawing_nos_content = drawing_nos_content.replace(',', ' ')
-                drawing_nos = re.sub(r'\s+', ', ', drawing_nos_content).strip()
-                # 移除结尾可能存在的逗号
-                if drawing_nos.endswith(','):
-                    drawing_nos = drawing_nos[:-1]
-                drawing_nos = drawing_nos.strip()
-                log_data['product_id'] = drawing_nos
-            
-            # 解析文件类型
-            if 'File Type:' in details:
-                file_type_part = [part for part in details.split(',') if 'File Type:' in part][0]
-                file_type = file_type_part.split(':')[1].strip().upper()
-                log_data['file_type'] = file_type
-            else:
-                log_data['file_type'] = '未知'
-            
-            # 解析批量下载的文件大小
-            if 'Total Size:' in log.details:
-                total_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                total_size = total_size_part.split(':')[1].strip()
-            else:
-                total_size = '未知'
-            log_data['file_size'] = total_size
-        elif 'File Type:' in log.details:
-            # 解析单个下载记录
-            details = log.details
-            
-            # 提取产品ID或图号
-            if 'Product ID:' in details:
-                product_id_part = details.split(',')[0]
-                product_id = product_id_part.split(':')[1].strip()
-                if product_id != '未知':
-                    product_ids_to_query.append(product_id)
-            elif 'Drawing No.:' in details:
-                # 图号格式已直接包含在日志中，不需要查询
-                drawing_no_part = details.split(',')[0]
-                drawing_no = drawing_no_part.split(':')[1].strip()
-                product_id = drawing_no  # 直接使用图号作为product_id
-            else:
-                product_id = '未知'
-            log_data['product_id'] = product_id
-            
-            # 提取文件类型
-            if 'File Type:' in details:
-                file_type_part = [part for part in details.split(',') if 'File Type:' in part][0]
-                file_type = file_type_part.split(':')[1].strip().upper()
-            else:
-                file_type = '未知'
-            log_data['file_type'] = file_type
-            
-            # 提取文件大小，支持Total Size: 格式
-            if 'Total Size:' in details:
-                file_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                file_size = file_size_part.split(':')[1].strip()
-            else:
-                file_size = '未知'
-            log_data['file_size'] = file_size
-        else:
-            log_data['product_id'] = '未知'
-            log_data['file_type'] = '未知'
-            log_data['file_size'] = '未知'
-        
-        temp_logs.append(log_data)
-    
-    # 批量查询产品图号
-    product_id_to_drawing_no = {}
-    if product_ids_to_query:
-        # 转换为整数列表，排除非数字ID
-        valid_product_ids = []
-        for pid in product_ids_to_query:
-            if pid.isdigit():
-                valid_product_ids.append(int(pid))
-        
-        # 查询所有产品
-        products = Product.objects.filter(id__in=valid_product_ids)
-        # 创建产品ID到图号的映射
-        for product in products:
-            product_id_to_drawing_no[str(product.id)] = product.drawing_no_1 or str(product.id)
-    
-    # 替换产品ID为图号
-    processed_download_logs = []
-    for log_data in temp_logs:
-        pid = log_data['product_id']
-        if pid.isdigit() and pid in product_id_to_drawing_no:
-            log_data['product_id'] = product_id_to_drawing_no[pid]
-        processed_download_logs.append(log_data)
-    
     # 获取用户的反馈记录，最近100条
     user_feedbacks = UserFeedback.objects.filter(
         user=request.user
@@ -3244,156 +3118,13 @@ def profile(request):
 def profile_en(request):
     """个人中心页面（英文）"""
     # 获取用户的下载记录，最近100条
-    download_logs = Log.objects.filter(
-        user=request.user,
-        action_type__in=['download', 'batch_download', 'single_download']
-    ).order_by('-timestamp')[:100]
+    processed_download_logs = build_download_history(request.user, unknown='Unknown')
     
     # 获取用户访问过的仕样链接记录
     style_link_visits = UserStyleLinkVisit.objects.filter(
         user=request.user
     ).order_by('-last_visited_at')
     
-    # 预处理下载日志数据，先收集所有需要查询的产品ID
-    temp_logs = []
-    product_ids_to_query = []
-    
-    for log in download_logs:
-        log_data = {
-            'timestamp': log.timestamp,
-            'action_type': log.action_type,
-            'details': log.details
-        }
-        
-        # 解析日志详情
-        if 'Product IDs:' in log.details:
-            log_data['product_id'] = 'Multiple Products'
-            log_data['file_type'] = 'Multiple Files'
-            # 解析批量下载的文件大小
-            if 'Total Size:' in log.details:
-                details = log.details
-                total_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                total_size = total_size_part.split(':')[1].strip()
-            else:
-                total_size = 'Unknown'
-            log_data['file_size'] = total_size
-        elif 'Drawing Nos:' in log.details:
-            # 解析批量下载的图号
-            details = log.details
-            
-            # 处理多行和逗号分隔的图号
-            if 'Drawing Nos:' in details:
-                # 找到Drawing Nos:开始的部分
-                drawing_nos_start = details.index('Drawing Nos:')
-                
-                # 查找结束位置 - 排除逗号，因为逗号可能在图号之间
-                # 查找可能的结束标记：File Type:、Total Size: 或 Async Task ID:
-                end_markers = ['File Type:', 'Total Size:', 'Async Task ID:']
-                end_positions = []
-                
-                for marker in end_markers:
-                    pos = details.find(marker, drawing_nos_start)
-                    if pos != -1:
-                        end_positions.append(pos)
-                
-                if end_positions:
-                    # 使用最接近的结束标记
-                    end_pos = min(end_positions)
-                    drawing_nos_part = details[drawing_nos_start:end_pos]
-                else:
-                    # 如果没有找到结束标记，取整个剩余部分
-                    drawing_nos_part = details[drawing_nos_start:]
-                
-                # 提取图号部分并清理
-                drawing_nos_content = drawing_nos_part.split(':', 1)[1].strip()
-                # 先将逗号替换为空格，再将任意空白字符序列替换为单个逗号+空格，避免双重逗号
-                drawing_nos_content = drawing_nos_content.replace(',', ' ')
-                drawing_nos = re.sub(r'\s+', ', ', drawing_nos_content).strip()
-                # 移除结尾可能存在的逗号
-                if drawing_nos.endswith(','):
-                    drawing_nos = drawing_nos[:-1]
-                drawing_nos = drawing_nos.strip()
-                log_data['product_id'] = drawing_nos
-            
-            # 解析文件类型
-            if 'File Type:' in details:
-                file_type_part = [part for part in details.split(',') if 'File Type:' in part][0]
-                file_type = file_type_part.split(':')[1].strip().upper()
-                log_data['file_type'] = file_type
-            else:
-                log_data['file_type'] = 'Unknown'
-            
-            # 解析批量下载的文件大小
-            if 'Total Size:' in log.details:
-                total_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                total_size = total_size_part.split(':')[1].strip()
-            else:
-                total_size = 'Unknown'
-            log_data['file_size'] = total_size
-        elif 'File Type:' in log.details:
-            # 解析单个下载记录
-            details = log.details
-            
-            # 提取产品ID或图号
-            if 'Product ID:' in details:
-                product_id_part = details.split(',')[0]
-                product_id = product_id_part.split(':')[1].strip()
-                if product_id != 'Unknown':
-                    product_ids_to_query.append(product_id)
-            elif 'Drawing No.:' in details:
-                # 图号格式已直接包含在日志中，不需要查询
-                drawing_no_part = details.split(',')[0]
-                drawing_no = drawing_no_part.split(':')[1].strip()
-                product_id = drawing_no  # 直接使用图号作为product_id
-            else:
-                product_id = 'Unknown'
-            log_data['product_id'] = product_id
-            
-            # 提取文件类型
-            if 'File Type:' in details:
-                file_type_part = [part for part in details.split(',') if 'File Type:' in part][0]
-                file_type = file_type_part.split(':')[1].strip().upper()
-            else:
-                file_type = 'Unknown'
-            log_data['file_type'] = file_type
-            
-            # 提取文件大小，支持Total Size: 格式
-            if 'Total Size:' in details:
-                file_size_part = [part for part in details.split(',') if 'Total Size:' in part][0]
-                file_size = file_size_part.split(':')[1].strip()
-            else:
-                file_size = 'Unknown'
-            log_data['file_size'] = file_size
-        else:
-            log_data['product_id'] = 'Unknown'
-            log_data['file_type'] = 'Unknown'
-            log_data['file_size'] = 'Unknown'
-        
-        temp_logs.append(log_data)
-    
-    # 批量查询产品图号
-    product_id_to_drawing_no = {}
-    if product_ids_to_query:
-        # 转换为整数列表，排除非数字ID
-        valid_product_ids = []
-        for pid in product_ids_to_query:
-            if pid.isdigit():
-                valid_product_ids.append(int(pid))
-        
-        # 查询所有产品
-        products = Product.objects.filter(id__in=valid_product_ids)
-        # 创建产品ID到图号的映射
-        for product in products:
-            product_id_to_drawing_no[str(product.id)] = product.drawing_no_1 or str(product.id)
-    
-    # 替换产品ID为图号
-    processed_download_logs = []
-    for log_data in temp_logs:
-        pid = log_data['product_id']
-        if pid.isdigit() and pid in product_id_to_drawing_no:
-            log_data['product_id'] = product_id_to_drawing_no[pid]
-        processed_download_logs.append(log_data)
-    
     # 获取用户的反馈记录，最近100条
     user_feedbacks = UserFeedback.objects.filter(
         user=request.user
@@ -3487,13 +3218,7 @@ def export_user_feedback(request):
         feedback_list = feedback_list.filter(status=status_filter)
     
     # 记录导出日志
-    Log.objects.create(
-        user=request.user,
-        action_type='export_data',
-        details=f'导出用户反馈数据（状态筛选: {status_filter if status_filter else "全部"}）',
-        ip_address=request.META.get('REMOTE_ADDR'),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    log_action(request, 'export_data', details=f'导出用户反馈数据（状态筛选: {status_filter if status_filter else "全部"}）')
     
     # 创建CSV响应
     response = HttpResponse(content_type='text/csv')
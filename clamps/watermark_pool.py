@@ -0,0 +1,222 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+PDF 水印进程池
+批量下载和异步压缩需要为多个 PDF 加水印，解析和合并页面是纯 CPU 工作，受 GIL 限制只能用到一个核。
+这里用一个进程内共享、容量固定的进程池并行处理：调用方提交 (标识, 源文件, 水印文本)，
+按完成顺序取回加水印后的字节。同时在途的任务数不超过进程数，内存占用有上限；
+所有请求合计提交到进程池的任务数不超过进程数，任务提交即开始执行；每个任务的超时时间从开始执行时计算，
+超时的任务报告失败，但仍在后台执行完毕，结果丢弃，不影响其他请求的任务。
+进程池只在损坏时，或全部工作进程都被超时的任务占用时才重建。
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .pdf_utils import PDFProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    """获取水印进程池配置"""
+    config = {
+        'workers': min(4, os.cpu_count() or 1),
+        'timeout': 120,
+    }
+    config.update(getattr(settings, 'WATERMARK_POOL', {}))
+    return config
+
+
+def _watermark_job(source_path, watermark_text, mode):
+    # 在工作进程中执行，只依赖 pdf_utils，不需要初始化 Django
+    return PDFProcessor.watermark_bytes(source_path, watermark_text, mode)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# 进程池的执行名额（等于进程数），所有请求共用
+_slots = None
+# 已超时但仍在工作进程中执行的任务 -> 所属进程池
+_abandoned = {}
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 使用 spawn 启动工作进程：服务进程是多线程的，fork 可能复制到被其他线程持有的锁
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _get_slots(workers):
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(workers)
+        return _slots
+
+
+def _discard_executor(executor):
+    """丢弃进程池（进程池损坏或全部工作进程卡住时），终止其中仍在运行的工作进程"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+        for future in [future for future, owner in _abandoned.items() if owner is executor]:
+            del _abandoned[future]
+    # 正在运行的任务无法单独取消，只能终止工作进程
+    for process in list((getattr(executor, '_processes', None) or {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _abandon(executor, future, workers):
+    """放弃超时的任务：任务在工作进程中继续执行，完成后结果丢弃；
+    全部工作进程都被超时的任务占用时，进程池已无法处理新任务，丢弃并重建"""
+    if future.cancel():
+        return
+    with _executor_lock:
+        _abandoned[future] = executor
+        stuck = sum(1 for other, owner in _abandoned.items() if owner is executor and other.running())
+    future.add_done_callback(_release)
+    if stuck >= workers:
+        logger.warning(f"水印进程池的 {stuck} 个工作进程均被超时任务占用，重建进程池")
+        _discard_executor(executor)
+
+
+def _release(future):
+    with _executor_lock:
+        _abandoned.pop(future, None)
+
+
+def watermark_many(jobs, workers=None, timeout=None):
+    """并行为多个 PDF 加水印。
+    jobs: 可迭代的 (标识, 源文件路径, 水印文本)；
+    按完成顺序生成 (标识, PDF字节, 异常)，成功时异常为 None，失败或超时时PDF字节为 None。"""
+    config = get_config()
+    workers = workers or config['workers']
+    timeout = timeout or config['timeout']
+    mode = getattr(settings, 'PDF_WATERMARK_MODE', PDFProcessor.DEFAULT_WATERMARK_MODE)
+
+    if workers <= 1:
+        # 未启用并行时在当前进程逐个处理
+        for key, source_path, watermark_text in jobs:
+            try:
+                yield key, _watermark_job(source_path, watermark_text, mode), None
+            except Exception as e:
+                yield key, None, e
+        return
+
+    jobs = iter(jobs)
+    executor = _get_executor(workers)
+    slots = _get_slots(workers)
+    # future -> (标识, 源文件, 水印文本, 截止时间)
+    pending = {}
+    exhausted = False
+
+    def release_slot(future):
+        slots.release()
+
+    def start(source_path, watermark_text):
+        """提交任务（调用前已占用一个执行名额），任务结束时归还名额"""
+        nonlocal executor
+        try:
+            try:
+                future = executor.submit(_watermark_job, source_path, watermark_text, mode)
+            except (BrokenProcessPool, RuntimeError):
+                # 进程池已损坏或被其他请求丢弃，换一个新的
+                _discard_executor(executor)
+                executor = _get_executor(workers)
+                future = executor.submit(_watermark_job, source_path, watermark_text, mode)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(release_slot)
+        return future
+
+    def fill():
+        # 所有请求合计提交到进程池的任务数不超过进程数，任务提交后立即开始执行，超时从提交时计算，
+        # 不包括在其他请求的任务之后排队的时间；本请求的在途任务数也不超过进程数
+        nonlocal exhausted
+        while not exhausted and len(pending) < workers:
+            # 有在途任务时不等待名额，先取走在途任务的结果；没有时等待其他请求的任务结束
+            if not slots.acquire(blocking=not pending):
+                break
+            job = next(jobs, None)
+            if job is None:
+                slots.release()
+                exhausted = True
+                break
+            key, source_path, watermark_text = job
+            future = start(source_path, watermark_text)
+            pending[future] = (key, source_path, watermark_text, time.monotonic() + timeout)
+
+    try:
+        fill()
+        while pending:
+            wait_timeout = max(0.0, min(item[3] for item in pending.values()) - time.monotonic())
+            done, _ = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                now = time.monotonic()
+                expired = [future for future, item in pending.items() if item[3] <= now]
+                if not expired:
+                    continue
+                # 超时的任务报告失败，不终止进程池：进程池由所有请求共享，其他任务照常执行
+                for future in expired:
+                    key = pending.pop(future)[0]
+                    _abandon(executor, future, workers)
+                    logger.warning(f"水印任务超时（{timeout} 秒）: {key}")
+                    yield key, None, TimeoutError(f'水印处理超过 {timeout} 秒')
+                fill()
+                continue
+
+            for future in done:
+                key, source_path, watermark_text, _ = pending.pop(future)
+                try:
+                    yield key, future.result(), None
+                except (BrokenProcessPool, CancelledError):
+                    # 工作进程异常退出，或进程池因卡住被重建，在新的进程池中重试一次该任务
+                    _discard_executor(executor)
+                    executor = _get_executor(workers)
+                    slots.acquire()
+                    retry = start(source_path, watermark_text)
+                    try:
+                        yield key, retry.result(timeout=timeout), None
+                    except FuturesTimeoutError:
+                        _abandon(executor, retry, workers)
+                        yield key, None, TimeoutError(f'水印处理超过 {timeout} 秒')
+                    except Exception as e:
+                        yield key, None, e
+                except Exception as e:
+                    yield key, None, e
+            fill()
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时，取消尚未开始的任务
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,115 @@
+# Copyright [2025] [OBARA (Nanjing) Electromechanical Co., Ltd]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+流式 ZIP 生成
+边压缩边输出：每个条目依次产生本地文件头、deflate 压缩块和数据描述符，最后输出中央目录，
+内存占用只有一个读取块的大小，首字节在第一个文件开始压缩时即可发出。
+底层使用 zipfile 写入不可 seek 的输出流（自动启用数据描述符），超过 4GB 的文件或
+超过 65535 个条目时自动使用 ZIP64 扩展。来源文件在打开时不存在或无法读取（如媒体文件索引
+过期，文件已被删除或改名）时跳过该条目，已发出的数据不受影响。配合 StreamingHttpResponse 使用：
+
+    StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+"""
+
+import logging
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# 每次读取源文件的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamSink:
+    """只追加、不可 seek 的输出流，zipfile 写入的数据暂存在这里等待生成器取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """取走目前已写入的全部数据"""
+        if not self._chunks:
+            return b''
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_info(arcname, source):
+    """为条目生成 ZipInfo：文件取其修改时间和权限，字节数据取当前时间"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        info.file_size = len(source)
+    else:
+        # 修改时间早于 1980 年（旧 NAS 上的图纸常见）时按 1980-01-01 记录，不报错
+        info = zipfile.ZipInfo.from_file(source, arcname, strict_timestamps=False)
+    return info
+
+
+def _read_chunks(source, chunk_size):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+    with source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED, compresslevel=None, chunk_size=CHUNK_SIZE):
+    """流式生成 ZIP 数据。
+    entries: 可迭代的 (压缩包内文件名, 来源)，来源为文件路径或 bytes；
+    条目按需读取，生成器在取下一个条目前已处理完上一个，调用方可在 yield 之后清理临时文件。"""
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression, compresslevel=compresslevel, allowZip64=True) as zf:
+        for arcname, source in entries:
+            try:
+                info = _zip_info(arcname, source)
+                if not isinstance(source, (bytes, bytearray, memoryview)):
+                    # 写入本地文件头之前打开文件，文件不存在时跳过条目，不会留下不完整的条目
+                    source = open(source, 'rb')
+            except (OSError, ValueError) as e:
+                logger.warning(f'压缩包条目 {arcname} 的文件无法读取，已跳过: {e}')
+                continue
+            info.compress_type = compression
+            # 大小已知，超过阈值时写入 ZIP64 本地头
+            force_zip64 = info.file_size > zipfile.ZIP64_LIMIT
+            with zf.open(info, 'w', force_zip64=force_zip64) as dest:
+                for chunk in _read_chunks(source, chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # 中央目录（和 ZIP64 结束记录）在关闭时写出
+    data = sink.drain()
+    if data:
+        yield data
+
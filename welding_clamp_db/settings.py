@@ -181,10 +181,12 @@ RATE_LIMIT = {
 }
 
 # 缓存配置
+# 多进程部署时请使用共享后端（如 FileBasedCache、DatabaseCache 或 Redis），
+# 使搜索缓存和产品目录版本号在各工作进程间共享
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'unique-snowflake'),
     }
 }
 
@@ -205,6 +207,83 @@ SEARCH_RATE_LIMIT = {
     'window': 60,    # 时间窗口（秒）
 }
 
+# 搜索结果缓存时间（秒），产品数据变化时通过目录版本号立即失效
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', '86400'))
+
+# 操作日志列表：前N页使用页码分页，更深的页面使用游标分页；统计数量缓存时间（秒）
+LOG_PAGINATOR_PAGES = 10
+LOG_COUNT_CACHE_TIMEOUT = 60
+
+# 批量搜索API：单次请求最多查询组数，每组最多返回的产品数
+BATCH_SEARCH_MAX_QUERIES = 500
+BATCH_SEARCH_MAX_LIMIT = 500
+
+# 产品搜索内存索引配置
+PRODUCT_SEARCH_INDEX = {
+    'enabled': os.getenv('PRODUCT_SEARCH_INDEX_ENABLED', 'True').lower() in ('true', '1', 'yes'),
+    'ttl': int(os.getenv('PRODUCT_SEARCH_INDEX_TTL', '600')),  # 索引最长复用时间（秒），多进程部署时兜底刷新
+}
+
+# PDF加水印方式：rewrite（默认）重写整个文档；incremental 以增量更新方式追加水印，速度更快，
+# 但原文件原样保留在输出文件开头，截断文件或查看历史版本即可得到不带水印的原文件，仅在明确接受时启用。
+# 增量更新不适用的文件（如加密文档）自动改为重写
+PDF_WATERMARK_MODE = os.getenv('PDF_WATERMARK_MODE', 'rewrite')
+
+# PDF水印进程池配置（批量下载和异步压缩并行加水印）
+WATERMARK_POOL = {
+    'workers': int(os.getenv('WATERMARK_POOL_WORKERS', str(min(4, os.cpu_count() or 1)))),  # 工作进程数，1 表示不启用并行
+    'timeout': int(os.getenv('WATERMARK_POOL_TIMEOUT', '120')),  # 单个文件的处理超时（秒）
+}
+
+# 压缩任务调度器配置（异步压缩任务排队执行，小任务优先）
+COMPRESSION_SCHEDULER = {
+    'workers': int(os.getenv('COMPRESSION_WORKERS', '2')),  # 同时执行的压缩任务数
+    'per_user': int(os.getenv('COMPRESSION_PER_USER', '1')),  # 每个用户同时执行的压缩任务数
+    'max_wait': int(os.getenv('COMPRESSION_MAX_WAIT', '300')),  # 等待超过该秒数的任务按提交顺序优先执行
+    'heartbeat_interval': int(os.getenv('COMPRESSION_HEARTBEAT_INTERVAL', '30')),  # 执行中任务的心跳间隔（秒）
+    'stale_after': int(os.getenv('COMPRESSION_STALE_AFTER', '120')),  # 心跳超过该秒数未更新的任务重新排队
+}
+
+# 压缩任务进度上报配置（进度每次变化写入缓存，写数据库和推送按时间和步长节流）
+COMPRESSION_PROGRESS = {
+    'min_interval': float(os.getenv('COMPRESSION_PROGRESS_INTERVAL', '1')),  # 两次写数据库的最短间隔（秒）
+    'min_step': int(os.getenv('COMPRESSION_PROGRESS_STEP', '5')),  # 两次写数据库的最小进度增量（百分点）
+}
+
+# 压缩包缓存配置（相同产品、文件类型、源文件和水印身份的压缩包直接复用）
+ARCHIVE_CACHE = {
+    'enabled': os.getenv('ARCHIVE_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes'),
+    'max_bytes': int(float(os.getenv('ARCHIVE_CACHE_MAX_MB', '2048')) * 1024 * 1024),  # 缓存总大小上限，超出时淘汰最久未使用的压缩包
+    'directory': os.path.join(BASE_DIR, 'temp', 'archive_cache'),
+}
+
+# 压缩文件保留配置（temp/compressed_files 按磁盘预算和最近访问时间定时清理）
+ARCHIVE_RETENTION = {
+    'max_bytes': int(float(os.getenv('ARCHIVE_RETENTION_MAX_MB', '5120')) * 1024 * 1024),  # 压缩文件总大小预算
+    'min_ttl': int(os.getenv('ARCHIVE_RETENTION_MIN_TTL', '3600')),  # 最近访问不足该秒数的文件不清理
+    'max_age': int(os.getenv('ARCHIVE_RETENTION_MAX_AGE', str(7 * 24 * 3600))),  # 超过该秒数未访问的文件直接清理，0 表示不限
+    'interval': int(os.getenv('ARCHIVE_RETENTION_INTERVAL', '300')),  # 清理间隔（秒）
+}
+
+# 媒体文件元数据索引配置（文件同步时写入，下载和文件大小检查优先读取）
+MEDIA_INDEX = {
+    'content_hash': os.getenv('MEDIA_INDEX_CONTENT_HASH', 'True').lower() in ('true', '1', 'yes'),  # 新增或变化的文件计算 SHA-256
+}
+
+# 媒体目录并发扫描配置（文件同步）
+MEDIA_SCANNER = {
+    'workers': int(os.getenv('MEDIA_SCANNER_WORKERS', '8')),  # 扫描线程数，网络共享延迟越高可以设置得越大
+}
+
+# 操作日志缓冲写入配置
+LOG_BUFFER = {
+    'enabled': os.getenv('LOG_BUFFER_ENABLED', 'True').lower() in ('true', '1', 'yes'),
+    'batch_size': int(os.getenv('LOG_BUFFER_BATCH_SIZE', '200')),  # 达到该条数立即写入
+    'flush_interval': float(os.getenv('LOG_BUFFER_FLUSH_INTERVAL', '2')),  # 最长缓冲时间（秒），不超过10秒
+    'max_queue': int(os.getenv('LOG_BUFFER_MAX_QUEUE', '10000')),  # 队列上限，超出时写入回退文件
+    'fallback_file': os.path.join(BASE_DIR, 'logs', 'pending_logs.jsonl'),  # 数据库繁忙时的回退文件
+}
+
 # 日志配置
 LOGGING = {
     'version': 1,